@@ -1,87 +1,175 @@
 import os
-from google.cloud import videointelligence_v1 as videointelligence
-import google.generativeai as genai
+import uuid
+import unicodedata
+
+from app_modules import metrics
+from app_modules.api_cache import ResponseCache
+from app_modules.prompt_builder import build_analysis_prompt
+
+# Gemini の応答を保存するキャッシュファイルと、キーワード生成結果の有効期限（秒）
+GEMINI_CACHE_DB = os.getenv('GEMINI_CACHE_DB', 'gemini_cache.sqlite3')
+KEYWORD_CACHE_TTL = int(os.getenv('GEMINI_KEYWORD_CACHE_TTL', str(24 * 60 * 60)))
+# True の場合のみ、指標による分析レポートに加えて AI モデルでデータ分析を行う
+GEMINI_ANALYSIS_ENABLED = os.getenv('GEMINI_ANALYSIS_ENABLED', '').lower() in ('1', 'true', 'on')
+
+# この大きさを超える動画は、メモリに読み込まずに Cloud Storage 経由で分析する
+VIDEO_INLINE_MAX_BYTES = int(os.getenv('VIDEO_INLINE_MAX_BYTES', str(20 * 1024 * 1024)))
+# 大きな動画をアップロードする Cloud Storage バケット（未設定の場合はそのまま送信する）
+VIDEO_STAGING_BUCKET = os.getenv('VIDEO_STAGING_BUCKET')
+# Cloud Storage へのアップロードを分割する単位（256KBの倍数である必要がある）
+STAGING_CHUNK_SIZE = 8 * 1024 * 1024
 
 class GeminiAPI:
-    def __init__(self):
+    def __init__(self, cache=None):
+        # インポートに時間がかかるため、クライアントを作成するときにインポートする
+        import google.generativeai as genai
+
         # 環境変数からAPIキーを取得
         genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
         self.model = genai.GenerativeModel('gemini-2.5-pro')
+        # 同じジャンルのキーワード生成結果を一定時間再利用するためのキャッシュ
+        self.cache = cache if cache is not None else ResponseCache(
+            db_path=GEMINI_CACHE_DB,
+            ttls={'gemini.keywords': KEYWORD_CACHE_TTL}
+        )
+
+    @staticmethod
+    def _normalize_genre(genre):
+        """全角・半角や大文字・小文字、空白の違いを吸収したジャンル名を返す"""
+        return ' '.join(unicodedata.normalize('NFKC', genre).lower().split())
 
     def generate_keywords(self, genre):
         """
         AIモデルにジャンルに関連する検索キーワードを生成させる。
+        同じジャンルの結果は KEYWORD_CACHE_TTL 秒の間キャッシュから返す。
         """
+        cache_params = {'genre': self._normalize_genre(genre)}
+        keywords = self.cache.get('gemini.keywords', cache_params)
+        if keywords:
+            return keywords
+
         prompt = f"「{genre}」というジャンルに関連する、YouTubeで人気のある動画を検索するためのキーワードを5つ、カンマ区切りで生成してください。回答はキーワードのみにしてください。不必要な前置きや説明は含めないでください。"
         
         try:
-            response = self.model.generate_content(prompt)
+            metrics.increment('gemini_api_calls_total', operation='generate_keywords')
+            with metrics.span('gemini_api', operation='generate_keywords'):
+                response = self.model.generate_content(prompt)
             keywords_text = response.text.strip()
-            # AIの応答をカンマで分割してリストに変換
-            return [k.strip() for k in keywords_text.split(',')]
+            # AIの応答をカンマで分割してリストに変換（空のキーワードは除く）
+            keywords = [k.strip() for k in keywords_text.split(',') if k.strip()]
         except Exception as e:
             print(f"AIキーワード生成中にエラーが発生しました: {e}")
             return []
+
+        # 空の応答をキャッシュすると、期限が切れるまで同じジャンルで検索できなくなるため保存しない
+        if keywords:
+            self.cache.set('gemini.keywords', cache_params, keywords)
+        return keywords
         
     def analyze_video_data(self, df):
-        # """
-        # DataFrameの統計情報をAIモデルで分析する。
-        # """
-        # # DataFrameの統計情報を要約する
-        # stats = df.describe(include='all').to_markdown()
-        # # DataFrameをMarkdown形式の文字列に変換
-        # df_markdown = df.to_markdown(index=False)
-        
-        # # DataFrameの先頭5行と末尾5行を文字列に変換してプロンプトに含める
-        # df_head = df.head().to_markdown(index=False)
-        # df_tail = df.tail().to_markdown(index=False)
-        
-        # prompt = f"""
-        #     以下のYouTube動画のデータ分析を依頼します。
-        #     ---
-        #     データ:
-        #     {df_markdown}
-        #     ---
-        #     このデータから読み取れる傾向や特徴、動画の成功要因、視聴者の関心事など、多角的な分析結果を日本語で簡潔に、Markdown形式でまとめてください。特に、再生回数、高評価数、コメント数の関係性や、動画タイプ（Short/Long）の傾向について言及してください。
-        #     """
-        
-        # try:
-        #     response = self.model.generate_content(prompt)
-        #     analysis_text = response.text.strip()
-        #     return analysis_text
-        # except Exception as e:
-        #     print(f"AIデータ分析中にエラーが発生しました: {e}")
-        #     return "分析結果の生成中にエラーが発生しました。"
-        print("開発モード: AIによるデータ分析はスキップされました。")
-        return "これは開発モードで生成されたモックの分析結果です。AIを利用するには、有料プランにアップグレードするか、日次クォータのリセットをお待ちください。"
+        """
+        DataFrameの統計情報をAIモデルで分析する。
+        プロンプトにはDataFrame全体ではなく、トークン数の上限内に収めた要約を含める。
+        GEMINI_ANALYSIS_ENABLED が無効な場合は None を返す（指標による分析は analytics.build_report が行う）。
+        """
+        if not GEMINI_ANALYSIS_ENABLED:
+            print("AIによるデータ分析は無効のため、スキップしました。")
+            return None
+
+        prompt = build_analysis_prompt(df)
+
+        try:
+            metrics.increment('gemini_api_calls_total', operation='analyze_video_data')
+            with metrics.span('gemini_api', operation='analyze_video_data'):
+                response = self.model.generate_content(prompt)
+            analysis_text = response.text.strip()
+            return analysis_text
+        except Exception as e:
+            print(f"AIデータ分析中にエラーが発生しました: {e}")
+            return "分析結果の生成中にエラーが発生しました。"
 
 class VideoAnalysisClient:
     def __init__(self):
         # 環境変数 GOOGLE_APPLICATION_CREDENTIALS が設定されていれば、自動的に認証される
         pass
 
-    def analyze_uploaded_video(self, video_path):
+    def analyze_uploaded_video(self, video_path, content_hash=None):
         """
         アップロードされたローカルの動画ファイルを分析し、詳細なメタデータを返します。
+        大きなファイルは Cloud Storage にアップロードしてから分析し、メモリには読み込みません。
+        """
+        operation, cleanup = self.submit_annotation(video_path, content_hash)
+        try:
+            print("\n動画分析処理が完了するまでお待ちください...")
+            with metrics.span('video_annotation', phase='wait'):
+                result = operation.result(timeout=300)
+            print("\n分析が完了しました。")
+        finally:
+            cleanup()
+
+        return self.parse_annotation_result(result)
+
+    @metrics.timed('video_annotation', phase='submit')
+    def submit_annotation(self, video_path, content_hash=None):
+        """
+        動画の分析リクエストを送信し、完了を待たずに (長時間実行オペレーション, 後片付け用の関数) を返します。
+        後片付け用の関数は、分析の完了後に Cloud Storage に置いた動画を削除するために呼び出します。
+        送信後はローカルの動画ファイルを削除して構いません。
         """
+        # インポートに時間がかかるため、動画を分析するときにインポートする
+        from google.cloud import videointelligence_v1 as videointelligence
+
         client = videointelligence.VideoIntelligenceServiceClient()
-        
-        with open(video_path, "rb") as movie:
-            input_content = movie.read()
-        
+
         features = [
             videointelligence.Feature.LABEL_DETECTION,
             videointelligence.Feature.SHOT_CHANGE_DETECTION
         ]
-        
-        operation = client.annotate_video(
-            request={"features": features, "input_content": input_content}
-        )
-        
-        print("\n動画分析処理が完了するまでお待ちください...")
-        result = operation.result(timeout=300)
-        print("\n分析が完了しました。")
-        
+        request = {"features": features}
+
+        staged_blob = None
+        if os.path.getsize(video_path) > VIDEO_INLINE_MAX_BYTES and VIDEO_STAGING_BUCKET:
+            staged_blob = self._stage_to_storage(video_path, content_hash)
+            request["input_uri"] = f"gs://{VIDEO_STAGING_BUCKET}/{staged_blob.name}"
+        else:
+            if os.path.getsize(video_path) > VIDEO_INLINE_MAX_BYTES:
+                print("警告: VIDEO_STAGING_BUCKET が未設定のため、大きな動画をメモリに読み込んで送信します。")
+            with open(video_path, "rb") as movie:
+                request["input_content"] = movie.read()
+
+        def cleanup():
+            if staged_blob is not None:
+                staged_blob.delete()
+
+        try:
+            operation = client.annotate_video(request=request)
+        except Exception:
+            cleanup()
+            raise
+        return operation, cleanup
+
+    def _stage_to_storage(self, video_path, content_hash=None):
+        """
+        動画ファイルを Cloud Storage に分割アップロードし、その Blob を返します。
+        """
+        # Cloud Storage を使う場合にだけ必要になるため、ここでインポートする
+        from google.cloud import storage
+
+        bucket = storage.Client().bucket(VIDEO_STAGING_BUCKET)
+        # 別のプロセスが同じ内容の動画を同時に送信しても、一方の後片付けで他方の動画を消さないよう名前は毎回変える
+        blob_name = f"uploads/{content_hash or os.path.basename(video_path)}-{uuid.uuid4().hex}"
+        # chunk_size を指定すると、ファイルを分割して再開可能アップロードで送信する
+        blob = bucket.blob(blob_name, chunk_size=STAGING_CHUNK_SIZE)
+        blob.upload_from_filename(video_path)
+        print(f"動画を Cloud Storage にアップロードしました: gs://{VIDEO_STAGING_BUCKET}/{blob_name}")
+        return blob
+
+    @staticmethod
+    @metrics.timed('video_annotation', phase='parse')
+    def parse_annotation_result(result):
+        """
+        annotate_video の結果からラベルとショットの情報を取り出します。
+        """
         analysis_data = {}
         # 動画全体のラベルを抽出
         if result.annotation_results[0].segment_label_annotations:
@@ -0,0 +1,232 @@
+# analytics.py
+
+import numpy as np
+import pandas as pd
+
+from app_modules.video_frame import parse_durations, video_type_labels
+
+# 公開直後の動画の1日あたりの再生回数が極端に大きくならないよう、経過日数の下限を1日とする
+MIN_AGE_DAYS = 1.0
+# 修正Zスコア（中央値と MAD による）の絶対値がこの値を超える動画を外れ値とみなす
+OUTLIER_THRESHOLD = 3.5
+# MAD を標準偏差に揃えるための係数 (Φ^-1(0.75))
+MAD_SCALE = 0.6745
+# レポートの上位動画・外れ値の表に含める件数
+REPORT_TOP_N = 10
+
+KEYWORD_COLUMN = '検索キーワード'
+
+
+def _first_column(df, candidates):
+    for column in candidates:
+        if column in df.columns:
+            return column
+    return None
+
+
+def _values(df, candidates):
+    """候補の列のうち最初に存在するものの値（どれもない場合は None）"""
+    column = _first_column(df, candidates)
+    return df[column].to_numpy() if column is not None else None
+
+
+def _floats(series):
+    """Int64 などの列を、欠損値を NaN とする float64 の配列に変換する"""
+    return series.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _published_at(df):
+    """キーワード検索の '公開日時' とチャンネル検索の '公開日' の両方を UTC の日時として扱う"""
+    column = _first_column(df, ['公開日時', '公開日'])
+    if column is None:
+        return pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns, UTC]')
+    return pd.to_datetime(df[column], utc=True)
+
+
+def _video_types(df):
+    if '動画タイプ' in df.columns:
+        return df['動画タイプ'].to_numpy()
+    if '動画の長さ' in df.columns:
+        return video_type_labels(pd.Series(parse_durations(df['動画の長さ'])))
+    return np.full(len(df), None, dtype=object)
+
+
+def compute_metrics(df, now=None, published_at=None):
+    """
+    検索結果の DataFrame から、動画ごとの指標を列ごとにまとめて計算した DataFrame を返す。
+    高評価率・コメント率（再生回数に対する割合）、公開からの経過日数と1日あたりの再生回数、
+    検索キーワード内での1日あたりの再生回数の順位（パーセンタイル）、外れ値の修正Zスコアを含む。
+    検索キーワードの列がない場合は、全体を1つのグループとして順位と外れ値を求める。
+    """
+    now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+    published_at = _published_at(df) if published_at is None else published_at
+    views = _floats(df['再生回数'])
+    likes = _floats(df['高評価数'])
+    comments = _floats(df['コメント数'])
+    # 再生回数が 0 または欠損の動画の割合は欠損値にする
+    denominator = np.where(views > 0, views, np.nan)
+    age_days = np.maximum((now - published_at).dt.total_seconds().to_numpy(dtype='float64') / 86400, MIN_AGE_DAYS)
+    views_per_day = views / age_days
+
+    keywords = df[KEYWORD_COLUMN].to_numpy() if KEYWORD_COLUMN in df.columns else np.full(len(df), '')
+    metrics = pd.DataFrame({
+        'タイトル': _values(df, ['タイトル', '動画タイトル']),
+        'URL': _values(df, ['URL', '動画リンク']),
+        'チャンネル名': _values(df, ['チャンネル名']),
+        KEYWORD_COLUMN: keywords,
+        '動画タイプ': _video_types(df),
+        '再生回数': df['再生回数'].to_numpy(),
+        '高評価率': likes / denominator,
+        'コメント率': comments / denominator,
+        '経過日数': age_days,
+        '1日あたりの再生回数': views_per_day,
+    })
+
+    groups = metrics.groupby(KEYWORD_COLUMN, sort=False)['1日あたりの再生回数']
+    metrics['キーワード内の順位'] = groups.rank(pct=True) * 100
+
+    # 再生回数は対数正規分布に近いため、対数を取ってから中央値と MAD で外れ度合いを測る
+    log_rate = pd.Series(np.log10(1 + views_per_day), index=metrics.index)
+    median = log_rate.groupby(metrics[KEYWORD_COLUMN], sort=False).transform('median')
+    deviation = (log_rate - median).abs()
+    mad = deviation.groupby(metrics[KEYWORD_COLUMN], sort=False).transform('median')
+    metrics['外れ値スコア'] = MAD_SCALE * (log_rate - median) / mad.where(mad > 0)
+    metrics['外れ値'] = metrics['外れ値スコア'].abs() > OUTLIER_THRESHOLD
+    return metrics
+
+
+def _value(value):
+    """JSON とテンプレートで扱えるよう、numpy の数値を Python の値に、NaN を None に変換する"""
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        if np.isnan(value):
+            return None
+        return round(value, 4)
+    return value
+
+
+def _table(title, frame):
+    return {
+        'title': title,
+        'columns': [str(column) for column in frame.columns],
+        'rows': [[_value(value) for value in row] for row in frame.itertuples(index=False, name=None)],
+    }
+
+
+def _group_summary(metrics, key):
+    groups = metrics.groupby(key, sort=True)
+    summary = pd.DataFrame({
+        '件数': groups.size(),
+        '再生回数の中央値': groups['再生回数'].median().astype('float64'),
+        '1日あたりの再生回数の中央値': groups['1日あたりの再生回数'].median(),
+        '高評価率の中央値': groups['高評価率'].median(),
+        'コメント率の中央値': groups['コメント率'].median(),
+        '外れ値の件数': groups['外れ値'].sum(),
+    })
+    return summary.rename_axis(key).reset_index()
+
+
+def build_report(df, now=None, top_n=REPORT_TOP_N):
+    """
+    検索結果の DataFrame から分析レポートを作成する。
+    レポートは JSON にそのまま変換できる辞書で、全体の要約 (summary) と、
+    画面やスプレッドシートにそのまま表示できる表のリスト (tables: title, columns, rows) を含む。
+    """
+    published = _published_at(df)
+    metrics = compute_metrics(df, now, published)
+    summary = {
+        'video_count': len(metrics),
+        'query_count': int(metrics[KEYWORD_COLUMN].nunique()) if KEYWORD_COLUMN in df.columns else None,
+        'published_from': published.min().isoformat() if published.notna().any() else None,
+        'published_to': published.max().isoformat() if published.notna().any() else None,
+        'median_views': _value(float(metrics['再生回数'].median())) if metrics['再生回数'].notna().any() else None,
+        'median_views_per_day': _value(metrics['1日あたりの再生回数'].median()),
+        'median_like_rate': _value(metrics['高評価率'].median()),
+        'median_comment_rate': _value(metrics['コメント率'].median()),
+        'outlier_count': int(metrics['外れ値'].sum()),
+    }
+
+    detail_columns = ['タイトル', 'チャンネル名', KEYWORD_COLUMN, '動画タイプ', '再生回数', '1日あたりの再生回数',
+                      '高評価率', 'コメント率', 'キーワード内の順位', 'URL']
+    if KEYWORD_COLUMN not in df.columns:
+        detail_columns.remove(KEYWORD_COLUMN)
+    top = metrics.nlargest(top_n, '1日あたりの再生回数')
+    outliers = metrics[metrics['外れ値']]
+    outliers = outliers.loc[outliers['外れ値スコア'].abs().sort_values(ascending=False).index[:top_n]]
+
+    tables = [_table('動画タイプ別の比較（Short / Long）', _group_summary(metrics, '動画タイプ'))]
+    if KEYWORD_COLUMN in df.columns:
+        tables.append(_table('検索キーワード別の比較', _group_summary(metrics, KEYWORD_COLUMN)))
+    tables.append(_table(f"1日あたりの再生回数の上位{len(top)}件", top[detail_columns]))
+    tables.append(_table(
+        f"外れ値（キーワード内で1日あたりの再生回数が突出して多い・少ない動画）{len(outliers)}件",
+        outliers[detail_columns + ['外れ値スコア']]
+    ))
+    return {'summary': summary, 'tables': tables, 'ai_analysis': None}
+
+
+def channel_summary(videos, channels, now=None):
+    """
+    チャンネル検索の結果（複数チャンネルを結合した DataFrame）と、チャンネルごとの統計情報
+    (video_frame.build_channel_stats_frame) から、チャンネルを比較する一覧を作成する。
+    取得した動画の件数・再生回数・1日あたりの再生回数・高評価率・コメント率の中央値とショート動画の割合を
+    チャンネルごとに求め、1日あたりの再生回数の中央値の多い順に並べる。
+    """
+    metrics = compute_metrics(videos, now)
+    metrics['チャンネルID'] = videos['チャンネルID'].to_numpy() if 'チャンネルID' in videos.columns else None
+    metrics['公開日時'] = _published_at(videos).array
+    metrics['ショート動画'] = metrics['動画タイプ'] == 'Short'
+    groups = metrics.groupby('チャンネルID', sort=False)
+    per_channel = pd.DataFrame({
+        '取得動画数': groups.size(),
+        '再生回数の中央値': groups['再生回数'].median().astype('float64'),
+        '1日あたりの再生回数の中央値': groups['1日あたりの再生回数'].median(),
+        '高評価率の中央値': groups['高評価率'].median(),
+        'コメント率の中央値': groups['コメント率'].median(),
+        'ショート動画の割合': groups['ショート動画'].mean(),
+        '最新の公開日時': groups['公開日時'].max(),
+    })
+
+    summary = channels.merge(per_channel, left_on='チャンネルID', right_index=True, how='left')
+    summary['取得動画数'] = summary['取得動画数'].fillna(0).astype('int64')
+    summary['登録者あたりの再生回数'] = (
+        summary['再生回数の中央値'] / summary['登録者数'].astype('float64').where(summary['登録者数'] > 0)
+    )
+    columns = ['チャンネル名', '登録者数', '総再生回数', '動画数', '取得動画数', '再生回数の中央値',
+               '1日あたりの再生回数の中央値', '登録者あたりの再生回数', '高評価率の中央値', 'コメント率の中央値',
+               'ショート動画の割合', '最新の公開日時', '開設日時', 'チャンネルID', 'チャンネルリンク']
+    return summary[columns].sort_values('1日あたりの再生回数の中央値', ascending=False, na_position='last',
+                                        ignore_index=True)
+
+
+def format_report(report):
+    """レポートを、スプレッドシートのシートに1行ずつ書き込めるテキストに変換する"""
+    summary = report['summary']
+
+    def percent(value):
+        return f"{value:.2%}" if value is not None else '-'
+
+    def number(value):
+        return f"{value:,.1f}" if value is not None else '-'
+
+    lines = [
+        f"動画件数: {summary['video_count']}",
+        f"公開期間: {(summary['published_from'] or '-')[:10]} 〜 {(summary['published_to'] or '-')[:10]}",
+        f"再生回数の中央値: {number(summary['median_views'])}",
+        f"1日あたりの再生回数の中央値: {number(summary['median_views_per_day'])}",
+        f"高評価率の中央値: {percent(summary['median_like_rate'])}",
+        f"コメント率の中央値: {percent(summary['median_comment_rate'])}",
+        f"外れ値の件数: {summary['outlier_count']}",
+    ]
+    for table in report['tables']:
+        lines.append('')
+        lines.append(f"■ {table['title']}")
+        lines.append(' | '.join(table['columns']))
+        for row in table['rows']:
+            lines.append(' | '.join('' if value is None else str(value) for value in row))
+    if report.get('ai_analysis'):
+        lines.extend(['', '■ AIによる分析', report['ai_analysis']])
+    return '\n'.join(lines)
@@ -0,0 +1,159 @@
+# api_cache.py
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+# キャッシュを保存する SQLite ファイル
+CACHE_DB_FILE = os.getenv('YOUTUBE_CACHE_DB', 'youtube_cache.sqlite3')
+# キャッシュ全体の上限サイズ（バイト）。超えた分は最終アクセスの古い順に削除する
+CACHE_MAX_BYTES = int(os.getenv('YOUTUBE_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+
+# エンドポイントごとの有効期限（秒）
+# 検索結果は変化が早いので短く、動画やチャンネルのメタデータは長めに保持する
+ENDPOINT_TTLS = {
+    'search.list': 30 * 60,
+    'videos.list': 6 * 60 * 60,
+    'channels.list': 24 * 60 * 60,
+    'playlistItems.list': 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+# ヒット時の最終アクセス日時は、この件数が溜まるまで（または次の保存まで）メモリ上に保持してからまとめて書き込む
+ACCESS_FLUSH_BATCH = 100
+
+
+class ResponseCache:
+    """
+    API レスポンスを SQLite に保存するキャッシュ。
+    キーは正規化したリクエストパラメータから生成し、エンドポイントごとの TTL と
+    サイズ上限付きの LRU 方式で管理する。
+    """
+
+    def __init__(self, db_path=CACHE_DB_FILE, ttls=None, max_bytes=CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.ttls = dict(ENDPOINT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 複数スレッドから使うため、接続は1本にしてロックで保護する
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.commit()
+        # 合計サイズは保存のたびに集計し直さないよう、メモリ上で増減させる
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        # まだ書き込んでいない最終アクセス日時 (キー -> 日時)
+        self._pending_access = {}
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """
+        エンドポイント名とパラメータからキャッシュキーを生成する。
+        None や空文字のパラメータは除外し、文字列は前後の空白を取り除いてから並べ替える。
+        """
+        normalized = {}
+        for name, value in params.items():
+            if isinstance(value, str):
+                value = value.strip()
+            if value is None or value == '':
+                continue
+            normalized[name] = value
+        raw = json.dumps([endpoint, normalized], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def ttl_for(self, endpoint):
+        return self.ttls.get(endpoint, DEFAULT_TTL)
+
+    def get(self, endpoint, params, allow_stale=False, count=True):
+        """
+        キャッシュ済みのレスポンスを返す。存在しない、または期限切れの場合は None を返す。
+        allow_stale=True の場合は期限切れのエントリも返す。
+        count=False の場合は、同じリクエストの2回目の参照として扱い、ヒット数・ミス数に数えない。
+        """
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (not allow_stale and now - row[1] > self.ttl_for(endpoint)):
+                self.misses += int(count)
+                return None
+            # ヒットのたびにディスクへ書き込まないよう、最終アクセス日時はまとめて更新する
+            self._pending_access[key] = now
+            if len(self._pending_access) >= ACCESS_FLUSH_BATCH:
+                self._flush_access()
+                self._conn.commit()
+            self.hits += int(count)
+        return json.loads(row[0])
+
+    def _flush_access(self):
+        """溜めておいた最終アクセス日時を書き込む（ロック取得済みで呼ぶ。コミットは呼び出し側で行う）"""
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._pending_access.items()]
+            )
+            self._pending_access.clear()
+
+    def set(self, endpoint, params, response):
+        """レスポンスを保存し、上限サイズを超えた場合は古いエントリを削除する。"""
+        key = self.make_key(endpoint, params)
+        payload = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._pending_access.pop(key, None)
+            # 同じコミットで書き込めるため、溜めておいた最終アクセス日時もここで反映する
+            self._flush_access()
+            previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, payload, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, payload, len(payload), now, now)
+            )
+            self._total_bytes += len(payload) - (previous[0] if previous else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """合計サイズが上限を下回るまで、最終アクセスの古いエントリから削除する（ロック取得済みで呼ぶ）"""
+        # 他のプロセスと同じファイルを共有している場合に備えて、削除する前に実際の合計を集計し直す
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        stale_keys = []
+        if total > self.max_bytes:
+            for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+                if total <= self.max_bytes:
+                    break
+                stale_keys.append((key,))
+                total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        self._total_bytes = total
+
+    def stats(self):
+        """ヒット数・ミス数と現在のエントリ数・合計サイズを返す"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'size_bytes': size,
+        }
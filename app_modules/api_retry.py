@@ -0,0 +1,175 @@
+# api_retry.py
+
+import os
+import json
+import time
+import random
+import socket
+import threading
+from googleapiclient.errors import HttpError
+
+from app_modules import metrics
+from app_modules.quota import QuotaExceededError
+
+# 1回の呼び出しで試行する最大回数（初回を含む）
+RETRY_MAX_ATTEMPTS = int(os.getenv('YOUTUBE_RETRY_MAX_ATTEMPTS', '5'))
+# リトライ間隔の基準値と上限（秒）。実際の待ち時間は 0〜基準値×2^n の範囲でランダムに決める
+RETRY_BASE_DELAY = float(os.getenv('YOUTUBE_RETRY_BASE_DELAY', '0.5'))
+RETRY_MAX_DELAY = float(os.getenv('YOUTUBE_RETRY_MAX_DELAY', '30'))
+# API 呼び出しの上限（1秒あたりの回数）と、まとめて呼び出せる回数
+RATE_LIMIT_PER_SECOND = float(os.getenv('YOUTUBE_RATE_LIMIT', '10'))
+RATE_LIMIT_BURST = int(os.getenv('YOUTUBE_RATE_BURST', '10'))
+
+# 時間をおけば成功する見込みのある HTTP ステータス
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# 403 のうち、クォータ切れを示す理由と、一時的なレート制限を示す理由
+QUOTA_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+# エラーの分類
+RETRYABLE = 'retryable'
+QUOTA = 'quota'
+PERMANENT = 'permanent'
+
+
+class APIRequestError(Exception):
+    """
+    API の呼び出しに失敗した場合に送出される。
+    kind は RETRYABLE（リトライしても成功しなかった）または PERMANENT（リトライしても成功しない）。
+    """
+
+    def __init__(self, message, kind, status=None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+
+
+def error_reasons(error):
+    """HttpError の本文から、errors[].reason と details[].reason を集める"""
+    try:
+        data = json.loads(error.content.decode('utf-8'))
+        body = data['error']
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+    reasons = set()
+    for entry in (body.get('errors') or []) + (body.get('details') or []):
+        if isinstance(entry, dict) and entry.get('reason'):
+            reasons.add(entry['reason'])
+    return reasons
+
+
+def classify_error(error):
+    """例外を RETRYABLE / QUOTA / PERMANENT のいずれかに分類する"""
+    if isinstance(error, QuotaExceededError):
+        return QUOTA
+    if isinstance(error, HttpError):
+        status = error.status_code
+        reasons = error_reasons(error)
+        if reasons & QUOTA_REASONS:
+            return QUOTA
+        if status in RETRYABLE_STATUSES or reasons & RATE_LIMIT_REASONS:
+            return RETRYABLE
+        return PERMANENT
+    # 通信の切断やタイムアウトは一時的なものとして扱う
+    if isinstance(error, (socket.timeout, TimeoutError, ConnectionError)):
+        return RETRYABLE
+    return PERMANENT
+
+
+def _retry_after(error):
+    """429/503 応答の Retry-After ヘッダー（秒）があれば返す"""
+    if not isinstance(error, HttpError):
+        return None
+    try:
+        return float(error.resp.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    複数のスレッドで共有するトークンバケット方式のレート制限。
+    レート制限のエラー (429 など) を受けると補充速度を半分に下げ、成功が続くと元の速度まで少しずつ戻す。
+    """
+
+    def __init__(self, rate=RATE_LIMIT_PER_SECOND, capacity=RATE_LIMIT_BURST, min_rate=None):
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self):
+        """トークンを1つ取得する。足りない場合は補充されるまで待ち、待った秒数を返す"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def slow_down(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+def call_with_retry(func, rate_limiter=None, description='API', max_attempts=RETRY_MAX_ATTEMPTS,
+                    base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, sleep=time.sleep):
+    """
+    func() を呼び出し、一時的なエラーの場合はジッター付きの指数バックオフでリトライする。
+    rate_limiter を渡すと、各試行の前にトークンを取得する。
+    クォータ切れは QuotaExceededError、それ以外の失敗は APIRequestError として送出する。
+    """
+    for attempt in range(max_attempts):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            result = func()
+        except Exception as e:
+            kind = classify_error(e)
+            status = getattr(e, 'status_code', None)
+            if kind == QUOTA:
+                if isinstance(e, QuotaExceededError):
+                    raise
+                raise QuotaExceededError(f"{description} の呼び出しで YouTube API のクォータ上限に達しました。") from e
+            if kind == PERMANENT:
+                if not isinstance(e, HttpError):
+                    # API のエラー以外（プログラムの誤りなど）はそのまま送出する
+                    raise
+                raise APIRequestError(f"{description} の呼び出しに失敗しました: {e}", PERMANENT, status) from e
+            if attempt + 1 >= max_attempts:
+                raise APIRequestError(
+                    f"{description} の呼び出しが {max_attempts} 回失敗しました: {e}", RETRYABLE, status
+                ) from e
+
+            if rate_limiter is not None and status in (429, 403):
+                rate_limiter.slow_down()
+            delay = _retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, base_delay * 2 ** attempt)
+            delay = min(delay, max_delay)
+            metrics.increment('api_retries_total', operation=description)
+            print(f"{description} の一時的なエラーのため {delay:.1f} 秒後にリトライします（{attempt + 1}/{max_attempts}）: {e}")
+            sleep(delay)
+        else:
+            if rate_limiter is not None:
+                rate_limiter.recover()
+            return result
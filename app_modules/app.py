@@ -2,209 +2,279 @@
 
 import os
 import json
-from flask import Flask, send_file, request, render_template, jsonify
+import time
+from flask import Flask, Response, g, request, render_template, jsonify, send_file, url_for
+from markupsafe import escape
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
-import pandas as pd
-import io
-import zipfile
-import re
+import unicodedata
+from urllib.parse import quote
 
-# 自分で作成するAPI連携モジュールをインポート
-from app_modules.youtube_api import YouTubeAPI
-from app_modules.google_sheets_api import GoogleSheetsAPI
-from app_modules.ai_api import GeminiAPI, VideoAnalysisClient
-
-# .envファイルから環境変数を読み込む
+# .envファイルから環境変数を読み込む（各モジュールはインポート時に設定を読むため、先に読み込んでおく）
 load_dotenv()
 
-# YouTube Data APIキーを環境変数から取得
-YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY')
+# APIクライアントは初回アクセス時に作成する（起動時には認証や重いモジュールのインポートを行わない）
+from app_modules import clients, metrics
+from app_modules.uploads import save_stream_with_hash
 
 # Flaskアプリケーションの初期化
 app = Flask(__name__,
             template_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'templates'),
             static_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'static'))
 
-# APIクライアントの初期化
-youtube_client = YouTubeAPI(api_key=YOUTUBE_API_KEY)
-google_sheets_client = GoogleSheetsAPI()
-gemini_client = GeminiAPI()
-
-
 # -----------------------------------------------------------
 # FlaskのルーティングとWebインターフェース
 # -----------------------------------------------------------
 
+# トレースの対象外にするエンドポイント
+UNTRACED_ENDPOINTS = {'static', 'prometheus_metrics'}
+
+# リクエストの処理時間を計測し、?profile=1 が付いている場合（または METRICS_PROFILE=1 の場合）はトレースを開始する
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    if request.endpoint in UNTRACED_ENDPOINTS:
+        metrics.stop_trace()
+        g.trace = None
+    else:
+        g.trace = metrics.start_trace(request.endpoint or 'unknown', enabled=_profile_requested())
+
+@app.after_request
+def finish_request_metrics(response):
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - g.request_started,
+                    endpoint=request.endpoint or 'unknown', method=request.method, status=response.status_code)
+    trace = g.pop('trace', None)
+    if trace is not None:
+        # ストリーミングのレスポンス（CSVのZIPなど）は、送信し終えてからトレースを書き出す
+        def write_trace():
+            metrics.stop_trace()
+            print(f"トレースを書き出しました: {trace.write()}")
+        response.call_on_close(write_trace)
+        response.headers['X-Profile-Trace'] = trace.id
+    return response
+
+def _profile_requested():
+    return request.args.get('profile') == '1'
+
+# Prometheus 形式のメトリクスを返すルート
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # 検索フォームを表示するルート
 @app.route('/', methods=['GET'])
 def index():
     return render_template('index.html')
 
-# Google Sheetsやファイル名で使えない文字を除去する関数
-def sanitize_name(name):
-    # Google Sheetsのシート名やファイル名で使えない文字を_に置換
-    return re.sub(r'[\\/*?:\[\]]', '_', name)
+# ダウンロードさせるファイル名を Content-Disposition ヘッダーに設定する関数
+def set_attachment_header(response, download_name):
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        # ASCII以外を含む場合は RFC 5987 形式 (filename*) も併記する
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        response.headers.set('Content-Disposition', 'attachment', filename=simple, **{'filename*': f"UTF-8''{quoted}"})
+    else:
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
 
 # 検索リクエストを処理し、CSVやスプレッドシートを返すルート
 @app.route('/search', methods=['POST'])
 def search():
-    genre = request.form.get('genre', '').strip()
-    query = request.form.get('query', '').strip()
-    channel_url = request.form.get('channel_url', '').strip()
-    video_type = request.form.get('video_type', 'any')
-    order = request.form.get('order', 'relevance')
-    published_after = request.form.get('published_after', '').strip()
-    published_before = request.form.get('published_before', '').strip()
-    try:
-        max_results = int(request.form.get('max_results', 20))
-    except (ValueError, TypeError):
-        max_results = 20
-    use_sheets_integration = request.form.get('use_sheets_integration') # チェックボックスの状態を取得
-
-    # ジャンル、検索キーワード、チャンネルURLのいずれも空の場合にエラー
-    if not genre and not query and not channel_url:
-        return render_template('index.html', message="ジャンル、検索キーワード、またはチャンネルリンクを入力してください。", message_type="error")
-
-    all_videos_data = []
-    search_queries = []
-
-    if channel_url:
-        # チャンネルURLで検索
-        search_queries = [channel_url]
-        videos = youtube_client.search_videos_by_channel(
-            channel_url=channel_url,
-            order=order,
-            max_results=max_results
-        )
-        if videos is None:
-             return render_template('index.html', message="指定されたチャンネルが見つからないか、動画の取得に失敗しました。", message_type="error")
-        if videos:
-            all_videos_data.append({'query': channel_url, 'videos': videos})
-
-    elif genre:
-        # AIで生成された複数のキーワードを扱う
-        keywords = gemini_client.generate_keywords(genre)
-        if not keywords:
-            return render_template('index.html', message="AIが検索キーワードを生成できませんでした。", message_type="error")
-        search_queries = keywords
-
-        # 複数の検索結果を格納するリスト
-        for q in search_queries:
-            videos = youtube_client.search_videos_data(
-                query=q,
-                video_type=video_type,
-                order=order,
-                published_after=published_after,
-                published_before=published_before,
-                max_results=max_results
-            )
-            if videos:
-                all_videos_data.append({'query': q, 'videos': videos})
+    # pandas などを読み込むため、検索を実行するときにインポートする
+    from app_modules.search_pipeline import SearchError, parse_search_form, download_name
+    from app_modules.zip_stream import stream_csv_zip
 
-    else:
-        # 従来の検索キーワードを使用
-        search_queries = [query]
-        videos = youtube_client.search_videos_data(
-            query=query, 
-            video_type=video_type, 
-            order=order,
-            published_after=published_after,
-            published_before=published_before,
-            max_results=max_results
-        )
-        if videos:
-            all_videos_data.append({'query': query, 'videos': videos})
-
-    if not all_videos_data:
-        return render_template('index.html', message="検索結果が見つかりませんでした。", message_type="error")
-
-    # 全ての動画データを一つのDataFrameに結合する
-    combined_df = pd.concat([pd.DataFrame(item['videos']) for item in all_videos_data], ignore_index=True)
-
-    # DataFrameが空の場合も結果なしと判断
-    if combined_df.empty:
-        return render_template('index.html', message="検索結果が見つかりませんでした。", message_type="error")
-
-    # 結合したDataFrameをAI分析に渡す
-    analysis_result = gemini_client.analyze_video_data(combined_df)
+    params = parse_search_form(request.form)
+
+    # バックグラウンド実行が指定された場合は、ジョブIDだけをすぐに返す
+    if request.form.get('async_mode') == 'on':
+        job = clients.get_job_manager().submit(_run_search_job, params, _profile_requested())
+        return jsonify({
+            'job_id': job.id,
+            'status_url': url_for('job_status', job_id=job.id),
+            'events_url': url_for('job_events', job_id=job.id),
+        }), 202
+
+    search_pipeline = clients.get_search_pipeline()
 
     # 出力形式による分岐
+    if params['use_sheets_integration']:
+        # 分析と検索結果のシートの書き出しは並行して行われ、分析結果のシートだけが分析の終了を待つ
+        try:
+            result = search_pipeline.run(params)
+        except SearchError as e:
+            return render_template('index.html', message=str(e), message_type="error")
+        except Exception as e:
+            print(f"Google スプレッドシートへのエクスポート中にエラーが発生しました: {e}")
+            message = f"Google スプレッドシートへのエクスポートに失敗しました: {e}"
+            return render_template('index.html', message=message, message_type="error")
+
+        message = f"検索結果をGoogleスプレッドシートにエクスポートしました: <a href='{result['url']}' target='_blank' class='button-link'>スプレッドシートを開く</a>"
+        if result['partial_queries']:
+            message += f"<br>※ APIエラーのため、次の検索結果は途中までしか取得できていません: {escape(', '.join(result['partial_queries']))}"
+        return render_template('index.html', message=message, message_type="success",
+                               analysis_result=result['analysis_result'])
+
+    # SearchPipeline.run を通らないため、検索からZIPの送信を終えるまでの時間をここで記録する
+    started = time.perf_counter()
+
+    def observe_pipeline():
+        metrics.observe('pipeline_duration_seconds', time.perf_counter() - started, output='csv_stream')
+
     try:
-        if use_sheets_integration == 'on':
-            # スプレッドシートのタイトルを定義
-            spreadsheet_title = f"YouTube検索_{genre or query or channel_url}"
-            # ★★★ シート名を100文字に制限し、sanitize ★★★
-            first_sheet_name = sanitize_name(all_videos_data[0]['query'][:100])
-            spreadsheet_id, first_sheet_id = google_sheets_client.create_spreadsheet(spreadsheet_title, sheet_name=first_sheet_name)
-
-            for i, item in enumerate(all_videos_data):
-                df = pd.DataFrame(item['videos'])
-                if df.empty:
-                    continue
-
-                if '動画説明文' in df.columns:
-                    df = df.drop(columns=['動画説明文'])
-                if order == 'viewCount' and '再生回数' in df.columns:
-                    df['再生回数'] = pd.to_numeric(df['再生回数'], errors='coerce').fillna(0)
-                current_sheet_name = sanitize_name(item['query'][:100])
-
-                # ループのインデックスを見て、2枚目以降のシートを作成
-                if i == 0:
-                    # 最初のシートは既に存在するので、書き込みだけ行う
-                    google_sheets_client.write_data_to_sheet(spreadsheet_id, f"'{current_sheet_name}'!A1", df)
-                    sheet_id_for_formatting = first_sheet_id
-                else:
-                    # 2枚目以降のシートを新規作成
-                    new_sheet_id = google_sheets_client.create_new_sheet(spreadsheet_id, current_sheet_name)
-                    google_sheets_client.write_data_to_sheet(spreadsheet_id, f"'{current_sheet_name}'!A1", df)
-                    sheet_id_for_formatting = new_sheet_id
-
-                if sheet_id_for_formatting is not None:
-                    google_sheets_client.format_sheet(spreadsheet_id, df.columns.tolist(), sheet_id_for_formatting)
-
-            # 分析結果を新しいシートに書き込む
-            analysis_sheet_title = '分析結果'
-            google_sheets_client.create_new_sheet(spreadsheet_id, analysis_sheet_title)
-            google_sheets_client.write_analysis_to_sheet(spreadsheet_id, analysis_result, analysis_sheet_title)
-
-            sheets_url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit"
-            message = f"検索結果をGoogleスプレッドシートにエクスポートしました: <a href='{sheets_url}' target='_blank' class='button-link'>スプレッドシートを開く</a>"
-            message_type = "success"
-
-            return render_template('index.html', message=message, message_type=message_type, analysis_result=analysis_result)
+        all_videos_data = search_pipeline.collect_videos(params)
+        search_pipeline.combine(all_videos_data)
+    except SearchError as e:
+        observe_pipeline()
+        return render_template('index.html', message=str(e), message_type="error")
+
+    # CSV出力の場合
+    # クエリごとのCSVを生成しながらZIPとして順次送信する（ZIP全体をメモリ上に保持しない）
+    # レスポンスはZIPだけで分析結果を表示する場所がないため、分析は行わずにすぐ送信を始める
+    # （分析結果も必要な場合は、バックグラウンド実行で分析とZIPの書き出しを並行して行う）
+    response = Response(stream_csv_zip(search_pipeline.csv_entries(all_videos_data, params)), mimetype='application/zip')
+    response.call_on_close(observe_pipeline)
+    set_attachment_header(response, download_name(params))
+    # 途中までしか取得できなかった検索結果があれば、そのクエリをヘッダーで知らせる
+    partial_queries = search_pipeline.partial_queries(all_videos_data)
+    if partial_queries:
+        response.headers['X-Partial-Results'] = quote(','.join(partial_queries))
+    return response
+
+# バックグラウンドジョブとして検索処理全体を実行する関数
+def _run_search_job(job, params, profile=False):
+    zip_path = None if params['use_sheets_integration'] else clients.get_job_manager().new_output_path('.zip')
+    # ジョブはリクエストの終了後も続くため、トレースはジョブのスレッドで別に取る
+    trace = metrics.start_trace('search_job', enabled=profile)
+    try:
+        return clients.get_search_pipeline().run(params, zip_path, progress=job.report)
+    except Exception:
+        if zip_path and os.path.exists(zip_path):
+            os.remove(zip_path)
+        raise
+    finally:
+        metrics.stop_trace()
+        if trace is not None:
+            print(f"トレースを書き出しました: {trace.write()}")
+
+# ジョブの進捗・結果を返すルート（ポーリング用）
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = clients.get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    status = job.to_dict()
+    if job.status == 'done' and job.result['type'] == 'zip':
+        status['download_url'] = url_for('job_download', job_id=job.id)
+    return jsonify(status)
+
+# ジョブの進捗を Server-Sent Events で配信するルート
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = clients.get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+
+    def generate():
+        sent = 0
+        while True:
+            events, finished = job.wait_for_events(sent)
+            for event in events:
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            sent += len(events)
+            if finished:
+                break
+            if not events:
+                # 接続維持のためのコメント行
+                yield ": keep-alive\n\n"
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+# 完了したジョブのZIPファイルをダウンロードするルート
+@app.route('/jobs/<job_id>/download', methods=['GET'])
+def job_download(job_id):
+    job = clients.get_job_manager().get(job_id)
+    if job is None or job.status != 'done' or job.result['type'] != 'zip':
+        return jsonify({'error': 'ダウンロードできるファイルがありません'}), 404
+    return send_file(job.result['path'], mimetype='application/zip', as_attachment=True,
+                     download_name=job.result['download_name'])
+
+# YouTube Data APIの当日のクォータ消費量と残量を返すルート
+@app.route('/quota', methods=['GET'])
+def quota_status():
+    return jsonify(clients.get_youtube_client().quota_ledger.summary())
+
+# YouTube APIレスポンスキャッシュのヒット率などを返すルート
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    youtube = clients.get_youtube_client()
+    return jsonify({**youtube.cache.stats(), 'revalidations': youtube.revalidation_stats()})
+
+# 保存済みの動画の統計情報の履歴を返すルート
+@app.route('/videos/<video_id>/history', methods=['GET'])
+def video_history(video_id):
+    history = clients.get_youtube_client().video_store.history(video_ids=[video_id])
+    if history.empty:
+        return jsonify({'error': '動画の履歴が見つかりません'}), 404
+    return jsonify(_frame_to_records(history))
+
+# 保存済みの動画の再生回数の伸びを返すルート（channel_id または query で対象を指定し、days で期間を絞り込む）
+@app.route('/videos/growth', methods=['GET'])
+def video_growth():
+    channel_id = request.args.get('channel_id')
+    query = request.args.get('query')
+    if not channel_id and not query:
+        return jsonify({'error': 'channel_id または query を指定してください'}), 400
+    days = request.args.get('days', type=float)
+    since = time.time() - days * 86400 if days else None
+    limit = request.args.get('limit', 100, type=int)
+    growth = clients.get_youtube_client().video_store.growth(channel_id=channel_id, query=query, since=since)
+    return jsonify(_frame_to_records(growth.head(limit)))
+
+# 既に分かっている動画の統計情報だけを取得し直すルート（video_ids、channel_url、query のいずれかで対象を指定する）
+@app.route('/videos/refresh', methods=['POST'])
+def refresh_videos():
+    from app_modules.api_retry import APIRequestError
+    from app_modules.quota import QuotaExceededError
+
+    data = request.get_json(silent=True) or request.form
+    youtube = clients.get_youtube_client()
+    video_ids = data.get('video_ids')
+    channel_url = data.get('channel_url')
+    query = data.get('query')
+    if isinstance(video_ids, str):
+        video_ids = [video_id.strip() for video_id in video_ids.replace('\n', ',').split(',') if video_id.strip()]
+    try:
+        if video_ids:
+            df = youtube.refresh_statistics(video_ids=video_ids)
+        elif channel_url:
+            channel = youtube.resolve_channel(channel_url)
+            if channel is None:
+                return jsonify({'error': 'チャンネルが見つかりませんでした'}), 404
+            df = youtube.refresh_statistics(channel_id=channel[0])
+        elif query:
+            df = youtube.refresh_statistics(query=query)
         else:
-            # CSV出力の場合
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for item in all_videos_data:
-                    df = pd.DataFrame(item['videos'])
-                    if '動画説明文' in df.columns:
-                        df = df.drop(columns=['動画説明文'])
-                    if order == 'viewCount':
-                        df['再生回数'] = pd.to_numeric(df['再生回数'], errors='coerce').fillna(0)
-                        df = df.sort_values(by='再生回数', ascending=False)
-
-                    csv_filename = f"{sanitize_name(item['query'])}.csv"
-                    csv_buffer = io.BytesIO()
-                    df.to_csv(csv_buffer, index=False, encoding='utf-8-sig')
-                    csv_buffer.seek(0)
-                    zip_file.writestr(csv_filename, csv_buffer.getvalue())
-
-            zip_buffer.seek(0)
-            
-            # CSVダウンロードボタンの代わりに、分析結果を表示して、別途ダウンロードボタンを設置することも可能
-            return send_file(
-                zip_buffer,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name=f'youtube_videos_by_genre_{genre}.zip' if genre else f'youtube_videos_{query}_{video_type}.zip'
-            )
-    except Exception as e:
-        print(f"Google スプレッドシートへのエクスポート中にエラーが発生しました: {e}")
-        message = f"Google スプレッドシートへのエクスポートに失敗しました: {e}"
-        message_type = "error"
-        return render_template('index.html', message=message, message_type=message_type, analysis_result=analysis_result)
+            return jsonify({'error': 'video_ids、channel_url、query のいずれかを指定してください'}), 400
+    except QuotaExceededError as e:
+        return jsonify({'error': str(e)}), 429
+    except APIRequestError as e:
+        return jsonify({'error': str(e)}), 502
+    return jsonify({
+        'videos': _frame_to_records(df),
+        'partial': bool(df.attrs.get('partial')),
+        'error': df.attrs.get('error'),
+    })
+
+# DataFrame を JSON で返せる形（日時は ISO 8601 の文字列、欠損値は null）に変換する関数
+def _frame_to_records(df):
+    return json.loads(df.to_json(orient='records', date_format='iso', force_ascii=False))
+
+# YouTube / Sheets API の HTTP 接続の再利用状況を返すルート
+@app.route('/transport/stats', methods=['GET'])
+def transport_stats():
+    return jsonify(clients.get_http_transport().stats())
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -215,20 +285,48 @@ def upload_file():
     if video_file.filename == '':
         return jsonify({'error': 'ファイルが選択されていません'}), 400
 
-    filename = secure_filename(video_file.filename)
-    filepath = os.path.join('/tmp', filename) # 一時的にファイルを保存
-    video_file.save(filepath)
+    # 一時的にファイルを保存（少しずつ書き出しながら内容のハッシュを計算する）
+    _, extension = os.path.splitext(secure_filename(video_file.filename))
+    filepath, content_hash, _ = save_stream_with_hash(video_file.stream, directory='/tmp', suffix=extension)
 
     try:
-        # ここでAIクライアントを呼び出す
-        video_analysis_client = VideoAnalysisClient()
-        analysis_results = video_analysis_client.analyze_uploaded_video(filepath)
-        return jsonify({'analysis_results': analysis_results}), 200
+        # 同じ内容の動画は分析済みの結果を返す
+        analysis_results = clients.get_video_analysis_cache().get('video_analysis', {'sha256': content_hash})
+        if analysis_results is not None:
+            return jsonify({'analysis_results': analysis_results, 'cached': True}), 200
+
+        # 同じ内容の動画を分析中（送信中を含む）であれば、そのオペレーションを返す
+        # 同時に届いた同じ動画を二重に送信しないよう、送信する前に追跡IDを確保する
+        operation_tracker = clients.get_operation_tracker()
+        operation_id, is_new = operation_tracker.reserve(content_hash)
+        if is_new:
+            # ここでAIクライアントを呼び出す（完了は待たずにバックグラウンドで追跡する）
+            from app_modules.ai_api import VideoAnalysisClient
+            video_analysis_client = VideoAnalysisClient()
+            try:
+                operation, cleanup = video_analysis_client.submit_annotation(filepath, content_hash=content_hash)
+            except Exception:
+                operation_tracker.discard(operation_id)
+                raise
+            operation_tracker.attach(operation_id, operation, cleanup)
+
+        return jsonify({
+            'operation_id': operation_id,
+            'status_url': url_for('upload_status', operation_id=operation_id),
+        }), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         if os.path.exists(filepath):
-            os.remove(filepath) # 処理後に一時ファイルを削除
+            os.remove(filepath) # 分析リクエストの送信後に一時ファイルを削除
+
+# 動画分析の進捗・結果を返すルート
+@app.route('/upload/status/<operation_id>', methods=['GET'])
+def upload_status(operation_id):
+    status = clients.get_operation_tracker().status(operation_id)
+    if status is None:
+        return jsonify({'error': '分析が見つかりません'}), 404
+    return jsonify(status), (200 if status['status'] != 'running' else 202)
 # （他の関数やルート定義の後にこのブロックを配置）
 
 # アプリケーションを実行
@@ -0,0 +1,80 @@
+# channel_directory.py
+
+import os
+import re
+import time
+import sqlite3
+import threading
+from urllib.parse import unquote
+
+# チャンネルの解決結果を保存する SQLite ファイル
+CHANNEL_DB_FILE = os.getenv('YOUTUBE_CHANNEL_DB', 'youtube_channels.sqlite3')
+# ハンドルやチャンネルIDの対応はほとんど変わらないため、長めに保持する
+CHANNEL_TTL = int(os.getenv('YOUTUBE_CHANNEL_TTL', str(30 * 24 * 60 * 60)))
+
+
+def parse_channel_reference(channel_url):
+    """
+    チャンネルURL（またはハンドル・チャンネルID）を解析し、
+    ('handle', ハンドル) または ('id', チャンネルID) を返す。解析できない場合は None。
+    """
+    channel_url = channel_url.strip()
+    # /channel/UCxxxx 形式、またはチャンネルIDそのもの
+    match = re.search(r'(?:/channel/|^)(UC[\w-]{22})', channel_url)
+    if match:
+        return ('id', match.group(1))
+    # URLからチャンネルハンドルを抽出 (例: @handle)
+    match = re.search(r'@([^/?#]+)', channel_url)
+    if match:
+        # ハンドルは大文字小文字を区別しないため小文字に揃える
+        return ('handle', unquote(match.group(1)).lower())
+    return None
+
+
+class ChannelDirectory:
+    """
+    ハンドル/チャンネルID -> (チャンネルID, アップロード再生リストID) の対応を保存するキャッシュ。
+    """
+
+    def __init__(self, db_path=CHANNEL_DB_FILE, ttl=CHANNEL_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS channels (
+                key TEXT PRIMARY KEY,
+                channel_id TEXT NOT NULL,
+                uploads_playlist_id TEXT NOT NULL,
+                resolved_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(kind, value):
+        return f"{kind}:{value}"
+
+    def get(self, kind, value):
+        """有効期限内の (チャンネルID, アップロード再生リストID) を返す。なければ None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT channel_id, uploads_playlist_id, resolved_at FROM channels WHERE key = ?",
+                (self.make_key(kind, value),)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return (row[0], row[1])
+
+    def set(self, kind, value, channel_id, uploads_playlist_id):
+        """解決結果を保存する。チャンネルIDでも引けるように、IDをキーにした行も合わせて保存する"""
+        now = time.time()
+        rows = [(self.make_key(kind, value), channel_id, uploads_playlist_id, now)]
+        if kind == 'handle':
+            rows.append((self.make_key('id', channel_id), channel_id, uploads_playlist_id, now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO channels (key, channel_id, uploads_playlist_id, resolved_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
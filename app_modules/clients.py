@@ -0,0 +1,125 @@
+# clients.py
+
+import os
+import threading
+
+# アップロード動画の分析結果の有効期限（秒）
+VIDEO_ANALYSIS_TTL = 30 * 24 * 60 * 60
+
+# 作成済みのクライアント（名前 -> インスタンス）と、それを作成したプロセスのID
+_instances = {}
+_instances_pid = None
+# クライアントの作成中に別のクライアントを取得することがあるため RLock を使う
+_lock = threading.RLock()
+
+
+def _get_or_create(name, factory):
+    """
+    name のクライアントを初回アクセス時に factory() で作成し、以降は同じものを返す。
+    fork されたワーカープロセスでは親プロセスのクライアント（接続やスレッド）を引き継がず、作り直す。
+    """
+    global _instances_pid
+    pid = os.getpid()
+    instance = _instances.get(name)
+    if instance is not None and _instances_pid == pid:
+        return instance
+    with _lock:
+        if _instances_pid != pid:
+            _instances.clear()
+            _instances_pid = pid
+        if name not in _instances:
+            _instances[name] = factory()
+        return _instances[name]
+
+
+def register_client(name, instance):
+    """
+    name のクライアントとして instance を登録する（ベンチマークで GeminiAPI の代わりを使う場合など）。
+    name は 'youtube'、'google_sheets'、'gemini' など、各 get_* 関数が使う名前。
+    """
+    global _instances_pid
+    with _lock:
+        if _instances_pid != os.getpid():
+            _instances.clear()
+            _instances_pid = os.getpid()
+        _instances[name] = instance
+
+
+class _LazyClient:
+    """
+    属性に初めてアクセスしたときに getter() でクライアントを取得して処理を委譲する。
+    SearchPipeline など、使わないかもしれないクライアントを受け取るオブジェクトに渡す。
+    """
+
+    def __init__(self, getter):
+        self._getter = getter
+
+    def __getattr__(self, name):
+        return getattr(self._getter(), name)
+
+
+def get_http_transport():
+    """YouTube と Sheets のクライアントが共有する、接続プール付きの HTTP トランスポート"""
+    from app_modules.http_transport import HttpTransport
+    return _get_or_create('http_transport', HttpTransport)
+
+
+def get_youtube_client():
+    from app_modules.youtube_api import YouTubeAPI
+    # YouTube Data APIキーを環境変数から取得（.env は app.py の読み込み時に反映済み）
+    return _get_or_create('youtube', lambda: YouTubeAPI(
+        api_key=os.getenv('YOUTUBE_API_KEY'), transport=get_http_transport()
+    ))
+
+
+def get_google_sheets_client():
+    """Google Sheets のクライアント。認証（トークンの読み込みやブラウザでの認証）は初回のエクスポート時に行う"""
+    from app_modules.google_sheets_api import GoogleSheetsAPI
+    return _get_or_create('google_sheets', lambda: GoogleSheetsAPI(transport=get_http_transport()))
+
+
+def get_gemini_client():
+    from app_modules.ai_api import GeminiAPI
+    return _get_or_create('gemini', GeminiAPI)
+
+
+def get_quota_scheduler():
+    from app_modules.quota import QuotaScheduler
+    return _get_or_create('quota_scheduler', lambda: QuotaScheduler(get_youtube_client().quota_ledger))
+
+
+def get_search_pipeline():
+    from app_modules.search_pipeline import SearchPipeline
+
+    def create():
+        return SearchPipeline(
+            get_youtube_client(),
+            _LazyClient(get_google_sheets_client),
+            _LazyClient(get_gemini_client),
+            get_quota_scheduler()
+        )
+    return _get_or_create('search_pipeline', create)
+
+
+def get_job_manager():
+    """時間のかかる検索をバックグラウンドで実行するジョブキュー"""
+    from app_modules.jobs import JobManager
+    return _get_or_create('job_manager', JobManager)
+
+
+def get_video_analysis_cache():
+    """アップロード動画の分析結果を内容のハッシュごとに保存するキャッシュ"""
+    from app_modules.api_cache import ResponseCache
+    return _get_or_create('video_analysis_cache', lambda: ResponseCache(
+        db_path=os.getenv('VIDEO_ANALYSIS_CACHE_DB', 'video_analysis_cache.sqlite3'),
+        ttls={'video_analysis': VIDEO_ANALYSIS_TTL}
+    ))
+
+
+def get_operation_tracker():
+    """実行中の動画分析をバックグラウンドで追跡し、完了した結果を分析結果のキャッシュに保存する"""
+    from app_modules.ai_api import VideoAnalysisClient
+    from app_modules.video_operations import OperationTracker
+    return _get_or_create('operation_tracker', lambda: OperationTracker(
+        get_video_analysis_cache(), VideoAnalysisClient.parse_annotation_result
+    ))
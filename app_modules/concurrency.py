@@ -0,0 +1,129 @@
+# concurrency.py
+
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# 1リクエストあたりの同時実行数の上限（環境変数で調整可能）
+DEFAULT_MAX_WORKERS = int(os.getenv('SEARCH_CONCURRENCY', '5'))
+# 複数チャンネルの動画を取得するときに、同時に処理するチャンネル数の上限
+CHANNEL_MAX_WORKERS = int(os.getenv('CHANNEL_CONCURRENCY', '8'))
+# fan_out が全てのリクエストで共有するスレッドプールのスレッド数
+# （スレッドを使い回すことで、スレッドごとに保持している API クライアントも使い回される）
+FAN_OUT_POOL_SIZE = int(os.getenv('FAN_OUT_POOL_SIZE', '32'))
+
+# 共有のスレッドプールと、それを作成したプロセスのID（fork されたプロセスでは作り直す）
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _shared_pool():
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ThreadPoolExecutor(max_workers=FAN_OUT_POOL_SIZE, thread_name_prefix='fan_out')
+            _pool_pid = pid
+        return _pool
+
+
+def fan_out(func, items, max_workers=None):
+    """
+    items の各要素に func を並行して適用し、入力と同じ順序で結果のリストを返す。
+    同時実行数は max_workers（省略時は DEFAULT_MAX_WORKERS）で制限する。
+    いずれかの呼び出しで例外が発生した場合は、全ての要素を処理した後で、入力順で最初の例外をそのまま送出する。
+
+    処理は共有のスレッドプールで行い、呼び出し元のスレッドも要素を取り出して処理する。
+    fan_out の中から fan_out を呼んでプールのスレッドが埋まっていても、呼び出し元が残りを処理するため止まらない。
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    max_workers = max(1, min(max_workers or DEFAULT_MAX_WORKERS, len(items)))
+
+    # 1件だけならスレッドを使わずにそのまま実行する
+    if max_workers == 1:
+        return [func(item) for item in items]
+
+    # 計測中のトレースなどを引き継ぐため、呼び出し元のコンテキストのコピーの中で実行する
+    # （1つのコンテキストには同時に1スレッドしか入れないため、要素ごとにコピーする）
+    contexts = [contextvars.copy_context() for _ in items]
+    results = [None] * len(items)
+    errors = [None] * len(items)
+    indices = iter(range(len(items)))
+    indices_lock = threading.Lock()
+
+    def work():
+        while True:
+            with indices_lock:
+                index = next(indices, None)
+            if index is None:
+                return
+            try:
+                results[index] = contexts[index].run(func, items[index])
+            except Exception as e:
+                errors[index] = e
+
+    helpers = [_shared_pool().submit(work) for _ in range(max_workers - 1)]
+    work()
+    for helper in helpers:
+        # まだ始まっていないものは取り消し（処理する要素は残っていない）、処理中のものは終わるのを待つ
+        if not helper.cancel():
+            helper.result()
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
+
+
+def run_stages(stages, max_workers=None):
+    """
+    依存関係のある処理段階を、依存先が全て終わったものから並行して実行する。
+    stages は {段階の名前: (関数, 依存先の名前のタプル)} で、関数には依存先の結果を依存先の順に引数として渡す。
+    実行できる段階が複数ある場合は stages の順に開始する（max_workers=1 の場合は stages の順に1つずつ実行する）。
+    ({段階の名前: 結果}, {段階の名前: (開始, 終了)}) を返す。開始と終了は呼び出しからの経過秒数。
+    いずれかの段階で例外が発生した場合は、まだ始まっていない段階は実行せず、
+    実行中の段階が終わるのを待ってからその例外を送出する（呼び出し元が後片付けをした後に出力が書かれないようにする）。
+    """
+    for name, (_, dependencies) in stages.items():
+        unknown = [dependency for dependency in dependencies if dependency not in stages]
+        if unknown:
+            raise ValueError(f"段階 {name} の依存先が見つかりません: {', '.join(unknown)}")
+
+    pending = dict(stages)
+    results = {}
+    timings = {}
+    started = time.perf_counter()
+
+    def run(name, func, args):
+        begin = time.perf_counter() - started
+        try:
+            return func(*args)
+        finally:
+            timings[name] = (begin, time.perf_counter() - started)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers or len(stages), len(stages) or 1)))
+    running = {}
+    try:
+        while pending or running:
+            for name, (func, dependencies) in list(pending.items()):
+                if all(dependency in results for dependency in dependencies):
+                    del pending[name]
+                    # fan_out と同じく、呼び出し元のコンテキストのコピーの中で実行する
+                    context = contextvars.copy_context()
+                    args = [results[dependency] for dependency in dependencies]
+                    running[executor.submit(context.run, run, name, func, args)] = name
+            if not running:
+                raise ValueError(f"依存関係が循環しているため実行できない段階があります: {', '.join(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return results, timings
@@ -0,0 +1,74 @@
+# crawl_store.py
+
+import os
+import time
+import sqlite3
+import threading
+
+# チャンネルのクロール状態を保存する SQLite ファイル
+CRAWL_DB_FILE = os.getenv('YOUTUBE_CRAWL_DB', 'youtube_crawl.sqlite3')
+
+
+class ChannelCrawlStore:
+    """
+    チャンネルごとに取得済みの動画IDと、最新の取得位置（ハイウォーターマーク）を保存する。
+    2回目以降のクロールではハイウォーターマークより新しい動画だけを取得すればよい。
+    """
+
+    def __init__(self, db_path=CRAWL_DB_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS channel_crawl_state (
+                channel_id TEXT PRIMARY KEY,
+                newest_video_id TEXT,
+                newest_published_at TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS channel_videos (
+                channel_id TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                published_at TEXT,
+                PRIMARY KEY (channel_id, video_id)
+            )
+        """)
+        self._conn.commit()
+
+    def get_high_water_mark(self, channel_id):
+        """(最新の動画ID, その公開日時) を返す。未クロールの場合は (None, None)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT newest_video_id, newest_published_at FROM channel_crawl_state WHERE channel_id = ?",
+                (channel_id,)
+            ).fetchone()
+        return row if row else (None, None)
+
+    def add_videos(self, channel_id, videos, newest=None):
+        """
+        新しく見つかった動画 [(video_id, published_at), ...] を保存し、
+        newest が指定されていればハイウォーターマークを更新する。
+        """
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO channel_videos (channel_id, video_id, published_at) VALUES (?, ?, ?)",
+                [(channel_id, video_id, published_at) for video_id, published_at in videos]
+            )
+            if newest:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO channel_crawl_state (channel_id, newest_video_id, newest_published_at, updated_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (channel_id, newest[0], newest[1], time.time())
+                )
+            self._conn.commit()
+
+    def get_video_ids(self, channel_id):
+        """保存済みの動画IDを公開日時の新しい順で返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id FROM channel_videos WHERE channel_id = ? ORDER BY published_at DESC",
+                (channel_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
@@ -0,0 +1,51 @@
+# discovery.py
+
+import os
+import threading
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+
+# 読み込み済みの discovery ドキュメント（(サービス名, バージョン) -> JSON文字列）
+_documents = {}
+_documents_lock = threading.Lock()
+
+# ローカルのエミュレーター（benchmarks/fake_server.py など）に接続する場合に、その host:port を指定する環境変数
+EMULATOR_HOST_ENV = {
+    'youtube': 'YOUTUBE_EMULATOR_HOST',
+    'sheets': 'SHEETS_EMULATOR_HOST',
+}
+
+
+def emulator_host(service_name):
+    """service_name のエミュレーターが設定されていれば、その host:port を返す"""
+    env = EMULATOR_HOST_ENV.get(service_name)
+    return os.getenv(env) if env else None
+
+
+def _discovery_document(service_name, version):
+    """
+    google-api-python-client に同梱された discovery ドキュメントを、プロセス内で1回だけ読み込む。
+    同梱されていない場合は None を返す。
+    """
+    key = (service_name, version)
+    with _documents_lock:
+        if key not in _documents:
+            _documents[key] = discovery_cache.get_static_doc(service_name, version)
+        return _documents[key]
+
+
+def build_service(service_name, version, **kwargs):
+    """
+    build() と同じ API クライアントを返す。
+    discovery ドキュメントはネットワークから取得せず、読み込み済みのものを使い回す。
+    build_from_document() は解析したドキュメントに書き込むため、解析はクライアントごとに行う
+    （スレッド間で同じ dict を共有しない）。
+    エミュレーターが設定されている場合は、接続先をそのサーバーに変更する。
+    """
+    host = emulator_host(service_name)
+    if host:
+        kwargs.setdefault('client_options', {'api_endpoint': f"http://{host}/"})
+    document = _discovery_document(service_name, version)
+    if document is None:
+        return build(service_name, version, **kwargs)
+    return build_from_document(document, **kwargs)
@@ -0,0 +1,78 @@
+# fetch_plan.py
+
+import os
+import math
+
+from app_modules.video_frame import SHORT_MAX_SECONDS
+
+# 1つの検索キーワードで取得する search.list のページ数の上限（1ページ 100 ユニット）
+SEARCH_PAGE_BUDGET = int(os.getenv('YOUTUBE_SEARCH_PAGE_BUDGET', '10'))
+# 1ページで取得できる件数の上限 (API の上限)
+SEARCH_PAGE_SIZE = 50
+# 観測した採用率から求めた件数に対して、余分に取得する割合
+OVERFETCH_MARGIN = 1.25
+# 絞り込みがある場合の、まだ何も取得していないときの採用率の見込みと、その重み（件数に換算）
+PRIOR_KEEP_RATE = 0.5
+PRIOR_WEIGHT = 2
+# 早めに打ち切るかどうかを判断するのに必要な、取得済みの件数
+MIN_KEEP_SAMPLES = 20
+# 1ページで条件に合う件数の見込みがこれを下回る場合は、残りのページを取得する価値がないとみなす
+MIN_KEPT_PER_PAGE = 1
+
+# search.list の videoDuration で絞り込める範囲（short は 4 分未満）
+SERVER_SHORT_MAX_SECONDS = 4 * 60
+
+
+def server_duration_filter(video_type):
+    """
+    動画タイプの絞り込みのうち、search.list の videoDuration で代わりに行えるものの値を返す（行えない場合は None）。
+    ショート動画（SHORT_MAX_SECONDS 秒以下）は videoDuration=short（4分未満）に含まれるため、取得する件数を減らせる。
+    ロング動画（SHORT_MAX_SECONDS 秒超）は medium / long のどちらでも 1〜4 分の動画が漏れるため、サーバー側では絞り込まない。
+    """
+    if video_type == 'short' and SHORT_MAX_SECONDS < SERVER_SHORT_MAX_SECONDS:
+        return 'short'
+    return None
+
+
+def keep_rate(fetched, kept, filtered=True):
+    """取得した件数のうち絞り込みの条件に合った割合の見込み（絞り込みがない場合は 1）"""
+    if not filtered:
+        return 1.0
+    return (kept + PRIOR_KEEP_RATE * PRIOR_WEIGHT) / (fetched + PRIOR_WEIGHT)
+
+
+def next_page_size(remaining, fetched, kept, filtered=True):
+    """残り remaining 件を集めるために、次のページで要求する件数 (1〜SEARCH_PAGE_SIZE)"""
+    if not filtered:
+        return max(1, min(remaining, SEARCH_PAGE_SIZE))
+    expected = remaining / keep_rate(fetched, kept) * OVERFETCH_MARGIN
+    return max(1, min(math.ceil(expected), SEARCH_PAGE_SIZE))
+
+
+def stop_reason(remaining, fetched, kept, pages, filtered=True, page_budget=SEARCH_PAGE_BUDGET):
+    """
+    残り remaining 件が足りない状態で、次のページを取得せずに打ち切る理由を返す（続ける場合は None）。
+    ページ数の上限に達した場合は 'page_budget'、観測した採用率では1ページで条件に合う件数の見込みが
+    MIN_KEPT_PER_PAGE 件に満たない場合は 'unlikely_to_fill' を返す。
+    上限までに残り全てを集められない見込みでも、1ページごとに結果が増える見込みがあれば上限まで取得を続ける。
+    """
+    if pages >= page_budget:
+        return 'page_budget'
+    if filtered and fetched >= MIN_KEEP_SAMPLES:
+        if keep_rate(fetched, kept) * SEARCH_PAGE_SIZE < MIN_KEPT_PER_PAGE:
+            return 'unlikely_to_fill'
+    return None
+
+
+def estimate_pages(max_results, filtered=True, page_budget=SEARCH_PAGE_BUDGET):
+    """
+    1キーワードで max_results 件を集めるのに要る search.list のページ数の見込み（page_budget まで）。
+    採用率が見込み (PRIOR_KEEP_RATE) どおりだった場合に、next_page_size で要求する件数を順に当てはめて求める。
+    """
+    fetched = kept = pages = 0
+    while kept < max_results and pages < page_budget:
+        size = next_page_size(math.ceil(max_results - kept), fetched, kept, filtered)
+        fetched += size
+        kept += size * (PRIOR_KEEP_RATE if filtered else 1)
+        pages += 1
+    return pages
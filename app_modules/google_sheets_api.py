@@ -4,8 +4,14 @@ import os
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 import pickle
+import threading
+import pandas as pd
+from google_auth_httplib2 import AuthorizedHttp
+from google.auth.credentials import AnonymousCredentials
+
+from app_modules import metrics
+from app_modules.discovery import build_service, emulator_host
 
 # スプレッドシートのスコープを定義
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
@@ -13,11 +19,40 @@ SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 TOKEN_PICKLE_FILE = 'token.pickle'
 
 class GoogleSheetsAPI:
-    def __init__(self):
+    def __init__(self, transport=None):
         self.creds = None
-        self._authenticate()
-        # Sheets APIサービスを構築
-        self.service = build('sheets', 'v4', credentials=self.creds)
+        if emulator_host('sheets'):
+            # エミュレーターには認証なしで接続する
+            self.creds = AnonymousCredentials()
+        else:
+            self._authenticate()
+        # 接続プールを共有する HTTP トランスポート（None の場合は httplib2 を使う）
+        self.transport = transport
+        # discovery クライアントはスレッドセーフではないため、スレッドごとに保持する
+        self._local = threading.local()
+
+    @property
+    def service(self):
+        """
+        呼び出し元スレッド専用の Sheets API サービスを返す（初回アクセス時に構築）
+        """
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            if self.transport is not None:
+                http = AuthorizedHttp(self.creds, http=self.transport.http())
+                service = build_service('sheets', 'v4', http=http)
+            else:
+                service = build_service('sheets', 'v4', credentials=self.creds)
+            self._local.service = service
+        return service
+
+    @staticmethod
+    def _execute(request):
+        """API リクエストを実行し、呼び出し回数と所要時間を記録します。"""
+        method = getattr(request, 'methodId', None) or 'unknown'
+        metrics.increment('sheets_api_calls_total', method=method)
+        with metrics.span('sheets_api', method=method):
+            return request.execute()
 
     def _authenticate(self):
         """Google Sheets APIのための認証フローを処理します。"""
@@ -56,9 +91,9 @@ class GoogleSheetsAPI:
                 }
             ]
         }
-        spreadsheet = self.service.spreadsheets().create(
+        spreadsheet = self._execute(self.service.spreadsheets().create(
             body=spreadsheet_body, fields='spreadsheetId,sheets.properties.sheetId'
-        ).execute()
+        ))
         spreadsheet_id = spreadsheet.get('spreadsheetId')
 
         sheet_id = None
@@ -80,93 +115,167 @@ class GoogleSheetsAPI:
                 }
             }]
         }
-        response = self.service.spreadsheets().batchUpdate(
+        response = self._execute(self.service.spreadsheets().batchUpdate(
             spreadsheetId=spreadsheet_id,
             body=request_body
-        ).execute()
+        ))
 
         new_sheet_id = response['replies'][0]['addSheet']['properties']['sheetId']
         print(f"新しいシート '{sheet_title}' が作成されました。シートID: {new_sheet_id}")
         return new_sheet_id
     
+    @staticmethod
+    def _frame_to_values(data_df):
+        """
+        DataFrameをヘッダー行を含むリストのリストに変換します。
+        日時列は文字列に、欠損値は空文字に変換してJSONとして送れる形にします。
+        """
+        data_df = data_df.copy()
+        for column in data_df.columns:
+            if pd.api.types.is_datetime64_any_dtype(data_df[column]):
+                data_df[column] = data_df[column].dt.strftime('%Y-%m-%d %H:%M:%S')
+        data_df = data_df.astype(object).where(data_df.notna(), '')
+        return [data_df.columns.tolist()] + data_df.values.tolist()
+
     def write_data_to_sheet(self, spreadsheet_id, range_name, data_df):
         """指定されたスプレッドシートの範囲にDataFrameのデータを書き込みます。"""
         # DataFrameをヘッダー行を含むリストのリストに変換
-        values = [data_df.columns.tolist()] + data_df.values.tolist()
+        values = self._frame_to_values(data_df)
 
         body = {
             'values': values
         }
-        result = self.service.spreadsheets().values().update(
+        result = self._execute(self.service.spreadsheets().values().update(
             spreadsheetId=spreadsheet_id,
             range=range_name,
             valueInputOption='RAW', # RAWは入力された値をそのまま反映、USER_ENTEREDは書式などを解釈
             body=body
-        ).execute()
+        ))
         print(f"{result.get('updatedCells')} セルが更新されました。")
         return result
     
-    def write_analysis_to_sheet(self, spreadsheet_id, analysis_text, sheet_title):
+    def write_analysis_to_sheet(self, spreadsheet_id, analysis_text, sheet_title, lookup_sheet_id=True):
         """
         指定されたスプレッドシートの新しいシートに分析結果を書き込みます。
+        lookup_sheet_id が False の場合は、シートIDを問い合わせずに None を返します（API呼び出しが1回で済みます）。
         """
         values = [[line] for line in analysis_text.split('\n')]
         body = {'values': values}
 
         range_name = f"'{sheet_title}'!A1"
-        self.service.spreadsheets().values().update(
+        self._execute(self.service.spreadsheets().values().update(
             spreadsheetId=spreadsheet_id,
             range=range_name,
             valueInputOption='RAW',
             body=body
-        ).execute()
+        ))
         
         print(f"分析結果がシート '{sheet_title}' に書き込まれました。")
+        if not lookup_sheet_id:
+            return None
         # ここでシートIDを返す
         return self.get_sheet_id_by_title(spreadsheet_id, sheet_title)
     # ★★★ここまで修正★★★
 
     def get_sheet_id_by_title(self, spreadsheet_id, sheet_title):
         """シートのタイトルからシートIDを取得するヘルパーメソッド"""
-        sheet_metadata = self.service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+        sheet_metadata = self._execute(self.service.spreadsheets().get(spreadsheetId=spreadsheet_id))
         sheets = sheet_metadata.get('sheets', '')
         for sheet in sheets:
             if sheet.get('properties', {}).get('title') == sheet_title:
                 return sheet.get('properties', {}).get('sheetId')
         return None
     
-    def format_sheet(self, spreadsheet_id, header_row_values, sheet_id_to_format=0):
+    def export_spreadsheet(self, title, data_tabs, text_tabs=None):
         """
-        指定されたスプレッドシートのシートに対して、動画説明文の列にテキストラッピングと幅調整、
-        そして全てのデータ行の高さを約40ピクセルに設定します。
+        複数のシートを持つスプレッドシートを、まとめて作成・書き込み・書式設定します。
+        data_tabs は (シート名, DataFrame) のリスト、text_tabs は {シート名: テキスト} です。
+        テキストが None のシートは空のまま作成されます（後から write_analysis_to_sheet で書き込めます）。
+        API呼び出しはシート数によらず、create・values().batchUpdate・batchUpdate の最大3回です。
+        スプレッドシートIDと {シート名: シートID} を返します。
+        """
+        text_tabs = text_tabs or {}
+        sheets = []
+        value_ranges = []
+        format_requests = []
+        sheet_ids = {}
+
+        for sheet_id, (sheet_name, data_df) in enumerate(data_tabs):
+            values = self._frame_to_values(data_df)
+            # データの行数・列数に合わせたサイズでシートを作成する
+            sheets.append({'properties': {
+                'sheetId': sheet_id,
+                'title': sheet_name,
+                'gridProperties': {'rowCount': len(values), 'columnCount': max(len(data_df.columns), 1)},
+            }})
+            value_ranges.append({'range': f"'{sheet_name}'!A1", 'values': values})
+            format_requests.extend(self._format_requests(data_df.columns.tolist(), sheet_id, len(values)))
+            sheet_ids[sheet_name] = sheet_id
+
+        for offset, (sheet_name, text) in enumerate(text_tabs.items()):
+            sheet_id = len(data_tabs) + offset
+            sheets.append({'properties': {'sheetId': sheet_id, 'title': sheet_name}})
+            if text is not None:
+                value_ranges.append({'range': f"'{sheet_name}'!A1", 'values': [[line] for line in text.split('\n')]})
+            sheet_ids[sheet_name] = sheet_id
+
+        # 1. 全シートを含むスプレッドシートを1回で作成
+        spreadsheet = self._execute(self.service.spreadsheets().create(
+            body={'properties': {'title': title}, 'sheets': sheets},
+            fields='spreadsheetId'
+        ))
+        spreadsheet_id = spreadsheet.get('spreadsheetId')
+        print(f"スプレッドシートが作成されました: {spreadsheet_id} (シート数: {len(sheets)})")
+
+        # 2. 全シートのデータを1回で書き込み
+        if value_ranges:
+            result = self._execute(self.service.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'valueInputOption': 'RAW', 'data': value_ranges}
+            ))
+            print(f"{result.get('totalUpdatedCells')} セルが更新されました。")
+
+        # 3. 全シートの書式を1回で設定
+        if format_requests:
+            self._execute(self.service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'requests': format_requests}
+            ))
+            print("シートのフォーマットを適用しました。")
+
+        return spreadsheet_id, sheet_ids
+
+    def _format_requests(self, header_row_values, sheet_id_to_format, row_count=2000):
+        """
+        動画説明文の列のテキストラッピングと幅調整、データ行の高さ設定を行うリクエストを作成します。
+        row_count にはヘッダー行を含む行数を指定します。
         """
         description_col_index = -1
         try:
             description_col_index = header_row_values.index('動画説明文')
         except ValueError:
-            print("警告: '動画説明文'カラムが見つかりませんでした。そのカラムのフォーマットは適用されません。")
-            # カラムが見つからなくても、行の高さ調整は適用されるように、ここでreturnしない
+            # カラムが見つからなくても、行の高さ調整は適用する
             pass
 
         requests = []
 
         # 1. 全てのデータ行の高さ（ヘッダー行を除く）を約40ピクセルに設定するリクエスト
         # ヘッダー行 (RowIndex 0) は含まず、データがある行から適用します。
-        # 'endIndex' は十分大きな値を設定し、未来のデータ追加にも対応できるようにします。
-        requests.append({
-            'updateDimensionProperties': {
-                'range': {
-                    'sheetId': sheet_id_to_format, # 通常、最初のシートはsheetId 0
-                    'dimension': 'ROWS',
-                    'startIndex': 1, # ヘッダー行（インデックス0）の次から適用
-                    'endIndex': 2000, # 例: 2000行目まで適用（必要に応じて調整）
-                },
-                'properties': {
-                    'pixelSize': 40 # 行の高さを40ピクセルに設定
-                },
-                'fields': 'pixelSize'
-            }
-        })
+        if row_count > 1:
+            requests.append({
+                'updateDimensionProperties': {
+                    'range': {
+                        'sheetId': sheet_id_to_format,
+                        'dimension': 'ROWS',
+                        'startIndex': 1, # ヘッダー行（インデックス0）の次から適用
+                        'endIndex': row_count,
+                    },
+                    'properties': {
+                        'pixelSize': 40 # 行の高さを40ピクセルに設定
+                    },
+                    'fields': 'pixelSize'
+                }
+            })
 
         if description_col_index != -1: # '動画説明文'カラムが見つかった場合のみ適用
             # 2. '動画説明文'カラムにテキストラッピングを設定するリクエスト
@@ -174,9 +283,9 @@ class GoogleSheetsAPI:
             requests.append({
                 'repeatCell': {
                     'range': {
-                        'sheetId': sheet_id_to_format, # 通常、最初のシートはsheetId 0
+                        'sheetId': sheet_id_to_format,
                         'startRowIndex': 0, # ヘッダー行を含む全ての行に適用
-                        'endRowIndex': 2000, # 例: 2000行目まで適用（必要に応じて調整）
+                        'endRowIndex': row_count,
                         'startColumnIndex': description_col_index,
                         'endColumnIndex': description_col_index + 1,
                     },
@@ -206,6 +315,18 @@ class GoogleSheetsAPI:
                 }
             })
 
+        return requests
+
+    def format_sheet(self, spreadsheet_id, header_row_values, sheet_id_to_format=0, row_count=2000):
+        """
+        指定されたスプレッドシートのシートに対して、動画説明文の列にテキストラッピングと幅調整、
+        そして全てのデータ行の高さを約40ピクセルに設定します。
+        """
+        if '動画説明文' not in header_row_values:
+            print("警告: '動画説明文'カラムが見つかりませんでした。そのカラムのフォーマットは適用されません。")
+
+        requests = self._format_requests(header_row_values, sheet_id_to_format, row_count)
+
         if not requests: # もし何もフォーマットリクエストが追加されなかった場合
             print("フォーマットリクエストは生成されませんでした。")
             return
@@ -213,10 +334,10 @@ class GoogleSheetsAPI:
         # バッチアップデートを実行
         try:
             body = {'requests': requests}
-            response = self.service.spreadsheets().batchUpdate(
+            response = self._execute(self.service.spreadsheets().batchUpdate(
                 spreadsheetId=spreadsheet_id,
                 body=body
-            ).execute()
+            ))
             print("シートのフォーマットを適用しました。")
         except Exception as e:
-            print(f"シートのフォーマット中にエラーが発生しました: {e}")
\ No newline at end of file
+            print(f"シートのフォーマット中にエラーが発生しました: {e}")
@@ -0,0 +1,126 @@
+# http_transport.py
+
+import os
+import socket
+import threading
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+
+# 接続を保持するホストの数と、ホストごとに保持する接続数（同時に実行するスレッド数以上にする）
+HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', '4'))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+# 1回のリクエストのタイムアウト（秒）
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '60'))
+
+
+class PooledHttp:
+    """
+    googleapiclient から httplib2.Http の代わりに使う HTTP クライアント。
+    実際の通信は共有の requests.Session が行うため、スレッドごとにこのオブジェクトを作っても
+    TCP/TLS の接続はスレッド間で使い回される。
+    """
+
+    # google_auth_httplib2.AuthorizedHttp などが参照する httplib2.Http 互換の属性
+    follow_redirects = True
+    redirect_codes = frozenset([300, 301, 302, 303, 307])
+
+    def __init__(self, transport, timeout=HTTP_TIMEOUT):
+        self.transport = transport
+        self.timeout = timeout
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        """httplib2.Http.request と同じく (レスポンス, 本文のバイト列) を返す"""
+        return self.transport.request(uri, method, body, headers, redirections, self.timeout)
+
+    def close(self):
+        # 接続はトランスポート全体で共有しているため、ここでは閉じない
+        pass
+
+
+class HttpTransport:
+    """
+    keep-alive の接続プールを持つ requests.Session を、複数の API クライアントで共有する。
+    レスポンスは gzip 圧縮を要求し、新しく張った接続数と使い回した回数を集計する。
+    """
+
+    def __init__(self, pool_hosts=HTTP_POOL_HOSTS, pool_size=HTTP_POOL_SIZE):
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._compressed = 0
+        self._errors = 0
+
+    def http(self, timeout=HTTP_TIMEOUT):
+        """API クライアント（discovery の build）に渡す httplib2 互換のオブジェクトを返す"""
+        return PooledHttp(self, timeout)
+
+    def request(self, uri, method, body, headers, redirections, timeout):
+        headers = dict(headers or {})
+        # 圧縮されたレスポンスを受け取る（requests が展開する）
+        headers.setdefault('accept-encoding', 'gzip, deflate')
+        try:
+            response = self.session.request(
+                method, uri, data=body, headers=headers, timeout=timeout,
+                allow_redirects=bool(redirections) and method in ('GET', 'HEAD'),
+            )
+            content = response.content
+        except requests.Timeout as e:
+            self._count(errors=1)
+            # googleapiclient がリトライ対象として扱う例外に置き換える
+            raise socket.timeout(str(e)) from e
+        except requests.ConnectionError as e:
+            self._count(errors=1)
+            raise ConnectionError(str(e)) from e
+
+        compressed = response.headers.get('content-encoding', '').lower() in ('gzip', 'deflate')
+        self._count(compressed=int(compressed))
+
+        info = {key.lower(): value for key, value in response.headers.items()}
+        # 本文は展開済みなので、圧縮を示すヘッダーは除く（httplib2 と同じ扱い）
+        info.pop('content-encoding', None)
+        info.pop('content-length', None)
+        info['status'] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, content
+
+    def _count(self, compressed=0, errors=0):
+        with self._lock:
+            self._requests += 1
+            self._compressed += compressed
+            self._errors += errors
+
+    def stats(self):
+        """
+        リクエスト数・新規接続数・接続の再利用率などを返す。
+        接続数は urllib3 の接続プールが数えた値をホストごとに合計する。
+        """
+        pools = self._adapter.poolmanager.pools
+        hosts = {}
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts[pool.host] = {
+                'requests': pool.num_requests,
+                'connections': pool.num_connections,
+                # 接続プールのキューには未使用の枠として None も入っているため、接続だけを数える
+                'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+            }
+        pool_requests = sum(host['requests'] for host in hosts.values())
+        connections = sum(host['connections'] for host in hosts.values())
+        reused = max(pool_requests - connections, 0)
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'compressed_responses': self._compressed,
+                'errors': self._errors,
+                'connections_opened': connections,
+                'connections_reused': reused,
+                'reuse_rate': reused / pool_requests if pool_requests else 0.0,
+                'hosts': hosts,
+            }
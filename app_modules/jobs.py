@@ -0,0 +1,142 @@
+# jobs.py
+
+import os
+import time
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# バックグラウンドで同時に実行するジョブ数
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# 完了したジョブ（と出力ファイル）を保持する時間（秒）
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', str(60 * 60)))
+
+
+class Job:
+    """
+    1件のバックグラウンドジョブの状態。
+    進捗は events に時系列で追記され、段階ごとの最新状態は stages に保持される。
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.stages = {}
+        self.keywords = {}
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._condition = threading.Condition()
+
+    def report(self, stage, status, **detail):
+        """進捗を記録し、待機中のイベント購読者に通知する"""
+        with self._condition:
+            self.stages[stage] = status
+            query = detail.get('query')
+            if query is not None:
+                self.keywords[query] = {'status': status, 'fetched': detail.get('fetched', 0),
+                                        'partial': detail.get('partial', False),
+                                        'fetch_stats': detail.get('fetch_stats'), 'label': detail.get('label')}
+            self.events.append(dict(detail, stage=stage, status=status, time=time.time()))
+            self._condition.notify_all()
+
+    def _finish(self, status, result=None, error=None):
+        # 購読者が完了を知った時点で最後のイベントを必ず受け取れるよう、イベントの追加と状態の更新は同じロックの中で行う
+        with self._condition:
+            finished_at = time.time()
+            self.events.append({'stage': 'job', 'status': status, 'error': error, 'time': finished_at})
+            self.result = result
+            self.error = error
+            self.finished_at = finished_at
+            self.status = status
+            self._condition.notify_all()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'error')
+
+    def wait_for_events(self, since, timeout=15):
+        """
+        since 番目以降のイベントと、ジョブが完了しているかどうかの組を返す。まだイベントがなければ最大 timeout 秒待つ。
+        完了している場合、返すイベントには完了のイベントまでが含まれる。
+        """
+        with self._condition:
+            if len(self.events) <= since and not self.finished:
+                self._condition.wait(timeout)
+            return self.events[since:], self.finished
+
+    def to_dict(self):
+        with self._condition:
+            result = None
+            if self.result:
+                # ZIPのパスなどサーバー内部の情報は返さない
+                result = {key: value for key, value in self.result.items() if key != 'path'}
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'stages': dict(self.stages),
+                'keywords': dict(self.keywords),
+                'result': result,
+                'error': self.error,
+            }
+
+
+class JobManager:
+    """
+    ジョブをスレッドプールで実行し、ジョブIDで状態を参照できるようにする。
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, retention_seconds=JOB_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """
+        func(job, *args) をバックグラウンドで実行するジョブを登録し、すぐに Job を返す。
+        func が例外を送出した場合はそのメッセージをエラーとして記録する。
+        """
+        self._cleanup()
+        job = Job()
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        job.status = 'running'
+        try:
+            result = func(job, *args)
+        except Exception as e:
+            print(f"ジョブ {job.id} の実行中にエラーが発生しました: {e}")
+            job._finish('error', error=str(e))
+        else:
+            job._finish('done', result=result)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @staticmethod
+    def new_output_path(suffix):
+        """ジョブの出力ファイル用の一時ファイルパスを返す"""
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix='youtube_job_')
+        os.close(fd)
+        return path
+
+    def _cleanup(self):
+        """保持期間を過ぎた完了済みジョブと、その出力ファイルを削除する"""
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished and now - job.finished_at > self.retention_seconds]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            path = (job.result or {}).get('path')
+            if path and os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,247 @@
+# metrics.py
+
+import os
+import re
+import time
+import uuid
+import bisect
+import functools
+import threading
+import contextlib
+import contextvars
+
+# 処理時間のヒストグラムのバケットの上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# トレースの設定を読む環境変数（.env から読み込まれる場合に備えて、インポート時ではなく使うときに読む）
+# METRICS_PROFILE が有効な場合は全てのリクエストのトレースを書き出す（リクエストに profile=1 を付けた場合も書き出す）
+PROFILE_ENV = 'METRICS_PROFILE'
+# トレースを書き出すディレクトリ
+PROFILE_DIR_ENV = 'METRICS_PROFILE_DIR'
+DEFAULT_PROFILE_DIR = 'profiles'
+
+
+def profile_all():
+    return os.getenv(PROFILE_ENV, '').lower() in ('1', 'true', 'on')
+
+
+def profile_dir():
+    return os.getenv(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR)
+
+# /metrics の # HELP に表示する説明
+DESCRIPTIONS = {
+    'stage_duration_seconds': '処理段階ごとの所要時間',
+    'http_request_duration_seconds': 'HTTP リクエストの処理時間（レスポンスの送信開始まで）',
+    'pipeline_duration_seconds': '検索から出力（と分析結果の書き込み）までの所要時間（output: sheets / csv、分析を行わずにZIPを直接送信する場合は csv_stream）',
+    'youtube_api_calls_total': 'YouTube Data API の呼び出し回数（リトライを含む）',
+    'youtube_quota_units_total': 'YouTube Data API で消費したクォータのユニット数',
+    'youtube_cache_requests_total': 'YouTube API のレスポンスキャッシュの参照回数（result: hit / miss / stale / not_modified）',
+    'youtube_search_items_total': 'キーワード検索で詳細を取得した動画の件数（result: kept は動画タイプの条件に合った件数、discarded は除外した件数）',
+    'api_retries_total': '一時的なエラーによる API 呼び出しのリトライ回数',
+    'sheets_api_calls_total': 'Google Sheets API の呼び出し回数',
+    'gemini_api_calls_total': 'Gemini API の呼び出し回数',
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+class MetricsRegistry:
+    """
+    カウンターとヒストグラムをプロセス内で集計し、Prometheus のテキスト形式で出力する。
+    値はメトリクス名とラベルの組ごとに保持する。
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # バケットごとの件数（最後は +Inf）、合計、件数
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def histogram_totals(self, name):
+        """ヒストグラム name のラベルごとの (件数, 合計) を {ラベルの辞書のタプル: (件数, 合計)} で返す"""
+        with self._lock:
+            return {labels: (count, total) for (metric, labels), (_, total, count) in self._histograms.items()
+                    if metric == name}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Prometheus のテキスト形式 (version 0.0.4) で全てのメトリクスを返す"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._histograms.items())
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def increment(name, value=1, **labels):
+    REGISTRY.increment(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+class Trace:
+    """
+    1リクエスト分のスパンを集め、flame graph のツール (flamegraph.pl や speedscope) が読める
+    折りたたみ形式（"親;子;孫 マイクロ秒" の行）で書き出す。
+    並行して実行されたスパンも呼び出し元のスパンの子として記録される。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._finished = False
+        self._lock = threading.Lock()
+        self._spans = []
+
+    def add(self, path, seconds):
+        with self._lock:
+            self._spans.append((path, seconds))
+
+    def folded(self):
+        """スパンごとの自身の時間（子のスパンの時間を除く）を折りたたみ形式の行で返す"""
+        with self._lock:
+            spans = list(self._spans)
+        totals = {}
+        children = {}
+        for path, seconds in spans:
+            totals[path] = totals.get(path, 0.0) + seconds
+            if len(path) > 1:
+                children[path[:-1]] = children.get(path[:-1], 0.0) + seconds
+        lines = []
+        for path, total in sorted(totals.items()):
+            # 並行した子スパンの合計は親を超えることがあるため、自身の時間は 0 未満にしない
+            self_time = max(total - children.get(path, 0.0), 0.0)
+            lines.append(f"{';'.join(path)} {int(self_time * 1_000_000)}")
+        return lines
+
+    def write(self, directory=None):
+        """
+        トレースを終了してファイルに書き出し、そのパスを返す（開始からの時間全体が最上位のスパンになる）。
+        directory を省略した場合は METRICS_PROFILE_DIR（既定は profiles）に書き出す。
+        """
+        directory = directory or profile_dir()
+        if not self._finished:
+            self._finished = True
+            self.add((self.name,), time.perf_counter() - self._started)
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', self.name)
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}-{name}-{self.id}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.folded()) + '\n')
+        return path
+
+
+_current_trace = contextvars.ContextVar('metrics_trace', default=None)
+_current_path = contextvars.ContextVar('metrics_span_path', default=())
+
+
+def start_trace(name, enabled=True):
+    """
+    現在のコンテキストでトレースを開始し、その Trace を返す（enabled が False の場合は None）。
+    以降に同じコンテキスト（とそこからコピーしたコンテキスト）で記録したスパンが集められる。
+    """
+    trace = Trace(name) if enabled or profile_all() else None
+    _current_trace.set(trace)
+    _current_path.set((name,) if trace else ())
+    return trace
+
+
+def stop_trace():
+    _current_trace.set(None)
+    _current_path.set(())
+
+
+@contextlib.contextmanager
+def span(stage, **labels):
+    """
+    処理段階の所要時間を stage_duration_seconds に記録する。
+    トレースの実行中であれば、スパンとしてトレースにも記録する。
+    """
+    frame = stage if not labels else f"{stage}({','.join(str(value) for value in labels.values())})"
+    path = _current_path.get() + (frame,)
+    token = _current_path.set(path)
+    status = 'ok'
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _current_path.reset(token)
+        REGISTRY.observe('stage_duration_seconds', elapsed, stage=stage, status=status, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(path, elapsed)
+
+
+def timed(stage, **labels):
+    """関数の実行を span(stage, **labels) で囲むデコレーター"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,94 @@
+# prompt_builder.py
+
+import os
+
+# 分析プロンプトに含めるデータ部分のトークン数の上限
+ANALYSIS_TOKEN_BUDGET = int(os.getenv('GEMINI_ANALYSIS_TOKEN_BUDGET', '4000'))
+
+# 集計対象の数値列と、行サンプルに含める列（存在するものだけを使う）
+NUMERIC_COLUMNS = ['再生回数', '高評価数', 'コメント数']
+ROW_COLUMNS = ['タイトル', '動画タイトル', 'チャンネル名', '公開日時', '公開日', '再生回数', '高評価数', 'コメント数', '動画タイプ']
+# 上位・サンプル行の件数の初期値（予算に収まるまで半分ずつ減らす）
+INITIAL_ROW_COUNT = 10
+# 行サンプルの選び方を毎回同じにするための乱数シード
+SAMPLE_SEED = 0
+
+
+def estimate_tokens(text):
+    """
+    テキストのおおよそのトークン数を見積もる。
+    ASCII文字は約4文字で1トークン、日本語などそれ以外の文字は1文字1トークンとして数える。
+    """
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def _columns(df, candidates):
+    return [column for column in candidates if column in df.columns]
+
+
+def _summary_sections(df, row_count):
+    """データの要約を、優先度の高い順にセクションのリストとして作成する"""
+    numeric_columns = _columns(df, NUMERIC_COLUMNS)
+    row_columns = _columns(df, ROW_COLUMNS)
+    sections = [f"動画件数: {len(df)}"]
+
+    date_columns = _columns(df, ['公開日時', '公開日'])
+    if date_columns and df[date_columns[0]].notna().any():
+        dates = df[date_columns[0]]
+        sections.append(f"公開期間: {dates.min():%Y-%m-%d} 〜 {dates.max():%Y-%m-%d}")
+
+    if numeric_columns:
+        quantiles = df[numeric_columns].astype('float64').quantile([0.1, 0.25, 0.5, 0.75, 0.9])
+        stats = df[numeric_columns].astype('float64').agg(['mean', 'min', 'max']).round(1)
+        sections.append("数値列の統計:\n" + stats.to_markdown())
+        sections.append("数値列の分位点:\n" + quantiles.round(1).to_markdown())
+
+    if '動画タイプ' in df.columns and numeric_columns:
+        groups = df.groupby('動画タイプ')
+        by_type = groups[numeric_columns].median()
+        by_type.insert(0, '件数', groups.size())
+        sections.append("動画タイプ別の件数と中央値:\n" + by_type.to_markdown())
+
+    if row_count and row_columns:
+        if '再生回数' in df.columns:
+            top = df.sort_values('再生回数', ascending=False, na_position='last').head(row_count)
+            sections.append(f"再生回数の上位{len(top)}件:\n" + top[row_columns].to_markdown(index=False))
+        sample = df.sample(n=min(row_count, len(df)), random_state=SAMPLE_SEED)
+        sections.append(f"無作為に抽出した{len(sample)}件:\n" + sample[row_columns].to_markdown(index=False))
+
+    return sections
+
+
+def summarize_for_prompt(df, token_budget=ANALYSIS_TOKEN_BUDGET):
+    """
+    DataFrameを、トークン数が token_budget に収まる大きさの要約テキストに変換する。
+    集計値・分位点・上位行・サンプル行を含め、収まらない場合は行数を減らし、
+    それでも収まらない場合は優先度の低いセクションから省く。
+    """
+    row_count = INITIAL_ROW_COUNT
+    while True:
+        sections = _summary_sections(df, row_count)
+        text = "\n\n".join(sections)
+        if estimate_tokens(text) <= token_budget or row_count == 0:
+            break
+        row_count //= 2
+
+    while len(sections) > 1 and estimate_tokens(text) > token_budget:
+        sections.pop()
+        text = "\n\n".join(sections)
+    return text
+
+
+def build_analysis_prompt(df, token_budget=ANALYSIS_TOKEN_BUDGET):
+    """動画データの分析を依頼するプロンプトを作成する"""
+    summary = summarize_for_prompt(df, token_budget)
+    return f"""
+        以下のYouTube動画のデータ分析を依頼します。
+        データは件数が多いため、統計量と代表的な行に要約しています。
+        ---
+        データ:
+        {summary}
+        ---
+        このデータから読み取れる傾向や特徴、動画の成功要因、視聴者の関心事など、多角的な分析結果を日本語で簡潔に、Markdown形式でまとめてください。特に、再生回数、高評価数、コメント数の関係性や、動画タイプ（Short/Long）の傾向について言及してください。
+        """
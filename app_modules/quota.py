@@ -0,0 +1,169 @@
+# quota.py
+
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from app_modules.fetch_plan import SEARCH_PAGE_BUDGET, SEARCH_PAGE_SIZE, estimate_pages
+
+# API 呼び出し履歴を保存する SQLite ファイル
+QUOTA_DB_FILE = os.getenv('YOUTUBE_QUOTA_DB', 'youtube_quota.sqlite3')
+# 1日あたりのクォータ上限（YouTube Data API の既定値は 10,000 ユニット）
+DAILY_QUOTA = int(os.getenv('YOUTUBE_DAILY_QUOTA', '10000'))
+# YouTube Data API のクォータは太平洋時間の0時にリセットされる
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+# エンドポイントごとの消費ユニット数
+ENDPOINT_COSTS = {
+    'search.list': 100,
+    'videos.list': 1,
+    'channels.list': 1,
+    'playlistItems.list': 1,
+}
+DEFAULT_COST = 1
+
+
+class QuotaExceededError(Exception):
+    """残りクォータが不足していて API を呼び出せない場合に送出される"""
+
+
+def endpoint_cost(endpoint):
+    return ENDPOINT_COSTS.get(endpoint, DEFAULT_COST)
+
+
+class QuotaLedger:
+    """
+    API 呼び出しごとの消費ユニットを記録する台帳。
+    記録は SQLite に保存されるため、プロセスを再起動しても当日の合計は失われない。
+    """
+
+    def __init__(self, db_path=QUOTA_DB_FILE, daily_quota=DAILY_QUOTA):
+        self.db_path = db_path
+        self.daily_quota = daily_quota
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS quota_calls (
+                ts REAL NOT NULL,
+                day TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                units INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_quota_calls_day ON quota_calls (day)")
+        self._conn.commit()
+        # 当日の合計はメモリ上にも保持し、呼び出しのたびに集計し直さないようにする
+        self._day = None
+        self._used = 0
+
+    @staticmethod
+    def today():
+        return datetime.now(QUOTA_TIMEZONE).strftime('%Y-%m-%d')
+
+    def _refresh_day(self):
+        """日付が変わっていれば当日の合計を読み直す（ロック取得済みで呼ぶ）"""
+        day = self.today()
+        if day != self._day:
+            self._used = self._conn.execute(
+                "SELECT COALESCE(SUM(units), 0) FROM quota_calls WHERE day = ?", (day,)
+            ).fetchone()[0]
+            self._day = day
+        return day
+
+    def record(self, endpoint):
+        """API 呼び出しを1件記録し、消費したユニット数を返す"""
+        units = endpoint_cost(endpoint)
+        with self._lock:
+            day = self._refresh_day()
+            self._conn.execute(
+                "INSERT INTO quota_calls (ts, day, endpoint, units) VALUES (?, ?, ?, ?)",
+                (time.time(), day, endpoint, units)
+            )
+            self._conn.commit()
+            self._used += units
+        return units
+
+    def used_today(self):
+        with self._lock:
+            self._refresh_day()
+            return self._used
+
+    def remaining(self):
+        return max(self.daily_quota - self.used_today(), 0)
+
+    def can_afford(self, endpoint):
+        return endpoint_cost(endpoint) <= self.remaining()
+
+    def summary(self):
+        """当日の消費状況をエンドポイント別の内訳付きで返す"""
+        with self._lock:
+            day = self._refresh_day()
+            rows = self._conn.execute(
+                "SELECT endpoint, COUNT(*), SUM(units) FROM quota_calls WHERE day = ? GROUP BY endpoint",
+                (day,)
+            ).fetchall()
+            used = self._used
+        return {
+            'date': day,
+            'daily_quota': self.daily_quota,
+            'used': used,
+            'remaining': max(self.daily_quota - used, 0),
+            'endpoints': {endpoint: {'calls': calls, 'units': units} for endpoint, calls, units in rows},
+        }
+
+
+class QuotaScheduler:
+    """
+    リクエストを実行する前に消費ユニットを見積もり、残りクォータに収まるように
+    ページ取得の深さを調整する。1ページも取得できない場合はキャッシュのみで応答させる。
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+    @staticmethod
+    def estimate_search_cost(num_queries, max_results, video_type='any', page_budget=SEARCH_PAGE_BUDGET):
+        """
+        検索1キーワードあたり search.list 1回 + videos.list 1回 をページ数分と見積もる。
+        ページ数は search_videos_data_multi と同じ採用率の見込みとページ数の上限から求める
+        （動画タイプで絞り込む場合は、条件に合わない動画の分だけ多くのページが必要になる）。
+        """
+        pages = estimate_pages(max_results, video_type in ('short', 'long'), page_budget)
+        return num_queries * pages * (endpoint_cost('search.list') + endpoint_cost('videos.list'))
+
+    def plan_search(self, num_queries, max_results, video_type='any'):
+        """
+        検索の実行計画を返す。
+        戻り値の max_results は残りクォータに合わせて調整済みの取得件数、
+        page_budget は1キーワードあたりの search.list のページ数の上限で、search_videos_data_multi にそのまま渡す。
+        cache_only が True の場合は新規の search.list を呼び出せないことを表す。
+        """
+        remaining = self.ledger.remaining()
+        estimated_cost = self.estimate_search_cost(num_queries, max_results, video_type)
+        plan = {
+            'max_results': max_results,
+            'page_budget': SEARCH_PAGE_BUDGET,
+            'cache_only': False,
+            'estimated_cost': estimated_cost,
+            'remaining': remaining,
+        }
+        if num_queries == 0 or estimated_cost <= remaining:
+            return plan
+
+        # 1ページあたりのコストから、全キーワードで取得可能なページ数を求める
+        page_cost = num_queries * (endpoint_cost('search.list') + endpoint_cost('videos.list'))
+        affordable_pages = remaining // page_cost
+        if affordable_pages >= 1:
+            plan['page_budget'] = min(SEARCH_PAGE_BUDGET, affordable_pages)
+            plan['max_results'] = min(max_results, plan['page_budget'] * SEARCH_PAGE_SIZE)
+            plan['estimated_cost'] = self.estimate_search_cost(
+                num_queries, plan['max_results'], video_type, plan['page_budget']
+            )
+        else:
+            plan['cache_only'] = True
+            plan['estimated_cost'] = 0
+        print(f"クォータ残量 {remaining} ユニットに合わせて検索計画を調整しました: {plan}")
+        return plan
@@ -0,0 +1,397 @@
+# search_pipeline.py
+
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+
+from app_modules import metrics
+from app_modules.zip_stream import stream_csv_zip
+from app_modules.concurrency import run_stages
+from app_modules.analytics import KEYWORD_COLUMN, build_report, channel_summary, format_report
+from app_modules.ai_api import GEMINI_ANALYSIS_ENABLED
+from app_modules.quota import QuotaExceededError
+from app_modules.api_retry import APIRequestError
+
+
+# False の場合は、分析と出力を並行させずに1段階ずつ順に実行する（比較用）
+PIPELINE_OVERLAP = os.getenv('PIPELINE_OVERLAP', '1').lower() not in ('0', 'false', 'off')
+# 分析結果を書き込むシートの名前
+ANALYSIS_SHEET = '分析結果'
+
+
+class SearchError(Exception):
+    """検索を続行できない場合に、画面に表示するメッセージとともに送出される"""
+
+
+def _no_progress(stage, status, **detail):
+    pass
+
+
+# Google Sheetsやファイル名で使えない文字を除去する関数
+def sanitize_name(name):
+    # Google Sheetsのシート名やファイル名で使えない文字を_に置換
+    return re.sub(r'[\\/*?:\[\]]', '_', name)
+
+
+def spreadsheet_url(spreadsheet_id):
+    return f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit"
+
+
+def parse_search_form(form):
+    """検索フォームの入力値を辞書にまとめる"""
+    try:
+        max_results = int(form.get('max_results', 20))
+    except (ValueError, TypeError):
+        max_results = 20
+    # 複数チャンネルは1行に1つ（またはカンマ区切り）で入力する
+    channel_urls = [url.strip() for url in re.split(r'[\n,]', form.get('channel_urls', '')) if url.strip()]
+    return {
+        'genre': form.get('genre', '').strip(),
+        'query': form.get('query', '').strip(),
+        'channel_url': form.get('channel_url', '').strip(),
+        'channel_urls': list(dict.fromkeys(channel_urls)),
+        'video_type': form.get('video_type', 'any'),
+        'order': form.get('order', 'relevance'),
+        'published_after': form.get('published_after', '').strip(),
+        'published_before': form.get('published_before', '').strip(),
+        'max_results': max_results,
+        'use_sheets_integration': form.get('use_sheets_integration') == 'on', # チェックボックスの状態を取得
+        'full_crawl': form.get('full_crawl') == 'on', # チャンネルの全動画を取得するかどうか
+    }
+
+
+def download_name(params):
+    """CSVのZIPファイルのダウンロード名"""
+    if params['genre']:
+        return f"youtube_videos_by_genre_{params['genre']}.zip"
+    if params.get('channel_urls'):
+        return f"youtube_videos_by_channels_{len(params['channel_urls'])}.zip"
+    return f"youtube_videos_{params['query']}_{params['video_type']}.zip"
+
+
+class SearchPipeline:
+    """
+    /search の処理（キーワード生成・動画検索・分析・エクスポート）をまとめたもの。
+    同期リクエストとバックグラウンドジョブの両方から使う。run は各段階を依存関係に沿って実行し、
+    分析と出力を並行して行う。
+    複数チャンネルの場合は、全チャンネルの動画を1つの表にまとめ、チャンネルごとの一覧の表を加えて出力する。
+    progress には (stage, status, **detail) を受け取る関数を渡すと、各段階の進捗が通知される。
+    """
+
+    def __init__(self, youtube_client, google_sheets_client, gemini_client, quota_scheduler):
+        self.youtube_client = youtube_client
+        self.google_sheets_client = google_sheets_client
+        self.gemini_client = gemini_client
+        self.quota_scheduler = quota_scheduler
+
+    @metrics.timed('collect_videos')
+    def collect_videos(self, params, progress=_no_progress):
+        """
+        入力に応じて動画を検索し、[{'query': 検索クエリ, 'videos': DataFrame, 'partial': bool}, ...] を返す。
+        partial が True の結果は、API エラーにより途中までしか取得できなかったことを示す。
+        複数チャンネルの場合は、チャンネルごとの結果の前に kind='channel_summary' のチャンネル一覧を加える。
+        """
+        genre = params['genre']
+        query = params['query']
+        channel_url = params['channel_url']
+        channel_urls = params.get('channel_urls') or []
+        max_results = params['max_results']
+
+        # ジャンル、検索キーワード、チャンネルURLのいずれも空の場合にエラー
+        if not genre and not query and not channel_url and not channel_urls:
+            raise SearchError("ジャンル、検索キーワード、またはチャンネルリンクを入力してください。")
+
+        all_videos_data = []
+        search_plan = None
+        errors = []
+
+        if channel_urls:
+            if channel_url and channel_url not in channel_urls:
+                channel_urls = [channel_url] + channel_urls
+            self._collect_channels(channel_urls, params, all_videos_data, errors, progress)
+
+        elif channel_url:
+            # チャンネルURLで検索
+            progress('search', 'running', query=channel_url, fetched=0)
+            try:
+                videos = self.youtube_client.search_videos_by_channel(
+                    channel_url=channel_url,
+                    order=params['order'],
+                    max_results=max_results,
+                    full_crawl=params['full_crawl']
+                )
+            except QuotaExceededError:
+                raise SearchError("本日のYouTube APIクォータが不足しているため、チャンネルの動画を取得できませんでした。")
+            except APIRequestError as e:
+                raise SearchError(f"チャンネルの動画の取得に失敗しました: {e}")
+            if videos is None:
+                raise SearchError("指定されたチャンネルが見つかりませんでした。")
+            self._add_result(all_videos_data, errors, channel_url, videos, progress)
+
+        else:
+            if genre:
+                # AIで生成された複数のキーワードを扱う
+                progress('keywords', 'running')
+                with metrics.span('keyword_generation'):
+                    search_queries = self.gemini_client.generate_keywords(genre)
+                if not search_queries:
+                    raise SearchError("AIが検索キーワードを生成できませんでした。")
+                progress('keywords', 'done', keywords=search_queries)
+            else:
+                # 従来の検索キーワードを使用
+                search_queries = [query]
+
+            # 残りクォータに合わせて取得件数を調整する
+            search_plan = self.quota_scheduler.plan_search(len(search_queries), max_results, params['video_type'])
+
+            # 全キーワードをまとめて検索する（検索は並行実行され、動画詳細は重複排除してまとめて取得される）
+            progress('search', 'running', queries=search_queries)
+            results = self.youtube_client.search_videos_data_multi(
+                search_queries,
+                video_type=params['video_type'],
+                order=params['order'],
+                published_after=params['published_after'],
+                published_before=params['published_before'],
+                max_results=search_plan['max_results'],
+                page_budget=search_plan['page_budget'],
+                progress=lambda q, fetched: progress('search', 'running', query=q, fetched=fetched)
+            )
+            for q, videos in zip(search_queries, results):
+                self._add_result(all_videos_data, errors, q, videos, progress)
+
+        if not all_videos_data:
+            if search_plan and search_plan['cache_only']:
+                raise SearchError("本日のYouTube APIクォータが不足しているため、検索を実行できませんでした。")
+            if errors:
+                raise SearchError(f"YouTube APIの呼び出しに失敗したため、検索結果を取得できませんでした: {errors[0]}")
+            raise SearchError("検索結果が見つかりませんでした。")
+
+        return all_videos_data
+
+    def _collect_channels(self, channel_urls, params, all_videos_data, errors, progress):
+        """複数チャンネルの動画をまとめて取得し、チャンネル一覧とチャンネルごとの結果を all_videos_data に加える"""
+        progress('search', 'running', queries=channel_urls)
+        try:
+            results, channels = self.youtube_client.search_videos_by_channels(
+                channel_urls,
+                order=params['order'],
+                max_results=params['max_results'],
+                full_crawl=params['full_crawl'],
+                progress=lambda url, fetched: progress('search', 'running', query=url, fetched=fetched)
+            )
+        except QuotaExceededError:
+            raise SearchError("本日のYouTube APIクォータが不足しているため、チャンネルの動画を取得できませんでした。")
+        except APIRequestError as e:
+            raise SearchError(f"チャンネルの解決に失敗しました: {e}")
+
+        channel_results = []
+        used_labels = set()
+        seen = set()
+        for channel_url, videos in zip(channel_urls, results):
+            if videos is None:
+                errors.append(f"チャンネルが見つかりませんでした: {channel_url}")
+                progress('search', 'done', query=channel_url, fetched=0, error='チャンネルが見つかりませんでした')
+                continue
+            # 同じチャンネルを指す2つ目以降のURLは飛ばす
+            if id(videos) in seen:
+                continue
+            seen.add(id(videos))
+            # チャンネル名で結果を区別する（動画がない場合や名前が重複する場合はURLを使う）
+            label = videos['チャンネル名'].iloc[0] if not videos.empty and videos['チャンネル名'].iloc[0] else channel_url
+            if label in used_labels:
+                label = channel_url
+            used_labels.add(label)
+            # 進捗は実行中の通知と同じチャンネルURLで通知し、チャンネル名は label として添える
+            self._add_result(channel_results, errors, label, videos, progress, progress_key=channel_url)
+
+        if channel_results:
+            videos = pd.concat([item['videos'] for item in channel_results], ignore_index=True)
+            all_videos_data.append({'query': 'チャンネル一覧', 'videos': channel_summary(videos, channels),
+                                    'partial': False, 'kind': 'channel_summary'})
+            all_videos_data.extend(channel_results)
+
+    @staticmethod
+    def _add_result(all_videos_data, errors, query, videos, progress, progress_key=None):
+        """
+        1クエリ分の検索結果を記録する。API エラーで不完全な場合はその旨も記録する。
+        progress_key を指定した場合は、進捗をそのキーで通知し、クエリ名は label として添える。
+        """
+        partial = videos.attrs.get('partial', False)
+        # キーワード検索の場合は、詳細を取得した件数と条件に合った件数なども通知する
+        fetch_stats = videos.attrs.get('fetch_stats')
+        detail = {'fetch_stats': fetch_stats} if fetch_stats else {}
+        key = {'query': query} if progress_key is None else {'query': progress_key, 'label': query}
+        if partial:
+            errors.append(videos.attrs.get('error'))
+            progress('search', 'done', fetched=len(videos), partial=True, error=videos.attrs.get('error'),
+                     **key, **detail)
+        else:
+            progress('search', 'done', fetched=len(videos), **key, **detail)
+        if not videos.empty:
+            all_videos_data.append({'query': query, 'videos': videos, 'partial': partial, **detail})
+
+    @staticmethod
+    def partial_queries(all_videos_data):
+        """API エラーにより途中までしか取得できなかったクエリのリスト"""
+        return [item['query'] for item in all_videos_data if item.get('partial')]
+
+    @metrics.timed('combine')
+    def combine(self, all_videos_data):
+        """
+        全ての動画データを一つのDataFrameに結合する（各列は YouTubeAPI 側で型付け済み）。
+        キーワードごとに比較できるよう、どの検索キーワードの結果かを '検索キーワード' 列に記録する。
+        """
+        video_data = [item for item in all_videos_data if item.get('kind') != 'channel_summary']
+        combined_df = pd.concat([item['videos'] for item in video_data], ignore_index=True)
+        combined_df[KEYWORD_COLUMN] = np.repeat(
+            [item['query'] for item in video_data], [len(item['videos']) for item in video_data]
+        )
+
+        # DataFrameが空の場合も結果なしと判断
+        if combined_df.empty:
+            raise SearchError("検索結果が見つかりませんでした。")
+
+        # 複数キーワードで同じ動画が重複して取得される場合があるため、分析前に重複を除く
+        dedupe_column = 'URL' if 'URL' in combined_df.columns else '動画リンク'
+        return combined_df.drop_duplicates(subset=dedupe_column, ignore_index=True)
+
+    def analyze(self, combined_df, progress=_no_progress):
+        """
+        結合したDataFrameから指標を計算し、分析レポート（analytics.build_report の辞書）を返す。
+        AI による分析は GEMINI_ANALYSIS_ENABLED が有効な場合にだけ行い、その結果をレポートに加える。
+        """
+        progress('analysis', 'running')
+        with metrics.span('analysis'):
+            analysis_result = build_report(combined_df)
+        if GEMINI_ANALYSIS_ENABLED:
+            with metrics.span('ai_analysis'):
+                analysis_result['ai_analysis'] = self.gemini_client.analyze_video_data(combined_df)
+        progress('analysis', 'done')
+        return analysis_result
+
+    def export_tables(self, all_videos_data, params):
+        """
+        出力する (表の名前, DataFrame) を順に返す。通常はクエリごとに1つの表とし、
+        複数チャンネルの場合はチャンネル一覧と、全チャンネルの動画をまとめた1つの表にする。
+        """
+        if any(item.get('kind') == 'channel_summary' for item in all_videos_data):
+            summary = next(item for item in all_videos_data if item.get('kind') == 'channel_summary')
+            videos = pd.concat([item['videos'] for item in all_videos_data if item is not summary], ignore_index=True)
+            tables = [(summary['query'], summary['videos'], False), ('動画一覧', videos, True)]
+        else:
+            tables = [(item['query'], item['videos'], True) for item in all_videos_data]
+
+        for name, df, is_videos in tables:
+            if is_videos and params['order'] == 'viewCount':
+                df = df.sort_values(by='再生回数', ascending=False, na_position='last')
+            yield name, df
+
+    def csv_entries(self, all_videos_data, params):
+        """表ごとの (CSVファイル名, DataFrame) を順に返す"""
+        for name, df in self.export_tables(all_videos_data, params):
+            yield f"{sanitize_name(name)}.csv", df
+
+    @metrics.timed('zip_write')
+    def write_zip(self, all_videos_data, params, path, progress=_no_progress):
+        """CSVのZIPファイルを path に書き出す"""
+        progress('export', 'running', format='csv')
+        with open(path, 'wb') as f:
+            for chunk in stream_csv_zip(self.csv_entries(all_videos_data, params)):
+                f.write(chunk)
+        progress('export', 'done', format='csv')
+
+    @metrics.timed('sheets_export')
+    def export_to_sheets(self, all_videos_data, params, analysis_result=None, progress=_no_progress):
+        """
+        検索結果をGoogleスプレッドシートに書き出し、スプレッドシートIDを返す。
+        全シートの作成・書き込み・書式設定はそれぞれ1回のAPI呼び出しにまとめる。
+        analysis_result を省略した場合、分析結果のシートは空のまま作成する（write_analysis_sheet で後から書き込む）。
+        """
+        progress('export', 'running', format='sheets')
+
+        # スプレッドシートのタイトルを定義
+        channel_count = len(params.get('channel_urls') or [])
+        spreadsheet_title = f"YouTube検索_{params['genre'] or params['query'] or (f'{channel_count}チャンネル' if channel_count else params['channel_url'])}"
+
+        data_tabs = []
+        used_names = set()
+        for name, df in self.export_tables(all_videos_data, params):
+            if df.empty:
+                continue
+
+            # ★★★ シート名を100文字に制限し、sanitize ★★★
+            sheet_name = sanitize_name(name[:100])
+            # 切り詰めによってシート名が重複した場合は連番を付ける
+            base_name, suffix = sheet_name, 2
+            while sheet_name in used_names:
+                sheet_name = f"{base_name[:95]}_{suffix}"
+                suffix += 1
+            used_names.add(sheet_name)
+            data_tabs.append((sheet_name, df))
+
+        # 分析結果のシートも同時に作成する（分析結果があればその内容も書き込む）
+        analysis_text = format_report(analysis_result) if analysis_result is not None else None
+        spreadsheet_id, _ = self.google_sheets_client.export_spreadsheet(
+            spreadsheet_title, data_tabs, text_tabs={ANALYSIS_SHEET: analysis_text}
+        )
+
+        progress('export', 'done', format='sheets')
+        return spreadsheet_id
+
+    @metrics.timed('analysis_sheet')
+    def write_analysis_sheet(self, spreadsheet_id, analysis_result):
+        """export_to_sheets で作成した空の分析結果のシートに、分析結果を書き込む"""
+        self.google_sheets_client.write_analysis_to_sheet(
+            spreadsheet_id, format_report(analysis_result), ANALYSIS_SHEET, lookup_sheet_id=False
+        )
+
+    def run(self, params, zip_path=None, progress=_no_progress):
+        """
+        検索から出力までの全処理を、段階の依存関係に沿って実行し、結果を辞書で返す。
+        出力（Sheets の検索結果のシート、または zip_path へのCSVのZIP）は分析の終了を待たずに書き出し、
+        分析（AI 分析を含む）と並行して行う。分析の終了を待つのは分析結果のシートの書き込みだけである。
+        """
+        sheets = params['use_sheets_integration']
+        stages = {
+            'collect': (lambda: self.collect_videos(params, progress), ()),
+            'combine': (self.combine, ('collect',)),
+            'analysis': (lambda combined_df: self.analyze(combined_df, progress), ('combine',)),
+        }
+        # 結果がない場合（combine が SearchError を送出する場合）に空の出力を作らないよう、combine の後に始める
+        if sheets:
+            stages['export'] = (
+                lambda all_videos_data, _: self.export_to_sheets(all_videos_data, params, progress=progress),
+                ('collect', 'combine')
+            )
+            stages['analysis_sheet'] = (self.write_analysis_sheet, ('export', 'analysis'))
+        else:
+            stages['export'] = (
+                lambda all_videos_data, _: self.write_zip(all_videos_data, params, zip_path, progress),
+                ('collect', 'combine')
+            )
+
+        output = 'sheets' if sheets else 'csv'
+        started = time.perf_counter()
+        try:
+            results, timings = run_stages(stages, max_workers=None if PIPELINE_OVERLAP else 1)
+        finally:
+            metrics.observe('pipeline_duration_seconds', time.perf_counter() - started, output=output)
+        print(f"検索処理の所要時間 ({output}): " + ', '.join(
+            f"{name} {begin:.2f}-{end:.2f}s" for name, (begin, end) in sorted(timings.items(), key=lambda entry: entry[1])
+        ))
+
+        all_videos_data = results['collect']
+        result = {
+            'type': output if sheets else 'zip',
+            'analysis_result': results['analysis'],
+            'partial_queries': self.partial_queries(all_videos_data),
+            'fetch_stats': {item['query']: item['fetch_stats'] for item in all_videos_data if item.get('fetch_stats')},
+            'timings': {name: {'start': round(begin, 3), 'end': round(end, 3)} for name, (begin, end) in timings.items()},
+        }
+        if sheets:
+            result['url'] = spreadsheet_url(results['export'])
+        else:
+            result.update(path=zip_path, download_name=download_name(params))
+        return result
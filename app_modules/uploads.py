@@ -0,0 +1,32 @@
+# uploads.py
+
+import os
+import hashlib
+import tempfile
+
+# アップロードファイルを書き出す際の1回あたりの読み込みサイズ
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def save_stream_with_hash(stream, directory=None, suffix='', chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    アップロードされたファイルのストリームを一定サイズずつ一時ファイルに書き出しながら、
+    同時に SHA-256 ハッシュを計算する。ファイル全体をメモリに読み込むことはない。
+    (一時ファイルのパス, ハッシュの16進文字列, バイト数) を返す。
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix='upload_', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest(), size
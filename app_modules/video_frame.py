@@ -0,0 +1,64 @@
+# video_frame.py
+
+import re
+import numpy as np
+import pandas as pd
+
+from app_modules import metrics
+
+# ISO 8601 形式の再生時間 (例: PT1H2M3S, P1DT2S) を分解する正規表現
+DURATION_PATTERN = re.compile(r'^P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?$')
+# 日・時・分・秒それぞれの秒数
+DURATION_UNITS = np.array([86400, 3600, 60, 1])
+# この秒数以下の動画をショート動画とみなす
+SHORT_MAX_SECONDS = 60
+
+
+def parse_duration(duration_iso):
+    """ISO 8601 形式の再生時間を秒数に変換する。解析できない場合は 0 を返す"""
+    match = DURATION_PATTERN.match(duration_iso or '')
+    if not match:
+        return 0
+    return sum(int(value) * unit for value, unit in zip(match.groups(), DURATION_UNITS) if value)
+
+
+def parse_durations(durations):
+    """ISO 8601 形式の再生時間の列をまとめて秒数 (Int64) に変換する"""
+    parts = pd.Series(durations, dtype='object').str.extract(DURATION_PATTERN).astype('float64')
+    seconds = parts.fillna(0).to_numpy() @ DURATION_UNITS
+    return pd.array(seconds, dtype='Int64')
+
+
+def to_counts(values):
+    """文字列の件数（再生回数など）の列を欠損値を許容する int64 に変換する"""
+    return pd.array(pd.to_numeric(pd.Series(values, dtype='object'), errors='coerce'), dtype='Int64')
+
+
+def video_type_labels(seconds):
+    """秒数の列から 'Short' / 'Long' の列を作成する"""
+    return np.where(np.asarray(seconds.fillna(0), dtype='int64') <= SHORT_MAX_SECONDS, 'Short', 'Long')
+
+
+def _published_at(values):
+    return pd.to_datetime(pd.Series(values, dtype='object'), utc=True, format='ISO8601').array
+
+
+@metrics.timed('dataframe_build', kind='channel_statistics')
+def build_channel_stats_frame(items):
+    """
+    channels().list (part=snippet,statistics) の item のリストから、チャンネルごとの型付きの DataFrame を作成する。
+    登録者数を非公開にしているチャンネルの登録者数は欠損値になる。
+    """
+    snippets = [item.get('snippet', {}) for item in items]
+    statistics = [item.get('statistics', {}) for item in items]
+    channel_ids = pd.Series([item['id'] for item in items], dtype='object')
+    return pd.DataFrame({
+        'チャンネル名': [snippet.get('title') for snippet in snippets],
+        'チャンネルID': channel_ids.array,
+        '登録者数': to_counts([None if stats.get('hiddenSubscriberCount') else stats.get('subscriberCount')
+                            for stats in statistics]),
+        '総再生回数': to_counts([stats.get('viewCount') for stats in statistics]),
+        '動画数': to_counts([stats.get('videoCount') for stats in statistics]),
+        '開設日時': _published_at([snippet.get('publishedAt') for snippet in snippets]),
+        'チャンネルリンク': ('https://www.youtube.com/channel/' + channel_ids).array,
+    })
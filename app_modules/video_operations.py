@@ -0,0 +1,194 @@
+# video_operations.py
+
+import os
+import time
+import uuid
+import threading
+
+# 最初に完了を確認するまでの間隔と、確認間隔の上限（秒）
+OPERATION_POLL_INITIAL = float(os.getenv('VIDEO_OPERATION_POLL_INITIAL', '2'))
+OPERATION_POLL_MAX = float(os.getenv('VIDEO_OPERATION_POLL_MAX', '30'))
+# この時間を過ぎても完了しないオペレーションはタイムアウトとして扱う（秒）
+OPERATION_TIMEOUT = float(os.getenv('VIDEO_OPERATION_TIMEOUT', str(60 * 60)))
+# 完了したオペレーションの状態を保持する時間（秒）
+OPERATION_RETENTION = float(os.getenv('VIDEO_OPERATION_RETENTION', str(60 * 60)))
+
+
+class _TrackedOperation:
+    def __init__(self, operation, content_hash, cleanup):
+        self.id = uuid.uuid4().hex
+        self.operation = operation
+        self.content_hash = content_hash
+        self.cleanup = cleanup
+        self.status = 'running'
+        self.progress = 0
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.poll_interval = OPERATION_POLL_INITIAL
+        self.next_poll_at = self.submitted_at + OPERATION_POLL_INITIAL
+
+
+class OperationTracker:
+    """
+    Video Intelligence の長時間実行オペレーションを追跡する。
+    バックグラウンドのスレッドが未完了のオペレーションを間隔を広げながら確認し、
+    完了したものは解析済みの結果を result_store に内容のハッシュをキーとして保存する。
+    """
+
+    def __init__(self, result_store, parse_result, result_kind='video_analysis'):
+        self.result_store = result_store
+        self.parse_result = parse_result
+        self.result_kind = result_kind
+        self._operations = {}
+        self._by_hash = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._poller = None
+
+    def submit(self, operation, content_hash, cleanup=None):
+        """オペレーションを追跡対象に加え、その追跡IDを返す"""
+        tracked = _TrackedOperation(operation, content_hash, cleanup or (lambda: None))
+        with self._lock:
+            self._operations[tracked.id] = tracked
+            self._by_hash[content_hash] = tracked.id
+            self._ensure_poller()
+        self._wakeup.set()
+        return tracked.id
+
+    def reserve(self, content_hash):
+        """
+        同じ内容の動画の分析を二重に送信しないよう、送信する前に追跡IDを確保する。
+        (追跡ID, 新しく確保したかどうか) を返し、同じ内容の動画を分析中（送信中を含む）であればその追跡IDを返す。
+        新しく確保した場合は、送信後に attach でオペレーションを登録するか、送信に失敗したら discard で取り消す。
+        """
+        with self._lock:
+            operation_id = self._by_hash.get(content_hash)
+            tracked = self._operations.get(operation_id)
+            if tracked and tracked.status == 'running':
+                return operation_id, False
+            tracked = _TrackedOperation(None, content_hash, lambda: None)
+            self._operations[tracked.id] = tracked
+            self._by_hash[content_hash] = tracked.id
+        return tracked.id, True
+
+    def attach(self, operation_id, operation, cleanup=None):
+        """reserve で確保した追跡IDに、送信したオペレーションを登録して完了の確認を始める"""
+        with self._lock:
+            tracked = self._operations[operation_id]
+            tracked.cleanup = cleanup or (lambda: None)
+            tracked.submitted_at = time.time()
+            tracked.next_poll_at = tracked.submitted_at + OPERATION_POLL_INITIAL
+            tracked.operation = operation
+            self._ensure_poller()
+        self._wakeup.set()
+
+    def discard(self, operation_id):
+        """送信に失敗した場合に、reserve で確保した追跡IDを取り消す"""
+        with self._lock:
+            tracked = self._operations.pop(operation_id, None)
+            if tracked and self._by_hash.get(tracked.content_hash) == operation_id:
+                del self._by_hash[tracked.content_hash]
+
+    def find_pending(self, content_hash):
+        """同じ内容の動画を分析中であれば、その追跡IDを返す"""
+        with self._lock:
+            operation_id = self._by_hash.get(content_hash)
+            tracked = self._operations.get(operation_id)
+            if tracked and tracked.status == 'running':
+                return operation_id
+        return None
+
+    def status(self, operation_id):
+        """追跡中のオペレーションの状態を返す。見つからない場合は None"""
+        with self._lock:
+            tracked = self._operations.get(operation_id)
+        if tracked is None:
+            return None
+        status = {
+            'operation_id': tracked.id,
+            'status': tracked.status,
+            'progress': tracked.progress,
+            'error': tracked.error,
+        }
+        if tracked.status == 'done':
+            status['analysis_results'] = self.result_store.get(self.result_kind, {'sha256': tracked.content_hash})
+        return status
+
+    def _ensure_poller(self):
+        """ポーリング用のスレッドが動いていなければ起動する（ロック取得済みで呼ぶ）"""
+        if self._poller is None or not self._poller.is_alive():
+            self._poller = threading.Thread(target=self._poll_loop, name='video-operation-poller', daemon=True)
+            self._poller.start()
+
+    def _poll_loop(self):
+        while True:
+            with self._lock:
+                self._forget_finished()
+                # 送信中（reserve 済みで attach 前）のものはまだ確認できない
+                pending = [tracked for tracked in self._operations.values()
+                           if tracked.status == 'running' and tracked.operation is not None]
+            if not pending:
+                self._wakeup.clear()
+                self._wakeup.wait(OPERATION_POLL_MAX)
+                continue
+
+            now = time.time()
+            for tracked in pending:
+                if tracked.next_poll_at <= now:
+                    self._poll(tracked)
+
+            next_poll_at = min(tracked.next_poll_at for tracked in pending)
+            self._wakeup.clear()
+            self._wakeup.wait(max(next_poll_at - time.time(), 0.1))
+
+    def _poll(self, tracked):
+        """1件のオペレーションの完了を確認し、未完了なら次の確認間隔を倍に広げる"""
+        try:
+            if not tracked.operation.done():
+                tracked.progress = self._progress_percent(tracked.operation)
+                if time.time() - tracked.submitted_at > OPERATION_TIMEOUT:
+                    self._finish(tracked, 'error', error='動画分析がタイムアウトしました。')
+                    return
+                tracked.poll_interval = min(tracked.poll_interval * 2, OPERATION_POLL_MAX)
+                tracked.next_poll_at = time.time() + tracked.poll_interval
+                return
+
+            analysis_results = self.parse_result(tracked.operation.result())
+            self.result_store.set(self.result_kind, {'sha256': tracked.content_hash}, analysis_results)
+            tracked.progress = 100
+            self._finish(tracked, 'done')
+            print(f"動画分析が完了しました: {tracked.id}")
+        except Exception as e:
+            print(f"動画分析オペレーションの確認中にエラーが発生しました: {e}")
+            self._finish(tracked, 'error', error=str(e))
+
+    def _finish(self, tracked, status, error=None):
+        tracked.status = status
+        tracked.error = error
+        tracked.finished_at = time.time()
+        try:
+            tracked.cleanup()
+        except Exception as e:
+            print(f"分析後の後片付け中にエラーが発生しました: {e}")
+
+    @staticmethod
+    def _progress_percent(operation):
+        """オペレーションのメタデータから進捗率（%）を取り出す"""
+        try:
+            progresses = operation.metadata.annotation_progress
+            if progresses:
+                return min(progress.progress_percent for progress in progresses)
+        except AttributeError:
+            pass
+        return 0
+
+    def _forget_finished(self):
+        """保持期間を過ぎた完了済みオペレーションを削除する（ロック取得済みで呼ぶ）"""
+        now = time.time()
+        expired = [operation_id for operation_id, tracked in self._operations.items()
+                   if tracked.finished_at and now - tracked.finished_at > OPERATION_RETENTION]
+        for operation_id in expired:
+            tracked = self._operations.pop(operation_id)
+            if self._by_hash.get(tracked.content_hash) == operation_id:
+                del self._by_hash[tracked.content_hash]
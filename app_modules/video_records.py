@@ -0,0 +1,160 @@
+# video_records.py
+
+import sys
+import numpy as np
+import pandas as pd
+
+from app_modules import metrics
+from app_modules.video_frame import SHORT_MAX_SECONDS, parse_duration, video_type_labels
+
+WATCH_URL = 'https://www.youtube.com/watch?v='
+CHANNEL_URL = 'https://www.youtube.com/channel/'
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class VideoRecord:
+    """
+    1本の動画のうち、検索結果の表に必要なフィールドだけを保持する。キーワード検索とチャンネル検索で共通。
+    API レスポンスの item（dict）の代わりに保持することで、1件あたりのメモリを抑える。
+    説明文は表に含めないため保持しない（必要な場合は VideoStore.descriptions で保存済みのものを読み込む）。
+    """
+
+    __slots__ = ('video_id', 'title', 'channel_title', 'channel_id', 'published_at', 'duration', 'duration_seconds',
+                 'thumbnail_url', 'view_count', 'like_count', 'comment_count')
+
+    def __init__(self, video_id, title=None, channel_title=None, channel_id=None, published_at=None, duration=None,
+                 thumbnail_url=None, view_count=None, like_count=None, comment_count=None):
+        self.video_id = video_id
+        self.title = title
+        self.channel_title = channel_title
+        self.channel_id = channel_id
+        # 公開日時は ISO 8601 の文字列のまま持ち、表にするときにまとめて変換する
+        self.published_at = published_at
+        # 再生時間の文字列は種類が少ないため、同じ値は1つのオブジェクトを共有する
+        self.duration = sys.intern(duration) if duration else None
+        self.duration_seconds = parse_duration(duration)
+        self.thumbnail_url = thumbnail_url
+        self.view_count = view_count
+        self.like_count = like_count
+        self.comment_count = comment_count
+
+    @classmethod
+    def from_item(cls, item):
+        """videos().list の item から作成する"""
+        snippet = item.get('snippet', {})
+        record = cls(
+            item['id'],
+            title=snippet.get('title'),
+            channel_title=snippet.get('channelTitle'),
+            channel_id=snippet.get('channelId'),
+            published_at=snippet.get('publishedAt'),
+            duration=item.get('contentDetails', {}).get('duration'),
+            thumbnail_url=snippet.get('thumbnails', {}).get('high', {}).get('url'),
+        )
+        record.update_statistics(item.get('statistics', {}))
+        return record
+
+    def update_statistics(self, statistics):
+        """videos().list の statistics で再生回数・高評価数・コメント数を更新する"""
+        self.view_count = _to_int(statistics.get('viewCount'))
+        self.like_count = _to_int(statistics.get('likeCount'))
+        self.comment_count = _to_int(statistics.get('commentCount'))
+
+    @property
+    def is_short(self):
+        return self.duration_seconds <= SHORT_MAX_SECONDS
+
+
+@metrics.timed('parse_items')
+def records_from_items(items):
+    """videos().list の item のリストを VideoRecord のリストに変換する"""
+    return [VideoRecord.from_item(item) for item in items]
+
+
+def _objects(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _counts(values):
+    """None を欠損値とする整数のリストから、配列をそのまま使う Int64 の列を作る"""
+    mask = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    data = np.fromiter((value or 0 for value in values), dtype='int64', count=len(values))
+    return pd.arrays.IntegerArray(data, mask)
+
+
+class VideoBatch:
+    """
+    VideoRecord のリストを、フィールドごとの配列にまとめたもの。
+    search_frame と channel_frame は、この配列をコピーせずにそれぞれの列構成の DataFrame にする
+    （URL などの組み立てる列と、型を変換する公開日の列だけは新しく作成する）。
+    """
+
+    __slots__ = ('video_ids', 'titles', 'channel_titles', 'channel_ids', 'published_at', 'durations',
+                 'duration_seconds', 'thumbnail_urls', 'view_counts', 'like_counts', 'comment_counts')
+
+    def __init__(self, records):
+        self.video_ids = _objects([record.video_id for record in records])
+        self.titles = _objects([record.title for record in records])
+        self.channel_titles = _objects([record.channel_title for record in records])
+        self.channel_ids = _objects([record.channel_id for record in records])
+        self.published_at = pd.to_datetime(
+            pd.Series(_objects([record.published_at for record in records]), dtype='object'), utc=True, format='ISO8601'
+        ).array
+        self.durations = _objects([record.duration for record in records])
+        self.duration_seconds = np.fromiter((record.duration_seconds for record in records), dtype='int64',
+                                            count=len(records))
+        self.thumbnail_urls = _objects([record.thumbnail_url for record in records])
+        self.view_counts = _counts([record.view_count for record in records])
+        self.like_counts = _counts([record.like_count for record in records])
+        self.comment_counts = _counts([record.comment_count for record in records])
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    def _links(self, prefix, ids):
+        return (prefix + pd.Series(ids, dtype='object', copy=False)).to_numpy()
+
+    @metrics.timed('dataframe_build', kind='search')
+    def search_frame(self):
+        """
+        キーワード検索の列構成の DataFrame を返す。
+        公開日時は datetime64、再生回数・高評価数・コメント数は Int64 になる。
+        """
+        return pd.DataFrame({
+            'タイトル': self.titles,
+            'URL': self._links(WATCH_URL, self.video_ids),
+            'チャンネル名': self.channel_titles,
+            '公開日時': self.published_at,
+            '再生回数': self.view_counts,
+            '高評価数': self.like_counts,
+            'コメント数': self.comment_counts,
+            'サムネイルURL': self.thumbnail_urls,
+            '動画タイプ': video_type_labels(pd.Series(self.duration_seconds, copy=False)),
+        }, copy=False)
+
+    @metrics.timed('dataframe_build', kind='channel')
+    def channel_frame(self):
+        """チャンネル検索の列構成（公開日は日付、動画の長さは ISO 8601 の文字列）の DataFrame を返す"""
+        published_on = pd.Series(self.published_at, copy=False).dt.tz_localize(None).dt.normalize()
+        return pd.DataFrame({
+            '動画タイトル': self.titles,
+            '動画ID': self.video_ids,
+            'チャンネル名': self.channel_titles,
+            'チャンネルID': self.channel_ids,
+            '公開日': published_on.array,
+            '再生回数': self.view_counts,
+            '高評価数': self.like_counts,
+            'コメント数': self.comment_counts,
+            'サムネイルURL': self.thumbnail_urls,
+            '動画の長さ': self.durations,
+            '動画リンク': self._links(WATCH_URL, self.video_ids),
+            'チャンネルリンク': self._links(CHANNEL_URL, self.channel_ids),
+        }, copy=False)
@@ -0,0 +1,309 @@
+# video_store.py
+
+import os
+import time
+import sqlite3
+import threading
+import pandas as pd
+
+from app_modules.video_frame import parse_duration
+from app_modules.video_records import VideoRecord
+
+# 取得した動画と統計情報の履歴を保存する SQLite ファイル
+VIDEO_STORE_DB = os.getenv('YOUTUBE_VIDEO_STORE_DB', 'youtube_videos.sqlite3')
+# SQLite の1文で指定できる変数の数に収まるよう、IN 句に渡すIDをこの件数ずつに分ける
+SQL_BATCH = 500
+
+# 1日あたりの増加数を求めるのに必要な、最初と最後のスナップショットの間隔（日）
+MIN_GROWTH_INTERVAL_DAYS = 1 / 24
+
+SNAPSHOT_COLUMNS = ['動画ID', '取得日時', '再生回数', '高評価数', 'コメント数']
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class VideoStore:
+    """
+    YouTubeAPI が取得した動画のメタデータと、取得のたびの統計情報（再生回数・高評価数・コメント数）の
+    スナップショットを保存する。再生回数の推移や伸び率は、改めて検索せずにこのデータから求められる。
+    """
+
+    def __init__(self, db_path=VIDEO_STORE_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                channel_id TEXT,
+                channel_title TEXT,
+                title TEXT,
+                published_at TEXT,
+                duration_seconds INTEGER,
+                description TEXT,
+                thumbnail_url TEXT,
+                first_seen_at REAL NOT NULL,
+                last_seen_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_videos_channel ON videos (channel_id, published_at);
+
+            CREATE TABLE IF NOT EXISTS video_stats (
+                video_id TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                view_count INTEGER,
+                like_count INTEGER,
+                comment_count INTEGER,
+                PRIMARY KEY (video_id, fetched_at)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_video_stats_fetched ON video_stats (fetched_at);
+
+            CREATE TABLE IF NOT EXISTS query_videos (
+                query TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                first_seen_at REAL NOT NULL,
+                PRIMARY KEY (query, video_id)
+            ) WITHOUT ROWID;
+        """)
+        self._conn.commit()
+
+    def record_videos(self, items, fetched_at=None):
+        """
+        videos().list の item のリストを保存する。snippet を含む item はメタデータを更新し、
+        statistics を含む item は統計情報のスナップショットを1件追加する
+        （直前のスナップショットと再生回数・高評価数・コメント数が同じ場合は追加しない）。
+        """
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        video_rows = []
+        stats_rows = []
+        for item in items:
+            snippet = item.get('snippet')
+            if snippet:
+                video_rows.append((
+                    item['id'],
+                    snippet.get('channelId'),
+                    snippet.get('channelTitle'),
+                    snippet.get('title'),
+                    snippet.get('publishedAt'),
+                    parse_duration(item['contentDetails'].get('duration')) if 'contentDetails' in item else None,
+                    snippet.get('description'),
+                    snippet.get('thumbnails', {}).get('high', {}).get('url'),
+                    fetched_at,
+                    fetched_at,
+                ))
+            statistics = item.get('statistics')
+            if statistics is not None:
+                stats_rows.append((
+                    item['id'],
+                    fetched_at,
+                    _to_int(statistics.get('viewCount')),
+                    _to_int(statistics.get('likeCount')),
+                    _to_int(statistics.get('commentCount')),
+                ))
+
+        with self._lock:
+            # 続けて検索した場合などに、変わっていない統計情報のスナップショットが溜まらないようにする
+            latest = self._latest_stats([row[0] for row in stats_rows])
+            stats_rows = [row for row in stats_rows if latest.get(row[0]) != row[2:]]
+            # 統計情報だけを取得した場合（part=statistics）はメタデータを上書きしない
+            self._conn.executemany("""
+                INSERT INTO videos (video_id, channel_id, channel_title, title, published_at, duration_seconds,
+                                    description, thumbnail_url, first_seen_at, last_seen_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (video_id) DO UPDATE SET
+                    channel_id = excluded.channel_id,
+                    channel_title = excluded.channel_title,
+                    title = excluded.title,
+                    published_at = excluded.published_at,
+                    duration_seconds = COALESCE(excluded.duration_seconds, duration_seconds),
+                    description = excluded.description,
+                    thumbnail_url = excluded.thumbnail_url,
+                    last_seen_at = excluded.last_seen_at
+            """, video_rows)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO video_stats (video_id, fetched_at, view_count, like_count, comment_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                stats_rows
+            )
+            self._conn.commit()
+
+    def _latest_stats(self, video_ids):
+        """動画ごとの最新のスナップショットの (再生回数, 高評価数, コメント数) を返す（ロック取得済みで呼ぶ）"""
+        latest = {}
+        for start in range(0, len(video_ids), SQL_BATCH):
+            batch = video_ids[start:start + SQL_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            rows = self._conn.execute(
+                f"SELECT s.video_id, s.view_count, s.like_count, s.comment_count FROM video_stats AS s "
+                f"JOIN (SELECT video_id, MAX(fetched_at) AS fetched_at FROM video_stats "
+                f"WHERE video_id IN ({placeholders}) GROUP BY video_id) AS l USING (video_id, fetched_at)",
+                batch
+            ).fetchall()
+            latest.update((row[0], row[1:]) for row in rows)
+        return latest
+
+    def link_query(self, query, video_ids):
+        """検索キーワードで見つかった動画IDを記録する"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO query_videos (query, video_id, first_seen_at) VALUES (?, ?, ?)",
+                [(query, video_id, now) for video_id in video_ids]
+            )
+            self._conn.commit()
+
+    def video_ids_for_channel(self, channel_id):
+        """チャンネルの保存済みの動画IDを、公開日時の新しい順で返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id FROM videos WHERE channel_id = ? ORDER BY published_at DESC", (channel_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def video_ids_for_query(self, query):
+        """検索キーワードで見つかった保存済みの動画IDを、見つかった順で返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id FROM query_videos WHERE query = ? ORDER BY first_seen_at, video_id", (query,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def metadata_records(self, video_ids):
+        """
+        保存済みのメタデータから統計情報のない VideoRecord を作り、{動画ID: VideoRecord} で返す。
+        保存されていない動画は含まれない。
+        """
+        records = {}
+        with self._lock:
+            for start in range(0, len(video_ids), SQL_BATCH):
+                batch = video_ids[start:start + SQL_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT video_id, channel_id, channel_title, title, published_at, duration_seconds, thumbnail_url "
+                    f"FROM videos WHERE video_id IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for video_id, channel_id, channel_title, title, published_at, duration, thumbnail in rows:
+                    records[video_id] = VideoRecord(
+                        video_id,
+                        title=title,
+                        channel_title=channel_title,
+                        channel_id=channel_id,
+                        published_at=published_at,
+                        duration=f"PT{duration}S" if duration is not None else None,
+                        thumbnail_url=thumbnail,
+                    )
+        return records
+
+    def descriptions(self, video_ids):
+        """保存済みの動画の説明文を {動画ID: 説明文} で返す（検索結果の表には説明文を含めないため、必要な場合にここから読み込む）"""
+        descriptions = {}
+        with self._lock:
+            for start in range(0, len(video_ids), SQL_BATCH):
+                batch = video_ids[start:start + SQL_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                descriptions.update(self._conn.execute(
+                    f"SELECT video_id, description FROM videos WHERE video_id IN ({placeholders})", batch
+                ).fetchall())
+        return descriptions
+
+    def _select_ids(self, video_ids=None, channel_id=None, query=None):
+        if video_ids is not None:
+            return list(dict.fromkeys(video_ids))
+        if channel_id is not None:
+            return self.video_ids_for_channel(channel_id)
+        if query is not None:
+            return self.video_ids_for_query(query)
+        raise ValueError("video_ids、channel_id、query のいずれかを指定してください。")
+
+    def history(self, video_ids=None, channel_id=None, query=None, since=None):
+        """
+        統計情報のスナップショットを (動画ID, 取得日時) の順に並べた DataFrame で返す。
+        対象は video_ids、channel_id、query のいずれかで指定し、since（UNIX時刻）以降に絞り込める。
+        """
+        ids = self._select_ids(video_ids, channel_id, query)
+        rows = []
+        with self._lock:
+            for start in range(0, len(ids), SQL_BATCH):
+                batch = ids[start:start + SQL_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows.extend(self._conn.execute(
+                    f"SELECT video_id, fetched_at, view_count, like_count, comment_count FROM video_stats "
+                    f"WHERE video_id IN ({placeholders}) AND fetched_at >= ? ORDER BY video_id, fetched_at",
+                    (*batch, since or 0)
+                ).fetchall())
+
+        df = pd.DataFrame(rows, columns=SNAPSHOT_COLUMNS)
+        df['取得日時'] = pd.to_datetime(df['取得日時'].astype('float64'), unit='s', utc=True)
+        for column in ['再生回数', '高評価数', 'コメント数']:
+            df[column] = df[column].astype('Int64')
+        return df
+
+    def growth(self, video_ids=None, channel_id=None, query=None, since=None):
+        """
+        動画ごとに、最初と最後のスナップショットの間の伸びを求めた DataFrame を返す。
+        再生回数の増加数・増加率と、1日あたりの増加数（スナップショットが1件だけの動画は欠損値）を含み、
+        1日あたりの増加数の多い順に並べる。
+        最初と最後のスナップショットの間隔が MIN_GROWTH_INTERVAL_DAYS に満たない動画の1日あたりの増加数は、
+        短い間隔の誤差が大きく拡大されるため欠損値にする。
+        """
+        snapshots = self.history(video_ids, channel_id, query, since)
+        columns = ['動画ID', 'タイトル', 'チャンネル名', '公開日時', 'スナップショット数', '最初の取得日時', '最後の取得日時',
+                   '再生回数', '再生回数の増加数', '再生回数の増加率', '1日あたりの再生回数の増加数',
+                   '高評価数の増加数', 'コメント数の増加数']
+        if snapshots.empty:
+            return pd.DataFrame(columns=columns)
+
+        groups = snapshots.groupby('動画ID', sort=False)
+        # first() / last() は欠損値を飛ばして列ごとに値を選ぶため、取得日時と値が別のスナップショットのものになりうる。
+        # 最初と最後のスナップショットは行ごと取り出す
+        first = groups.head(1).set_index('動画ID')
+        last = groups.tail(1).set_index('動画ID')
+        counts = groups.size()
+        elapsed_days = (last['取得日時'] - first['取得日時']).dt.total_seconds() / 86400
+
+        result = pd.DataFrame({
+            'スナップショット数': counts,
+            '最初の取得日時': first['取得日時'],
+            '最後の取得日時': last['取得日時'],
+            '再生回数': last['再生回数'],
+            '再生回数の増加数': last['再生回数'] - first['再生回数'],
+            '高評価数の増加数': last['高評価数'] - first['高評価数'],
+            'コメント数の増加数': last['コメント数'] - first['コメント数'],
+        })
+        result['再生回数の増加率'] = (
+            result['再生回数の増加数'].astype('float64') / first['再生回数'].astype('float64').where(first['再生回数'] > 0)
+        )
+        result['1日あたりの再生回数の増加数'] = (
+            result['再生回数の増加数'].astype('float64') / elapsed_days.where(elapsed_days >= MIN_GROWTH_INTERVAL_DAYS)
+        )
+
+        metadata = self._metadata(result.index.tolist())
+        result = result.join(metadata).rename_axis('動画ID').reset_index()
+        return result[columns].sort_values('1日あたりの再生回数の増加数', ascending=False, na_position='last', ignore_index=True)
+
+    def _metadata(self, video_ids):
+        rows = []
+        with self._lock:
+            for start in range(0, len(video_ids), SQL_BATCH):
+                batch = video_ids[start:start + SQL_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows.extend(self._conn.execute(
+                    f"SELECT video_id, title, channel_title, published_at FROM videos WHERE video_id IN ({placeholders})",
+                    batch
+                ).fetchall())
+        metadata = pd.DataFrame(rows, columns=['動画ID', 'タイトル', 'チャンネル名', '公開日時']).set_index('動画ID')
+        metadata['公開日時'] = pd.to_datetime(metadata['公開日時'], utc=True, format='ISO8601')
+        return metadata
+
+    def stats(self):
+        """保存している動画数とスナップショット数を返す"""
+        with self._lock:
+            videos = self._conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+            snapshots = self._conn.execute("SELECT COUNT(*) FROM video_stats").fetchone()[0]
+            queries = self._conn.execute("SELECT COUNT(DISTINCT query) FROM query_videos").fetchone()[0]
+        return {'videos': videos, 'snapshots': snapshots, 'queries': queries}
@@ -1,227 +1,629 @@
 # youtube_api.py
 
 import os
-from googleapiclient.discovery import build
+import threading
 from googleapiclient.errors import HttpError
-from urllib.parse import unquote
-import re
-from datetime import datetime
+
+from app_modules import metrics
+from app_modules.api_cache import ResponseCache
+from app_modules.api_retry import APIRequestError, TokenBucket, call_with_retry
+from app_modules.discovery import build_service
+from app_modules.concurrency import CHANNEL_MAX_WORKERS, fan_out
+from app_modules.quota import QuotaLedger, QuotaExceededError
+from app_modules.crawl_store import ChannelCrawlStore
+from app_modules.channel_directory import ChannelDirectory, parse_channel_reference
+from app_modules.video_store import VideoStore
+from app_modules.fetch_plan import SEARCH_PAGE_BUDGET, next_page_size, server_duration_filter, stop_reason
+from app_modules.video_frame import build_channel_stats_frame
+from app_modules.video_records import VideoBatch, records_from_items
+
+def mark_partial(frame, error):
+    """
+    API エラーにより途中までしか取得できなかった結果であれば、DataFrame の attrs にその旨を記録する。
+    attrs['partial'] が True の場合、attrs['error'] に最初のエラーの内容が入る。
+    """
+    frame.attrs['partial'] = error is not None
+    frame.attrs['error'] = error
+    return frame
+
 
 class YouTubeAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, cache=None, quota_ledger=None, crawl_store=None, channel_directory=None, transport=None,
+                 rate_limiter=None, video_store=None):
         self.api_key = api_key
-        self.youtube = build('youtube', 'v3', developerKey=self.api_key)
+        # 接続プールを共有する HTTP トランスポート（None の場合は httplib2 を使う）
+        self.transport = transport
+        # 同一パラメータのリクエストはローカルのキャッシュから返す
+        self.cache = cache if cache is not None else ResponseCache()
+        # 実際に API を呼び出した分の消費ユニットを記録する
+        self.quota_ledger = quota_ledger if quota_ledger is not None else QuotaLedger()
+        # チャンネルの全件クロールで取得済みの位置を保存する
+        self.crawl_store = crawl_store if crawl_store is not None else ChannelCrawlStore()
+        # チャンネルURL -> チャンネルID -> アップロード再生リストIDの対応を保存する
+        self.channel_directory = channel_directory if channel_directory is not None else ChannelDirectory()
+        # 取得した動画と、取得のたびの統計情報のスナップショットを保存する
+        self.video_store = video_store if video_store is not None else VideoStore()
+        # 並行して実行される全ての API 呼び出しで共有するレート制限
+        self.rate_limiter = rate_limiter if rate_limiter is not None else TokenBucket()
+        # discovery クライアントはスレッドセーフではないため、スレッドごとに保持する
+        self._local = threading.local()
+        # ETag による条件付きリクエストの送信数と、そのうち変更がなかった (304) 数
+        self._revalidations = {'requests': 0, 'not_modified': 0}
+        self._revalidations_lock = threading.Lock()
+
+    @property
+    def youtube(self):
+        """
+        呼び出し元スレッド専用の YouTube Data API クライアントを返す（初回アクセス時に構築）
+        """
+        client = getattr(self._local, 'youtube', None)
+        if client is None:
+            http = self.transport.http() if self.transport is not None else None
+            client = build_service('youtube', 'v3', developerKey=self.api_key, http=http)
+            self._local.youtube = client
+        return client
+
+    def _execute(self, resource, method, bypass_cache=False, revalidate=False, **params):
+        """
+        APIリクエストを実行する。キャッシュに有効なレスポンスがあればそれを返し、
+        なければ API を呼び出して結果をキャッシュに保存する（bypass_cache=True の場合は常に API を呼び出す）。
+        revalidate=True の場合は常に API を呼び出すが、キャッシュ（期限切れを含む）に ETag があれば
+        If-None-Match を付けて送り、変更がなければ (304) キャッシュのレスポンスを返す。
+        残りクォータが不足している場合は期限切れのキャッシュで代用し、それもなければ
+        QuotaExceededError を送出する。
+        API の呼び出しはレート制限を守り、一時的なエラー (5xx/429) はバックオフしながらリトライする。
+        リトライしても失敗した場合やリトライできないエラーの場合は APIRequestError を送出する。
+        """
+        endpoint = f"{resource}.{method}"
+        cached = None
+        if revalidate:
+            cached = self.cache.get(endpoint, params, allow_stale=True)
+        elif not bypass_cache:
+            response = self.cache.get(endpoint, params)
+            if response is not None:
+                metrics.increment('youtube_cache_requests_total', endpoint=endpoint, result='hit')
+                return response
+            metrics.increment('youtube_cache_requests_total', endpoint=endpoint, result='miss')
+        etag = cached.get('etag') if cached else None
+        not_modified = False
+
+        if not self.quota_ledger.can_afford(endpoint):
+            # 上で既にキャッシュを参照しているため、ヒット数・ミス数には数えない
+            response = self.cache.get(endpoint, params, allow_stale=True, count=False)
+            if response is not None:
+                metrics.increment('youtube_cache_requests_total', endpoint=endpoint, result='stale')
+                return response
+            raise QuotaExceededError(f"クォータが不足しているため {endpoint} を呼び出せません。")
+
+        def attempt():
+            nonlocal not_modified
+            api_method = getattr(getattr(self.youtube, resource)(), method)
+            request = api_method(**params)
+            if etag:
+                request.headers['If-None-Match'] = etag
+            try:
+                response = request.execute()
+            except HttpError as e:
+                if etag and e.status_code == 304:
+                    # 変更がないため、本文のないレスポンスの代わりにキャッシュを使う
+                    self._count_revalidation(not_modified=True)
+                    metrics.increment('youtube_cache_requests_total', endpoint=endpoint, result='not_modified')
+                    not_modified = True
+                    return cached
+                raise
+            else:
+                if etag:
+                    self._count_revalidation(not_modified=False)
+                return response
+            finally:
+                # エラー応答でもクォータは消費されるため、呼び出した時点で記録する
+                units = self.quota_ledger.record(endpoint)
+                metrics.increment('youtube_api_calls_total', endpoint=endpoint)
+                metrics.increment('youtube_quota_units_total', units, endpoint=endpoint)
+
+        with metrics.span('youtube_api', endpoint=endpoint):
+            response = call_with_retry(attempt, self.rate_limiter, description=endpoint)
+        self.cache.set(endpoint, params, response)
+        if endpoint == 'videos.list' and not not_modified:
+            # API から取得した統計情報は、推移を追えるようにスナップショットとして保存する
+            # （304 の場合は前回から変わっていないため保存しない）
+            self.video_store.record_videos(response.get('items', []))
+        return response
+
+    def _count_revalidation(self, not_modified):
+        with self._revalidations_lock:
+            self._revalidations['requests'] += 1
+            self._revalidations['not_modified'] += int(not_modified)
+
+    def revalidation_stats(self):
+        """ETag による条件付きリクエストの送信数と、変更がなかった数を返す"""
+        with self._revalidations_lock:
+            return dict(self._revalidations)
 
     def get_channel_id_from_url(self, channel_url):
         """
         YouTubeチャンネルのURLからチャンネルIDを取得する
         """
-        try:
-            # URLからチャンネルハンドルを抽出 (例: @handle)
-            match = re.search(r'@([^/]+)', channel_url)
-            if not match:
-                return None
-            
-            handle = unquote(match.group(1))
-
-            # ハンドルを使ってチャンネル情報を取得
-            response = self.youtube.channels().list(
-                part='id',
-                forHandle=handle
-            ).execute()
-
-            if 'items' in response and len(response['items']) > 0:
-                return response['items'][0]['id']
-            else:
-                return None
-        except Exception as e:
-            print(f"URLからのチャンネルID取得中にエラーが発生しました: {e}")
-            return None
-        
-    def search_videos_by_channel(self, channel_url, order, max_results):
+        resolved = self.resolve_channel(channel_url)
+        return resolved[0] if resolved else None
+
+    def resolve_channel(self, channel_url):
         """
-        指定されたチャンネルURLの動画を検索する
+        チャンネルURLから (チャンネルID, アップロード再生リストID) を取得する。
+        解決結果はキャッシュされ、未解決の場合も channels().list 1回で両方を取得する。
         """
-        channel_id = self.get_channel_id_from_url(channel_url)
-        if not channel_id:
-            return None
+        return self.resolve_channels([channel_url])[0]
 
-        try:
-            # チャンネルのアップロード再生リストIDを取得
-            channel_response = self.youtube.channels().list(
-                part='contentDetails',
-                id=channel_id
-            ).execute()
+    def resolve_channels(self, channel_urls):
+        """
+        複数のチャンネルURLをまとめて解決し、入力と同じ順序で
+        (チャンネルID, アップロード再生リストID) または None のリストを返す。
+        チャンネルIDが分かっているものは id= に50件ずつまとめて問い合わせ、
+        ハンドルは1件ずつしか問い合わせられないため並行して解決する。
+        """
+        return self._resolve_channels(channel_urls)[0]
 
-            if not channel_response['items']:
-                return None
+    def _resolve_channels(self, channel_urls):
+        """
+        resolve_channels の結果と、問い合わせた channels().list の item（チャンネルID -> item）の組を返す。
+        item には snippet と statistics も含まれるため、チャンネルの統計情報を取得し直す必要はない
+        （解決結果のキャッシュを使ったチャンネルの item は含まれない）。
+        ハンドルの問い合わせが APIRequestError で失敗した場合は、そのチャンネルだけを未解決 (None) とする。
+        """
+        references = [parse_channel_reference(url) for url in channel_urls]
+        resolved = {}
+        items_by_id = {}
+        pending_ids = []
+        pending_handles = []
+        for reference in references:
+            if reference is None or reference in resolved:
+                continue
+            cached = self.channel_directory.get(*reference)
+            if cached:
+                resolved[reference] = cached
+            elif reference[0] == 'id':
+                if reference[1] not in pending_ids:
+                    pending_ids.append(reference[1])
+            elif reference not in pending_handles:
+                pending_handles.append(reference)
+
+        # チャンネルIDは50件ずつまとめて取得
+        id_batches = [pending_ids[i:i + 50] for i in range(0, len(pending_ids), 50)]
+        for items in fan_out(lambda batch: self._lookup_channels(id=','.join(batch)), id_batches):
+            for item in items:
+                resolved[('id', item['id'])] = self._store_channel('id', item['id'], item)
+                items_by_id[item['id']] = item
+
+        # ハンドルは並行して1件ずつ取得
+        for reference, items in zip(pending_handles, fan_out(self._lookup_handle, pending_handles)):
+            if items:
+                resolved[reference] = self._store_channel('handle', reference[1], items[0])
+                items_by_id[items[0]['id']] = items[0]
+
+        return [resolved.get(reference) if reference else None for reference in references], items_by_id
+
+    def _lookup_handle(self, reference):
+        """ハンドル1件を問い合わせる。API エラーの場合は他のチャンネルの解決を止めないよう、見つからなかったものとして扱う"""
+        try:
+            return self._lookup_channels(forHandle=reference[1])
+        except APIRequestError as e:
+            print(f"チャンネル @{reference[1]} を解決できませんでした: {e}")
+            return []
 
-            playlist_id = channel_response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+    def _lookup_channels(self, **params):
+        """
+        channels().list で ID とアップロード再生リストを、チャンネル一覧に使う snippet と statistics と合わせて1回で取得する。
+        API の呼び出しに失敗した場合は QuotaExceededError / APIRequestError をそのまま送出する。
+        """
+        response = self._execute('channels', 'list', part='snippet,contentDetails,statistics', **params)
+        return response.get('items', [])
 
-            # 再生リストから動画を取得
-            playlist_items_response = self.youtube.playlistItems().list(
-                part='snippet,contentDetails',
-                playlistId=playlist_id,
-                maxResults=max_results,
-            ).execute()
+    def _store_channel(self, kind, value, item):
+        channel_id = item['id']
+        uploads_playlist_id = item['contentDetails']['relatedPlaylists']['uploads']
+        self.channel_directory.set(kind, value, channel_id, uploads_playlist_id)
+        return (channel_id, uploads_playlist_id)
 
-            video_ids = [item['contentDetails']['videoId'] for item in playlist_items_response['items']]
+    def search_videos_by_channel(self, channel_url, order, max_results, full_crawl=False):
+        """
+        指定されたチャンネルURLの動画を検索する。チャンネルが見つからない場合は None を返し、
+        API の呼び出しに失敗した場合は QuotaExceededError / APIRequestError を送出する。
+        full_crawl=True の場合はアップロード済みの全動画を対象にし（max_results は無視）、
+        前回のクロール以降に追加された動画だけを新たに取得する。
+        """
+        # チャンネルIDとアップロード再生リストIDを取得
+        resolved = self.resolve_channel(channel_url)
+        if not resolved:
+            return None
+        return self._channel_videos(*resolved, order, max_results, full_crawl)
 
-            if not video_ids:
-                return []
+    def search_videos_by_channels(self, channel_urls, order, max_results, full_crawl=False, progress=None):
+        """
+        複数のチャンネルの動画をまとめて取得し、(入力と同じ順序の DataFrame または None のリスト,
+        チャンネルごとの統計情報の DataFrame) を返す。見つからなかったチャンネルの結果は None になる。
+        ハンドルの解決は並行して行い、チャンネルの統計情報は解決時の channels().list の応答から作る
+        （解決結果のキャッシュを使ったチャンネルの分だけ、50件ずつまとめて問い合わせる）。
+        各チャンネルのアップロード再生リストは CHANNEL_MAX_WORKERS 件ずつ並行して取得し、
+        API エラーで取得できなかったチャンネルの結果は空の DataFrame に partial の印を付けて返す。
+        同じチャンネルを指すURLが複数ある場合は、それらの結果は同じ DataFrame になる。
+        progress には (チャンネルURL, 取得件数) を受け取る関数を渡せる。
+        """
+        resolved, items_by_id = self._resolve_channels(channel_urls)
+        channel_ids = list(dict.fromkeys(entry[0] for entry in resolved if entry))
+        missing_ids = [channel_id for channel_id in channel_ids if channel_id not in items_by_id]
+        items_by_id.update((item['id'], item) for item in self.fetch_channel_statistics(missing_ids))
+        channels = build_channel_stats_frame([items_by_id[channel_id] for channel_id in channel_ids
+                                              if channel_id in items_by_id])
+
+        def fetch(entry):
+            channel_url, channel = entry
+            try:
+                videos = self._channel_videos(*channel, order, max_results, full_crawl)
+            except (QuotaExceededError, APIRequestError) as e:
+                print(f"チャンネル {channel_url} の動画を取得できませんでした: {e}")
+                videos = mark_partial(self._channel_frame([]), str(e))
+            if progress:
+                progress(channel_url, len(videos))
+            return videos
+
+        # 同じチャンネルを指す複数のURLは1回だけ取得し、同じ DataFrame を返す
+        first_urls = {}
+        for channel_url, channel in zip(channel_urls, resolved):
+            if channel is not None:
+                first_urls.setdefault(channel[0], (channel_url, channel))
+        fetched = dict(zip(first_urls, fan_out(fetch, list(first_urls.values()), max_workers=CHANNEL_MAX_WORKERS)))
+        results = [fetched[channel[0]] if channel is not None else None for channel in resolved]
+        return results, channels
+
+    def fetch_channel_statistics(self, channel_ids):
+        """
+        チャンネルの snippet と statistics を50件ずつまとめて取得し、channels().list の item のリストを返す
+        """
+        batches = [channel_ids[i:i + 50] for i in range(0, len(channel_ids), 50)]
+        responses = fan_out(
+            lambda batch: self._execute('channels', 'list', part='snippet,statistics', id=','.join(batch)), batches
+        )
+        return [item for response in responses for item in response.get('items', [])]
+
+    def _channel_videos(self, channel_id, playlist_id, order, max_results, full_crawl):
+        """解決済みのチャンネルの動画を取得する（search_videos_by_channel を参照）"""
+        if full_crawl:
+            videos_data = self._crawl_channel_uploads(channel_id, playlist_id)
+            return self._sort_channel_videos(videos_data, order)
+
+        # 再生リストから動画を取得
+        playlist_items_response = self._execute(
+            'playlistItems', 'list',
+            part='snippet,contentDetails',
+            playlistId=playlist_id,
+            maxResults=max_results,
+        )
+
+        video_ids = [item['contentDetails']['videoId'] for item in playlist_items_response['items']]
+
+        if not video_ids:
+            return self._channel_frame([])
+
+        # 動画の詳細情報を取得
+        videos_response = self._execute(
+            'videos', 'list',
+            part="snippet,statistics,contentDetails",
+            id=",".join(video_ids)
+        )
+
+        # データを整形
+        videos_data = self._channel_frame(records_from_items(videos_response['items']))
+
+        return self._sort_channel_videos(videos_data, order)
+
+    def _sort_channel_videos(self, videos_data, order):
+        """再生回数順、新着順でソート"""
+        if order == 'viewCount':
+            videos_data = videos_data.sort_values(by='再生回数', ascending=False, na_position='last', ignore_index=True)
+        elif order == 'date':
+            videos_data = videos_data.sort_values(by='公開日', ascending=False, na_position='last', ignore_index=True)
+        return videos_data
 
-            # 動画の詳細情報を取得
-            videos_response = self.youtube.videos().list(
-                part="snippet,statistics,contentDetails",
-                id=",".join(video_ids)
-            ).execute()
+    def _iter_playlist_items(self, playlist_id, bypass_cache=False):
+        """
+        再生リストの項目を1ページ（最大50件）ずつ取得しながら、1件ずつ順に返すジェネレーター。
+        呼び出し側が途中で読むのをやめれば、それ以降のページは取得しない。
+        """
+        page_token = None
+        while True:
+            response = self._execute(
+                'playlistItems', 'list',
+                bypass_cache=bypass_cache,
+                part='contentDetails',
+                playlistId=playlist_id,
+                maxResults=50,
+                pageToken=page_token,
+            )
+            yield from response.get('items', [])
 
-            # データを整形
-            videos_data = self._parse_videos_data(videos_response['items'])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
 
-            # 再生回数順、新着順でソート
-            if order == 'viewCount':
-                videos_data = sorted(videos_data, key=lambda x: int(x.get('再生回数', 0)), reverse=True)
-            elif order == 'date':
-                 videos_data = sorted(videos_data, key=lambda x: x.get('公開日', ''), reverse=True)
+    def _crawl_channel_uploads(self, channel_id, playlist_id):
+        """
+        アップロード再生リストを新しい順に読み進め、前回のクロールで記録した最新の動画に
+        到達した時点で打ち切る。新しい動画を保存した後、保存済みの全動画の統計情報を
+        50件ずつまとめて取得し直す。
+        """
+        newest_video_id, newest_published_at = self.crawl_store.get_high_water_mark(channel_id)
+
+        new_videos = []
+        # 新着を確実に検出するため、再生リストはキャッシュを使わずに読む
+        for item in self._iter_playlist_items(playlist_id, bypass_cache=True):
+            video_id = item['contentDetails']['videoId']
+            published_at = item['contentDetails'].get('videoPublishedAt')
+            if video_id == newest_video_id:
+                break
+            # 記録済みの動画が削除されている場合に備え、公開日時でも打ち切りを判定する
+            if newest_published_at and published_at and published_at < newest_published_at:
+                break
+            new_videos.append((video_id, published_at))
+
+        if new_videos:
+            self.crawl_store.add_videos(channel_id, new_videos, newest=new_videos[0])
+        print(f"チャンネル {channel_id} のクロール: 新規動画 {len(new_videos)} 件")
+
+        # 保存済みの動画の詳細（統計情報を含む）をキャッシュを使わずに50件ずつ取得
+        video_ids = self.crawl_store.get_video_ids(channel_id)
+        batches = [video_ids[i:i + 50] for i in range(0, len(video_ids), 50)]
+        records = []
+        error = None
+        for batch_records, batch_error in fan_out(lambda batch: self._fetch_video_details(batch, bypass_cache=True), batches):
+            if batch_error:
+                error = batch_error
+                continue
+            records.extend(batch_records)
+
+        return mark_partial(self._channel_frame(records), error)
+
+    @staticmethod
+    def _channel_frame(records):
+        """
+        動画の VideoRecord のリストを、チャンネル検索の列構成の型付きの DataFrame に整形する
+        """
+        return VideoBatch(records).channel_frame()
 
+    # メソッドの定義に新しい引数を追加
+    def search_videos_data(self, query, video_type='any', max_results=20, order='relevance', published_after=None, published_before=None):
+        return self.search_videos_data_multi(
+            [query],
+            video_type=video_type,
+            max_results=max_results,
+            order=order,
+            published_after=published_after,
+            published_before=published_before
+        )[0]
+
+    def search_videos_data_multi(self, queries, video_type='any', max_results=20, order='relevance', published_after=None, published_before=None, progress=None, page_budget=SEARCH_PAGE_BUDGET):
+        """
+        複数の検索キーワードをまとめて検索し、キーワードごとの動画データ (DataFrame) を入力と同じ順序で返す。
+        各ラウンドで全キーワードの検索ページを並行取得し、集めた動画IDを重複排除した上で
+        50件ずつの videos().list 呼び出しにまとめて詳細を取得する。
+        progress を指定すると、ラウンドごとに progress(キーワード, 取得済み件数) が呼ばれる。
+
+        動画タイプで絞り込む場合は、search.list の videoDuration で絞り込めるものはサーバー側でも絞り込み、
+        キーワードごとに観測した採用率（条件に合った割合）から次のページで要求する件数を決める。
+        ページ数の上限 page_budget（QuotaScheduler.plan_search が承認したもの）まで取得し、
+        観測した採用率では1ページで条件に合う動画がほとんど増えない見込みの場合は早めに打ち切る。
+        取得件数と採用件数などは、各 DataFrame の attrs['fetch_stats'] に記録する。
+        """
+        filtered = video_type in ('short', 'long')
+        video_duration = server_duration_filter(video_type)
+        # videos には条件に合った動画の VideoRecord を溜め、最後にまとめて DataFrame に変換する
+        states = [{'query': q, 'videos': [], 'seen': set(), 'page_token': None, 'done': False, 'error': None,
+                   'pages': 0, 'fetched': 0, 'stop_reason': None} for q in queries]
+        # このリクエスト内で取得済みの動画詳細（動画ID -> VideoRecord。複数のキーワードで同じものを共有する）
+        details = {}
 
-            return videos_data
+        # 取得したい件数に達するまでループ
+        while True:
+            active = [state for state in states if not state['done'] and len(state['videos']) < max_results]
+            if not active:
+                break
 
-        except Exception as e:
-            print(f"チャンネル動画の検索中にエラーが発生しました: {e}")
-            return None
+            # 1. 各キーワードの検索結果ページを並行して取得（要求する件数は、それまでの採用率から決める）
+            pages = fan_out(
+                lambda state: self._search_page(
+                    state, next_page_size(max_results - len(state['videos']), state['fetched'], len(state['videos']), filtered),
+                    order, published_after, published_before, video_duration
+                ),
+                active
+            )
+
+            # 2. 未取得の動画IDを重複なく集め、50件単位でまとめて詳細を取得
+            pending_ids = []
+            for video_ids in pages:
+                for video_id in video_ids:
+                    if video_id not in details and video_id not in pending_ids:
+                        pending_ids.append(video_id)
+
+            batches = [pending_ids[i:i + 50] for i in range(0, len(pending_ids), 50)]
+            failed_ids = {}
+            for batch, (records, error) in zip(batches, fan_out(self._fetch_video_details, batches)):
+                if error:
+                    failed_ids.update(dict.fromkeys(batch, error))
+                    continue
+                for record in records:
+                    details[record.video_id] = record
+
+            # 3. 取得した詳細を各キーワードの結果に振り分け、動画タイプで絞り込む
+            for state, video_ids in zip(active, pages):
+                failed = [failed_ids[video_id] for video_id in video_ids if video_id in failed_ids]
+                if failed:
+                    # 詳細を取得できなかった動画があるため、このキーワードの結果は不完全になる
+                    state['done'] = True
+                    state['error'] = failed[0]
+                for video_id in video_ids:
+                    record = details.get(video_id)
+                    if record is None or video_id in state['seen']:
+                        continue
+                    state['seen'].add(video_id)
+                    state['fetched'] += 1
 
-    def _parse_videos_data(self, items):
-        """
-        APIレスポンスから動画データを抽出し、整形する
-        """
-        videos_data = []
-        for item in items:
-            video_id = item['id']
-            snippet = item['snippet']
-            statistics = item.get('statistics', {})
-            content_details = item.get('contentDetails', {})
-            
-            # 日付形式を変換
-            published_at_str = snippet.get('publishedAt')
-            published_at_dt = datetime.strptime(published_at_str, '%Y-%m-%dT%H:%M:%SZ')
-            formatted_date = published_at_dt.strftime('%Y/%m/%d')
-
-            video_data = {
-                '動画タイトル': snippet.get('title'),
-                '動画ID': video_id,
-                'チャンネル名': snippet.get('channelTitle'),
-                'チャンネルID': snippet.get('channelId'),
-                '公開日': formatted_date,
-                '再生回数': statistics.get('viewCount'),
-                '高評価数': statistics.get('likeCount'),
-                'コメント数': statistics.get('commentCount'),
-                '動画説明文': snippet.get('description'),
-                'サムネイルURL': snippet.get('thumbnails', {}).get('high', {}).get('url'),
-                '動画の長さ': content_details.get('duration'),
-                '動画リンク': f"https://www.youtube.com/watch?v={video_id}",
-                'チャンネルリンク': f"https://www.youtube.com/channel/{snippet.get('channelId')}"
+                    # フィルタリング条件
+                    if video_type == 'any' or \
+                       (video_type == 'short' and record.is_short) or \
+                       (video_type == 'long' and not record.is_short):
+                        state['videos'].append(record)
+
+                # 4. まだ足りない場合、残りのページで集められる見込みがなければ打ち切る
+                remaining = max_results - len(state['videos'])
+                if not state['done'] and remaining > 0:
+                    reason = stop_reason(remaining, state['fetched'], len(state['videos']), state['pages'], filtered, page_budget)
+                    if reason:
+                        state['done'] = True
+                        state['stop_reason'] = reason
+
+                if progress:
+                    progress(state['query'], min(len(state['videos']), max_results))
+
+        results = []
+        for state in states:
+            records = state['videos'][:max_results]
+            self.video_store.link_query(state['query'], [record.video_id for record in records])
+            frame = mark_partial(VideoBatch(records).search_frame(), state['error'])
+            frame.attrs['fetch_stats'] = self._fetch_stats(state, video_duration)
+            results.append(frame)
+        return results
+
+    @staticmethod
+    def _fetch_stats(state, video_duration):
+        """1キーワード分の、検索したページ数・詳細を取得した件数・条件に合った件数などをまとめる"""
+        kept = len(state['videos'])
+        stats = {
+            'pages': state['pages'],
+            'fetched': state['fetched'],
+            'kept': kept,
+            'keep_rate': round(kept / state['fetched'], 3) if state['fetched'] else None,
+            'video_duration': video_duration,
+            'stop_reason': state['stop_reason'],
+        }
+        metrics.increment('youtube_search_items_total', kept, result='kept')
+        metrics.increment('youtube_search_items_total', state['fetched'] - kept, result='discarded')
+        if state['fetched'] != kept or state['stop_reason']:
+            print(f"検索キーワード '{state['query']}': {stats['pages']}ページ, 取得 {stats['fetched']}件, "
+                  f"採用 {kept}件" + (f", 打ち切り: {state['stop_reason']}" if state['stop_reason'] else ''))
+        return stats
+
+    def _search_page(self, state, page_size, order, published_after, published_before, video_duration=None):
+        """
+        1キーワード分の検索結果を1ページ（最大 page_size 件）取得し、動画IDのリストを返す。
+        video_duration を指定した場合は、search.list の videoDuration でサーバー側でも絞り込む。
+        最終ページに達した場合やエラー時は state['done'] を立て、エラー時は state['error'] にその内容を記録する。
+        """
+        try:
+            # APIに渡すパラメータを辞書として定義
+            search_params = {
+                'q': state['query'],
+                'type': 'video',
+                'part': 'id,snippet',
+                'maxResults': page_size,
+                'order': order,
+                'pageToken': state['page_token']
             }
-            videos_data.append(video_data)
-        return videos_data
+            if video_duration:
+                search_params['videoDuration'] = video_duration
 
-    def _parse_iso8601_duration(self, duration_iso):
-        duration_seconds = 0
-        if 'PT' not in duration_iso:
-            return 0
-        temp_duration = duration_iso.replace('PT', '')
-        if 'H' in temp_duration:
-            parts = temp_duration.split('H')
-            try:
-                duration_seconds += int(parts[0]) * 3600
-            except ValueError: pass
-            temp_duration = parts[1] if len(parts) > 1 else ''
-        if 'M' in temp_duration:
-            parts = temp_duration.split('M')
-            try:
-                duration_seconds += int(parts[0]) * 60
-            except ValueError: pass
-            temp_duration = parts[1] if len(parts) > 1 else ''
-        if 'S' in temp_duration:
-            parts = temp_duration.split('S')
-            try:
-                duration_seconds += int(parts[0])
-            except ValueError: pass
-        return duration_seconds
+            # 期間指定があれば、パラメータに追加（RFC 3339形式に変換）
+            if published_after and published_after.strip():
+                search_params['publishedAfter'] = f"{published_after.strip()}T00:00:00Z"
+            if published_before and published_before.strip():
+                search_params['publishedBefore'] = f"{published_before.strip()}T23:59:59Z"
 
-    # メソッドの定義に新しい引数を追加
-    def search_videos_data(self, query, video_type='any', max_results=20, order='relevance', published_after=None, published_before=None):
-        video_data = []
-        next_page_token = None
-        
-        # 取得したい件数に達するまでループ
-        while len(video_data) < max_results:
-            # 1回のリクエストで取得する件数を計算 (API上限は50)
-            num_to_fetch = min(max_results - len(video_data), 50)
+            # APIを呼び出し
+            search_response = self._execute('search', 'list', **search_params)
 
-            try:
-                # APIに渡すパラメータを辞書として定義
-                search_params = {
-                    'q': query,
-                    'type': 'video',
-                    'part': 'id,snippet',
-                    'maxResults': num_to_fetch,
-                    'order': order,
-                    'pageToken': next_page_token
-                }
-
-                # 期間指定があれば、パラメータに追加（RFC 3339形式に変換）
-                if published_after and published_after.strip():
-                    search_params['publishedAfter'] = f"{published_after.strip()}T00:00:00Z"
-                if published_before and published_before.strip():
-                    search_params['publishedBefore'] = f"{published_before.strip()}T23:59:59Z"
-
-                # APIを呼び出し
-                search_response = self.youtube.search().list(**search_params).execute()
-
-                video_ids = [item['id']['videoId'] for item in search_response.get('items', []) if item['id']['kind'] == 'youtube#video']
-
-                if not video_ids:
-                    break
-
-                videos_response = self.youtube.videos().list(
-                    id=','.join(video_ids),
-                    part='snippet,contentDetails,statistics'
-                ).execute()
-
-                for video_item in videos_response.get('items', []):
-                    duration_iso = video_item['contentDetails'].get('duration', 'PT0S')
-                    duration_seconds = self._parse_iso8601_duration(duration_iso)
-                    is_short = "Short" if duration_seconds <= 60 else "Long"
+        except (QuotaExceededError, APIRequestError) as e:
+            print(f"APIエラーが発生しました: {e}")
+            state['done'] = True
+            state['error'] = str(e)
+            return []
 
-                    # フィルタリング条件
-                    if video_type == 'any' or \
-                       (video_type == 'short' and is_short == "Short") or \
-                       (video_type == 'long' and is_short == "Long"):
-                        
-                        video_data.append({
-                            'タイトル': video_item['snippet']['title'],
-                            'URL': f"https://www.youtube.com/watch?v={video_item['id']}",
-                            'チャンネル名': video_item['snippet']['channelTitle'],
-                            '公開日時': video_item['snippet']['publishedAt'],
-                            '再生回数': video_item['statistics'].get('viewCount', 'N/A'),
-                            '高評価数': video_item['statistics'].get('likeCount', 'N/A'),
-                            'コメント数': video_item['statistics'].get('commentCount', 'N/A'),
-                            '動画説明文': video_item['snippet'].get('description', 'N/A'),
-                            'サムネイルURL': video_item['snippet']['thumbnails'].get('high', {}).get('url', 'N/A'),
-                            '動画タイプ': is_short
-                        })
-
-                next_page_token = search_response.get('nextPageToken')
-                if not next_page_token:
-                    break # 次のページがなければ終了
+        state['pages'] += 1
+        video_ids = [item['id']['videoId'] for item in search_response.get('items', []) if item['id']['kind'] == 'youtube#video']
 
-            except HttpError as e:
-                print(f"APIエラーが発生しました: {e}")
-                break
-            except Exception as e:
-                print(f"予期せぬエラーが発生しました: {e}")
-                break
+        state['page_token'] = search_response.get('nextPageToken')
+        if not video_ids or not state['page_token']:
+            state['done'] = True # 次のページがなければ終了
+
+        return video_ids
 
-        return video_data[:max_results]
\ No newline at end of file
+    def refresh_statistics(self, video_ids=None, channel_id=None, query=None):
+        """
+        既に分かっている動画の統計情報だけを取得し直し、search_videos_data と同じ列構成の DataFrame を返す。
+        対象は video_ids、または保存済みの channel_id / query の動画で指定する。
+        search.list は使わず、videos().list(part=statistics) を50件ずつ並行して呼び出す（1回1ユニット）。
+        前回のレスポンスの ETag で条件付きリクエストを送るため、変更がなければ本文は転送されない。
+        タイトルなどは保存済みのメタデータを使い、メタデータのない動画だけは snippet なども含めて取得する。
+        """
+        if video_ids is None:
+            if channel_id is not None:
+                video_ids = self.video_store.video_ids_for_channel(channel_id) + self.crawl_store.get_video_ids(channel_id)
+            elif query is not None:
+                video_ids = self.video_store.video_ids_for_query(query)
+            else:
+                raise ValueError("video_ids、channel_id、query のいずれかを指定してください。")
+        video_ids = list(dict.fromkeys(video_ids))
+
+        records = self.video_store.metadata_records(video_ids)
+        # 同じ動画の集合が同じリクエスト（同じキャッシュと ETag）になるよう、IDを並べ替えてから50件ずつに分ける
+        known_ids = sorted(records)
+        unknown_ids = [video_id for video_id in video_ids if video_id not in records]
+        known_batches = [known_ids[i:i + 50] for i in range(0, len(known_ids), 50)]
+        unknown_batches = [unknown_ids[i:i + 50] for i in range(0, len(unknown_ids), 50)]
+
+        error = None
+        fetched = set()
+        for batch_items, batch_error in fan_out(self._fetch_statistics, known_batches):
+            if batch_error:
+                error = batch_error
+                continue
+            for item in batch_items:
+                records[item['id']].update_statistics(item.get('statistics', {}))
+                fetched.add(item['id'])
+        for batch_records, batch_error in fan_out(self._fetch_video_details, unknown_batches):
+            if batch_error:
+                error = batch_error
+                continue
+            for record in batch_records:
+                records[record.video_id] = record
+                fetched.add(record.video_id)
+
+        # 削除された動画など、取得できなかった動画は結果に含めない
+        refreshed = [records[video_id] for video_id in video_ids if video_id in fetched]
+        return mark_partial(VideoBatch(refreshed).search_frame(), error)
+
+    def _fetch_statistics(self, video_ids):
+        """
+        最大50件の動画IDについて統計情報だけを ETag で再検証しながら取得し、(item のリスト, None) を返す。
+        エラー時は (None, エラーメッセージ) を返す。
+        """
+        try:
+            response = self._execute('videos', 'list', revalidate=True, id=','.join(video_ids), part='statistics')
+            return response.get('items', []), None
+        except (QuotaExceededError, APIRequestError) as e:
+            print(f"APIエラーが発生しました: {e}")
+            return None, str(e)
+
+    def _fetch_video_details(self, video_ids, bypass_cache=False):
+        """
+        最大50件の動画IDについて詳細情報を1回の videos().list で取得し、(VideoRecord のリスト, None) を返す。
+        エラー時は (None, エラーメッセージ) を返す。
+        """
+        try:
+            videos_response = self._execute(
+                'videos', 'list',
+                bypass_cache=bypass_cache,
+                id=','.join(video_ids),
+                part='snippet,contentDetails,statistics'
+            )
+            return records_from_items(videos_response.get('items', [])), None
+        except (QuotaExceededError, APIRequestError) as e:
+            print(f"APIエラーが発生しました: {e}")
+            return None, str(e)
@@ -0,0 +1,62 @@
+# zip_stream.py
+
+import io
+import zipfile
+
+from app_modules import metrics
+
+# CSVを書き出す際の1回あたりの行数
+CSV_CHUNK_ROWS = 1000
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    ZipFile の書き込み先として使う、シーク不可の出力先。
+    書き込まれたバイト列を溜めておき、drain() で取り出すたびに空にする。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def stream_csv_zip(entries, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    (ファイル名, DataFrame) の iterable を受け取り、各DataFrameをCSVとして格納した
+    ZIPファイルのバイト列を少しずつ返すジェネレーター。
+    CSVは chunk_rows 行ずつ書き出して直ちに返すため、全体をメモリ上に組み立てることはない。
+    """
+    sink = _ChunkSink()
+    # シーク不可の出力先なので、サイズはデータ記述子に書かれる（大きなファイルに備えて ZIP64 を使う）
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        text = None
+        try:
+            for filename, df in entries:
+                entry = zip_file.open(filename, 'w', force_zip64=True)
+                text = io.TextIOWrapper(entry, encoding='utf-8-sig', newline='')
+                # 空のDataFrameでもヘッダー行は書き出す
+                for start in range(0, max(len(df), 1), chunk_rows):
+                    # yield をまたぐと呼び出し元の計測に混ざるため、書き出しの部分だけを計測する
+                    with metrics.span('csv_serialize'):
+                        df.iloc[start:start + chunk_rows].to_csv(text, index=False, header=(start == 0))
+                        text.flush()
+                    yield from sink.drain()
+                text.close()
+                yield from sink.drain()
+        finally:
+            # クライアントの切断などで途中で終了した場合も、書き込み中のエントリを閉じてから ZIP を閉じる
+            if text is not None and not text.closed:
+                text.close()
+    # 中央ディレクトリ（ZIPの末尾）を返す
+    yield from sink.drain()
@@ -0,0 +1,234 @@
+# e2e.py
+#
+# ローカルの代替サーバー (fake_server.py) と FakeGeminiAPI を使って、/search をエンドツーエンドで計測するベンチマーク。
+# 実際の API キーやクォータは使わない。
+#
+# 使い方: python benchmarks/e2e.py [--requests 100] [--concurrency 4] [--latency 0.05]
+#                                  [--mix query-csv=4,genre-csv=2,channel-csv=2,query-sheets=1,genre-sheets=1]
+#
+# シナリオごとのレイテンシの分位点、スループット、API 呼び出し回数、最大メモリ使用量を表示する。
+# キャッシュなどの SQLite ファイルは一時ディレクトリに作成されるため、毎回キャッシュが空の状態から始まる。
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = 'query-csv=4,genre-csv=2,channel-csv=2,query-sheets=1,genre-sheets=1'
+
+
+def make_form(scenario, rng, distinct):
+    """シナリオ名（入力の種類-出力形式）から /search のフォームを作成する"""
+    kind, output = scenario.split('-')
+    n = rng.randrange(distinct)
+    form = {'video_type': rng.choice(['any', 'any', 'short', 'long']), 'order': rng.choice(['relevance', 'viewCount', 'date'])}
+    if kind == 'query':
+        form.update(query=f"ベンチマーク {n}", max_results=str(rng.choice([20, 50, 100])))
+    elif kind == 'genre':
+        form.update(genre=f"ジャンル{n}", max_results=str(rng.choice([20, 50])))
+    elif kind == 'channel':
+        form.update(channel_url=f"https://www.youtube.com/@bench{n}", max_results=str(rng.choice([20, 50])),
+                    full_crawl=rng.choice(['on', '']))
+    else:
+        raise ValueError(f"不明なシナリオです: {scenario}")
+    if output == 'sheets':
+        form['use_sheets_integration'] = 'on'
+    return form
+
+
+def percentile(values, q):
+    """最近傍順位法による分位点"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/search のエンドツーエンドのベンチマーク')
+    parser.add_argument('--requests', type=int, default=60, help='計測するリクエスト数')
+    parser.add_argument('--concurrency', type=int, default=4, help='同時に送るリクエスト数')
+    parser.add_argument('--warmup', type=int, default=0, help='計測前に送るリクエスト数')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='シナリオと重み (例: query-csv=4,channel-sheets=1)')
+    parser.add_argument('--distinct', type=int, default=20, help='シナリオごとの入力のバリエーション数（小さいほどキャッシュが効く）')
+    parser.add_argument('--latency', type=float, default=0.05, help='代替サーバーの1リクエストあたりの遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='代替サーバーが 503 を返す割合')
+    parser.add_argument('--gemini-latency', type=float, default=0.5, help='キーワード生成の遅延（秒）')
+    parser.add_argument('--ai-analysis', action='store_true', help='指標による分析に加えて (合成の) AI 分析も行う')
+    parser.add_argument('--analysis-latency', type=float, default=1.0, help='AI によるデータ分析の遅延（秒）')
+    parser.add_argument('--no-overlap', action='store_true', help='分析と出力を並行させずに順に実行する（比較用）')
+    parser.add_argument('--rate-limit', type=float, help='YouTube API 呼び出しの上限（回/秒）。省略時はアプリの既定値')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tracemalloc', action='store_true', help='Python のメモリ割り当ての最大値も計測する（遅くなる）')
+    parser.add_argument('--json', help='結果を JSON で書き出すファイル')
+    parser.add_argument('--verbose', action='store_true', help='計測中のアプリのログも表示する')
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    from fake_server import start_server
+    fake_server, apis = start_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+    host = f"127.0.0.1:{fake_server.server_port}"
+
+    # アプリのモジュールを読み込む前に、接続先と SQLite ファイルの場所を設定する
+    workdir = tempfile.mkdtemp(prefix='youtube_bench_')
+    os.chdir(workdir)
+    os.environ.update({
+        'YOUTUBE_EMULATOR_HOST': host,
+        'SHEETS_EMULATOR_HOST': host,
+        'YOUTUBE_API_KEY': 'benchmark',
+        'YOUTUBE_DAILY_QUOTA': str(10 ** 9),
+    })
+    if args.ai_analysis:
+        os.environ['GEMINI_ANALYSIS_ENABLED'] = '1'
+    if args.no_overlap:
+        os.environ['PIPELINE_OVERLAP'] = '0'
+    if args.rate_limit:
+        os.environ['YOUTUBE_RATE_LIMIT'] = str(args.rate_limit)
+        os.environ['YOUTUBE_RATE_BURST'] = str(max(1, int(args.rate_limit)))
+
+    import requests
+    from werkzeug.serving import make_server
+    from fake_gemini import FakeGeminiAPI
+    from app_modules import clients, metrics
+    from app_modules.app import app
+
+    gemini = FakeGeminiAPI(latency=args.gemini_latency, analysis_latency=args.analysis_latency)
+    clients.register_client('gemini', gemini)
+
+    if not args.verbose:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    app_server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=app_server.serve_forever, daemon=True).start()
+    search_url = f"http://127.0.0.1:{app_server.server_port}/search"
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    plan = [rng.choices(list(mix), weights=list(mix.values()))[0] for _ in range(args.warmup + args.requests)]
+    forms = [(scenario, make_form(scenario, rng, args.distinct)) for scenario in plan]
+    local = threading.local()
+
+    def send(item):
+        scenario, form = item
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        response = session.post(search_url, data=form)
+        body = response.content
+        elapsed = time.perf_counter() - start
+        ok = response.status_code == 200 and (
+            response.headers.get('Content-Type') == 'application/zip' or 'エクスポートしました'.encode() in body
+        )
+        return scenario, elapsed, ok
+
+    # アプリが print するログは、--verbose を指定しない限り表示しない
+    log_target = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with log_target, ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(send, forms[:args.warmup]))
+        apis.reset()
+        metrics.REGISTRY.reset()
+        if args.tracemalloc:
+            tracemalloc.start()
+        started = time.perf_counter()
+        results = list(executor.map(send, forms[args.warmup:]))
+        wall = time.perf_counter() - started
+
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    youtube = clients.get_youtube_client()
+
+    scenarios = {}
+    for scenario, elapsed, ok in results:
+        entry = scenarios.setdefault(scenario, {'latencies': [], 'errors': 0})
+        entry['latencies'].append(elapsed)
+        entry['errors'] += 0 if ok else 1
+
+    # 処理段階ごとに、ラベル（エンドポイントなど）をまとめた件数と合計時間
+    stages = {}
+    for labels, (count, total) in metrics.REGISTRY.histogram_totals('stage_duration_seconds').items():
+        entry = stages.setdefault(dict(labels)['stage'], {'count': 0, 'total_seconds': 0.0})
+        entry['count'] += count
+        entry['total_seconds'] += total
+
+    # 出力形式ごとの、検索から出力までの所要時間（バックグラウンドジョブと Sheets の場合のみ記録される）
+    pipelines = {
+        dict(labels)['output']: {'count': count, 'mean_ms': total / count * 1000}
+        for labels, (count, total) in metrics.REGISTRY.histogram_totals('pipeline_duration_seconds').items() if count
+    }
+
+    report = {
+        'requests': len(results),
+        'concurrency': args.concurrency,
+        'wall_seconds': wall,
+        'throughput_rps': len(results) / wall if wall else None,
+        'scenarios': {
+            name: {
+                'count': len(entry['latencies']),
+                'errors': entry['errors'],
+                'p50_ms': percentile(entry['latencies'], 50) * 1000,
+                'p90_ms': percentile(entry['latencies'], 90) * 1000,
+                'p99_ms': percentile(entry['latencies'], 99) * 1000,
+                'max_ms': max(entry['latencies']) * 1000,
+            } for name, entry in sorted(scenarios.items())
+        },
+        'pipelines': pipelines,
+        'stages': dict(sorted(stages.items(), key=lambda entry: -entry[1]['total_seconds'])),
+        'api_calls': apis.stats()['calls'],
+        'gemini_calls': dict(gemini.calls),
+        'quota_units': youtube.quota_ledger.used_today(),
+        'youtube_cache': youtube.cache.stats(),
+        'http_transport': clients.get_http_transport().stats(),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'traced_peak_mb': traced_peak / 1024 / 1024 if traced_peak is not None else None,
+    }
+
+    print(f"\nリクエスト数 {report['requests']}（同時 {args.concurrency}）: {wall:.2f} 秒, {report['throughput_rps']:.2f} req/s")
+    # 全角文字は2桁分で表示されるため、その分だけ幅を詰める
+    print(f"{'シナリオ':<14}{'件数':>4}{'失敗':>4}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, entry in report['scenarios'].items():
+        print(f"{name:<18}{entry['count']:>6}{entry['errors']:>6}{entry['p50_ms']:>10.0f}{entry['p90_ms']:>10.0f}"
+              f"{entry['p99_ms']:>10.0f}{entry['max_ms']:>10.0f}")
+    if pipelines:
+        print("検索から出力までの平均所要時間:",
+              ', '.join(f"{name} {entry['mean_ms']:.0f} ms ({entry['count']}件)" for name, entry in sorted(pipelines.items())))
+    print("処理段階ごとの合計時間（並行した処理は重複して数える）:",
+          ', '.join(f"{name} {entry['total_seconds']:.2f}s" for name, entry in report['stages'].items()))
+    print("API 呼び出し回数:", ', '.join(f"{name} {count}" for name, count in sorted(report['api_calls'].items())))
+    print("Gemini 呼び出し回数:", ', '.join(f"{name} {count}" for name, count in report['gemini_calls'].items()))
+    print(f"クォータ消費: {report['quota_units']} ユニット, キャッシュヒット率: {report['youtube_cache']['hit_rate']:.1%}, "
+          f"接続の再利用率: {report['http_transport']['reuse_rate']:.1%}")
+    print(f"最大メモリ使用量 (RSS): {report['peak_rss_mb']:.1f} MB"
+          + (f", Python の割り当ての最大値: {report['traced_peak_mb']:.1f} MB" if traced_peak is not None else ''))
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    app_server.shutdown()
+    fake_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# fake_gemini.py
+#
+# GeminiAPI の代わりにベンチマークで使うクライアント。
+# モデルは呼び出さず、一定の遅延の後に合成のキーワードと分析結果を返す。
+# 分析では実際のクライアントと同じくプロンプトを組み立てるため、その処理時間は計測に含まれる。
+
+import time
+import hashlib
+import threading
+
+from app_modules.prompt_builder import build_analysis_prompt
+
+KEYWORD_COUNT = 5
+
+
+class FakeGeminiAPI:
+    def __init__(self, latency=0.5, analysis_latency=2.0):
+        self.latency = latency
+        self.analysis_latency = analysis_latency
+        self._lock = threading.Lock()
+        self.calls = {'generate_keywords': 0, 'analyze_video_data': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def generate_keywords(self, genre):
+        self._count('generate_keywords')
+        time.sleep(self.latency)
+        seed = hashlib.sha1(genre.encode('utf-8')).hexdigest()[:6]
+        return [f"{genre} {seed} キーワード{i + 1}" for i in range(KEYWORD_COUNT)]
+
+    def analyze_video_data(self, df):
+        self._count('analyze_video_data')
+        prompt = build_analysis_prompt(df)
+        time.sleep(self.analysis_latency)
+        return f"合成の分析結果です（動画 {len(df)} 件、プロンプト {len(prompt)} 文字）。"
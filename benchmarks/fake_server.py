@@ -0,0 +1,363 @@
+# fake_server.py
+#
+# YouTube Data API と Google Sheets API の代わりに、合成データを返すローカルサーバー。
+# アプリが使うエンドポイント（search / videos / channels / playlistItems.list と
+# spreadsheets.create / values.batchUpdate / values.update / batchUpdate / get）だけを実装する。
+#
+# 単体での起動: python benchmarks/fake_server.py --port 8765 --latency 0.05
+# アプリの接続先を切り替えるには次の環境変数を設定する（Sheets は認証なしで接続される）:
+#   YOUTUBE_EMULATOR_HOST=127.0.0.1:8765
+#   SHEETS_EMULATOR_HOST=127.0.0.1:8765
+#
+# YouTube のレスポンスには本文から決まる etag を付け、If-None-Match が一致すれば本文なしの 304 を返す。
+# 呼び出し回数は GET /_stats で取得でき、POST /_reset で初期化できる。
+
+import argparse
+import base64
+import collections
+import functools
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# 1つの検索キーワードで見つかる動画の数と、1チャンネルのアップロード数
+SEARCH_RESULTS_PER_QUERY = 500
+UPLOADS_PER_CHANNEL = 300
+# 合成する公開日時の基準
+BASE_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+DURATIONS = ['PT15S', 'PT45S', 'PT59S', 'PT1M30S', 'PT4M12S', 'PT9M3S', 'PT23M', 'PT1H2M5S']
+# search.list の videoDuration の区分 (short: 4分未満, medium: 4〜20分, long: 20分超)
+DURATION_CLASSES = {'PT15S': 'short', 'PT45S': 'short', 'PT59S': 'short', 'PT1M30S': 'short',
+                    'PT4M12S': 'medium', 'PT9M3S': 'medium', 'PT23M': 'long', 'PT1H2M5S': 'long'}
+
+
+def _token(*parts, length=11):
+    """parts から決まる、YouTube の ID に似た文字列"""
+    digest = hashlib.sha1('/'.join(str(part) for part in parts).encode('utf-8')).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii')[:length]
+
+
+def _video_id(*parts):
+    return _token('video', *parts)
+
+
+def _channel_for_video(video_id):
+    return 'UC' + _token('channel', int(hashlib.sha1(video_id.encode()).hexdigest(), 16) % 50, length=22)
+
+
+def make_video(video_id, channel_id=None):
+    """動画IDから決まる合成の videos().list の item（channel_id を省略した場合はチャンネルも動画IDから決める）"""
+    rng = random.Random(video_id)
+    channel_id = channel_id or _channel_for_video(video_id)
+    views = int(rng.lognormvariate(9, 2))
+    published = BASE_DATE - timedelta(days=rng.randint(0, 1500), seconds=rng.randint(0, 86399))
+    return {
+        'kind': 'youtube#video',
+        'etag': _token('etag', video_id, length=27),
+        'id': video_id,
+        'snippet': {
+            'publishedAt': published.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'channelId': channel_id,
+            'title': f"合成動画 {video_id} の タイトル #{rng.randint(1, 999)}",
+            'description': ' '.join(f"説明{rng.randint(1, 9999)}" for _ in range(rng.randint(5, 60))),
+            'thumbnails': {'high': {'url': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg", 'width': 480, 'height': 360}},
+            'channelTitle': f"チャンネル {channel_id[2:8]}",
+        },
+        'contentDetails': {'duration': rng.choice(DURATIONS), 'dimension': '2d', 'definition': 'hd'},
+        'statistics': {
+            'viewCount': str(views),
+            'likeCount': str(int(views * rng.uniform(0.005, 0.08))),
+            'commentCount': str(int(views * rng.uniform(0.0005, 0.01))),
+        },
+    }
+
+
+@functools.lru_cache(maxsize=100_000)
+def _duration_class(video_id):
+    return DURATION_CLASSES[make_video(video_id)['contentDetails']['duration']]
+
+
+def _page(params, total, default_size=5, max_size=50):
+    """pageToken（オフセット）と maxResults から、このページの範囲と次のページトークンを返す"""
+    size = min(int(params.get('maxResults', default_size)), max_size)
+    start = int(params.get('pageToken') or 0)
+    end = min(start + size, total)
+    next_token = str(end) if end < total else None
+    return range(start, end), next_token
+
+
+class FakeGoogleAPIs:
+    """
+    リクエストを処理して (ステータス, 本文の dict) を返す。HTTP サーバーとは切り離してある。
+    latency 秒（±jitter 秒）の遅延を入れ、error_rate の割合で 503 を返す。
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = collections.Counter()
+        # If-None-Match が一致して 304 を返した回数（calls にも含まれる）
+        self.not_modified = 0
+        self.spreadsheets = {}
+        # プレイリストで返した動画ID → アップロードしたチャンネルのID
+        self._owners = {}
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.not_modified = 0
+            self.spreadsheets.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'total': sum(self.calls.values()), 'not_modified': self.not_modified}
+
+    def handle(self, method, path, params, body):
+        route = self._route(method, path)
+        if route is None:
+            return 404, {'error': {'code': 404, 'message': f"Not found: {method} {path}", 'errors': [{'reason': 'notFound'}]}}
+        name, handler, args = route
+        with self._lock:
+            self.calls[name] += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return 503, {'error': {'code': 503, 'message': 'The service is currently unavailable.', 'errors': [{'reason': 'backendError'}]}}
+        response = handler(params, body, *args)
+        if path.startswith('/youtube/v3/'):
+            response['etag'] = _token('etag', json.dumps(response, sort_keys=True), length=27)
+        return 200, response
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def _route(self, method, path):
+        if method == 'GET' and path.startswith('/youtube/v3/'):
+            resource = path[len('/youtube/v3/'):]
+            handler = {
+                'search': self.search_list,
+                'videos': self.videos_list,
+                'channels': self.channels_list,
+                'playlistItems': self.playlist_items_list,
+            }.get(resource)
+            return (f"{resource}.list", handler, ()) if handler else None
+        if method == 'POST' and path == '/v4/spreadsheets':
+            return 'spreadsheets.create', self.spreadsheets_create, ()
+        match = re.fullmatch(r'/v4/spreadsheets/([^/:]+)(.*)', path)
+        if not match:
+            return None
+        spreadsheet_id, rest = match.groups()
+        if method == 'POST' and rest == '/values:batchUpdate':
+            return 'spreadsheets.values.batchUpdate', self.values_batch_update, (spreadsheet_id,)
+        if method == 'PUT' and rest.startswith('/values/'):
+            return 'spreadsheets.values.update', self.values_update, (spreadsheet_id,)
+        if method == 'POST' and rest == ':batchUpdate':
+            return 'spreadsheets.batchUpdate', self.batch_update, (spreadsheet_id,)
+        if method == 'GET' and rest == '':
+            return 'spreadsheets.get', self.spreadsheets_get, (spreadsheet_id,)
+        return None
+
+    # ---- YouTube Data API ----
+
+    def search_list(self, params, body):
+        query = params.get('q', '')
+        video_ids = [_video_id('search', query, i) for i in range(SEARCH_RESULTS_PER_QUERY)]
+        duration = params.get('videoDuration', 'any')
+        if duration != 'any':
+            video_ids = [video_id for video_id in video_ids if _duration_class(video_id) == duration]
+        indexes, next_token = _page(params, len(video_ids))
+        items = [{'kind': 'youtube#searchResult', 'id': {'kind': 'youtube#video', 'videoId': video_ids[i]}}
+                 for i in indexes]
+        response = {'kind': 'youtube#searchListResponse', 'items': items,
+                    'pageInfo': {'totalResults': len(video_ids), 'resultsPerPage': len(items)}}
+        if next_token:
+            response['nextPageToken'] = next_token
+        return response
+
+    def videos_list(self, params, body):
+        video_ids = [video_id for video_id in params.get('id', '').split(',') if video_id]
+        parts = {'kind', 'etag', 'id', *params.get('part', 'snippet').split(',')}
+        with self._lock:
+            owners = {video_id: self._owners.get(video_id) for video_id in video_ids}
+        items = [{key: value for key, value in make_video(video_id, owners[video_id]).items() if key in parts}
+                 for video_id in video_ids]
+        return {'kind': 'youtube#videoListResponse', 'items': items}
+
+    def channels_list(self, params, body):
+        if params.get('forHandle'):
+            channel_ids = ['UC' + _token('handle', params['forHandle'].lstrip('@').lower(), length=22)]
+        else:
+            channel_ids = [channel_id for channel_id in params.get('id', '').split(',') if channel_id]
+        items = []
+        for channel_id in channel_ids:
+            rng = random.Random(channel_id)
+            items.append({
+                'kind': 'youtube#channel',
+                'id': channel_id,
+                'snippet': {'title': f"チャンネル {channel_id[2:8]}", 'publishedAt': '2015-01-01T00:00:00Z'},
+                'contentDetails': {'relatedPlaylists': {'uploads': 'UU' + channel_id[2:]}},
+                'statistics': {'viewCount': str(int(rng.lognormvariate(14, 2))),
+                               'subscriberCount': str(int(rng.lognormvariate(10, 2))),
+                               'videoCount': str(UPLOADS_PER_CHANNEL)},
+            })
+        return {'kind': 'youtube#channelListResponse', 'items': items}
+
+    def playlist_items_list(self, params, body):
+        playlist_id = params.get('playlistId', '')
+        indexes, next_token = _page(params, UPLOADS_PER_CHANNEL)
+        items = []
+        video_ids = [_video_id('upload', playlist_id, i) for i in indexes]
+        # アップロードした動画は、videos().list でもこのチャンネルの動画として返す
+        with self._lock:
+            self._owners.update((video_id, 'UC' + playlist_id[2:]) for video_id in video_ids)
+        for i, video_id in zip(indexes, video_ids):
+            # 新しい順に並ぶように、先頭ほど公開日時を新しくする
+            published = BASE_DATE - timedelta(days=i)
+            items.append({
+                'kind': 'youtube#playlistItem',
+                'snippet': {'title': f"アップロード {i}", 'playlistId': playlist_id},
+                'contentDetails': {'videoId': video_id,
+                                   'videoPublishedAt': published.strftime('%Y-%m-%dT%H:%M:%SZ')},
+            })
+        response = {'kind': 'youtube#playlistItemListResponse', 'items': items,
+                    'pageInfo': {'totalResults': UPLOADS_PER_CHANNEL, 'resultsPerPage': len(items)}}
+        if next_token:
+            response['nextPageToken'] = next_token
+        return response
+
+    # ---- Google Sheets API ----
+
+    def spreadsheets_create(self, params, body):
+        spreadsheet_id = _token('spreadsheet', time.time_ns(), self._random.random(), length=44)
+        sheets = []
+        for index, sheet in enumerate(body.get('sheets') or [{'properties': {'title': 'Sheet1'}}]):
+            properties = dict(sheet.get('properties', {}))
+            properties.setdefault('sheetId', index)
+            properties.setdefault('title', f"Sheet{index + 1}")
+            sheets.append({'properties': properties})
+        spreadsheet = {'spreadsheetId': spreadsheet_id, 'properties': body.get('properties', {}), 'sheets': sheets}
+        with self._lock:
+            self.spreadsheets[spreadsheet_id] = spreadsheet
+        return spreadsheet
+
+    def spreadsheets_get(self, params, body, spreadsheet_id):
+        return self.spreadsheets.get(spreadsheet_id, {'spreadsheetId': spreadsheet_id, 'sheets': []})
+
+    def values_batch_update(self, params, body, spreadsheet_id):
+        cells = sum(len(row) for value_range in body.get('data', []) for row in value_range.get('values', []))
+        return {'spreadsheetId': spreadsheet_id, 'totalUpdatedCells': cells,
+                'totalUpdatedSheets': len(body.get('data', []))}
+
+    def values_update(self, params, body, spreadsheet_id):
+        cells = sum(len(row) for row in body.get('values', []))
+        return {'spreadsheetId': spreadsheet_id, 'updatedCells': cells}
+
+    def batch_update(self, params, body, spreadsheet_id):
+        replies = []
+        for request in body.get('requests', []):
+            if 'addSheet' in request:
+                properties = dict(request['addSheet'].get('properties', {}))
+                properties.setdefault('sheetId', self._random.randint(1, 2 ** 31))
+                replies.append({'addSheet': {'properties': properties}})
+            else:
+                replies.append({})
+        return {'spreadsheetId': spreadsheet_id, 'replies': replies}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    apis = None
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        path = unquote(url.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+
+        if path == '/_stats':
+            status, payload = 200, self.apis.stats()
+        elif path == '/_reset':
+            self.apis.reset()
+            status, payload = 200, {}
+        else:
+            body = json.loads(raw) if raw else {}
+            status, payload = self.apis.handle(method, path, params, body)
+            etag = payload.get('etag') if status == 200 else None
+            if etag and self.headers.get('If-None-Match') == etag:
+                self.apis.count_not_modified()
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """
+    バックグラウンドのスレッドでサーバーを起動し、(server, FakeGoogleAPIs) を返す。
+    接続先の host:port は f"{server.server_address[0]}:{server.server_port}"。
+    """
+    apis = FakeGoogleAPIs(**options)
+    handler = type('Handler', (_Handler,), {'apis': apis})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-google-apis', daemon=True).start()
+    return server, apis
+
+
+def main():
+    parser = argparse.ArgumentParser(description='YouTube / Sheets API の代わりになるローカルサーバー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='1リクエストあたりの遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.02, help='遅延のばらつき（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='503 を返す割合 (0〜1)')
+    args = parser.parse_args()
+
+    server, _ = start_server(args.host, args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    print(f"YOUTUBE_EMULATOR_HOST={args.host}:{server.server_port}")
+    print(f"SHEETS_EMULATOR_HOST={args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
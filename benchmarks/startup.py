@@ -0,0 +1,101 @@
+# startup.py
+#
+# app_modules.app の起動時間を計測するベンチマーク。
+# 使い方: python benchmarks/startup.py [--runs 5]
+#
+# 1. 新しいプロセスで app_modules.app をインポートする時間と、その時点で読み込まれている重いモジュール
+# 2. 比較用に、以前のように起動時に全クライアントのモジュールをインポートした場合の時間
+# 3. discovery クライアントの作成時間（build() と、解析済みドキュメントを使い回す build_service()）
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# 起動時に読み込まれていないことを確認するモジュール
+HEAVY_MODULES = [
+    'pandas',
+    'googleapiclient.discovery',
+    'google_auth_oauthlib.flow',
+    'google.generativeai',
+    'google.cloud.videointelligence_v1',
+]
+
+IMPORT_APP = """
+import sys, time
+start = time.perf_counter()
+import app_modules.app
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(','.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+# 以前の app.py がモジュールの読み込み時に行っていたインポート（認証やクライアントの作成は含まない）
+IMPORT_EAGER = """
+import sys, time
+start = time.perf_counter()
+import flask
+import app_modules.youtube_api, app_modules.google_sheets_api, app_modules.ai_api
+import app_modules.search_pipeline, app_modules.jobs, app_modules.video_operations
+import google.generativeai
+from google.cloud import videointelligence_v1
+elapsed = time.perf_counter() - start
+print(elapsed)
+print('')
+"""
+
+
+def _run_import(code, runs):
+    timings = []
+    loaded = ''
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout.splitlines()
+        timings.append(float(output[0]))
+        loaded = output[1] if len(output) > 1 else ''
+    return timings, loaded
+
+
+def _time(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _report(label, timings):
+    print(f"{label:<48} 中央値 {statistics.median(timings) * 1000:8.1f} ms  (最小 {min(timings) * 1000:.1f} ms, {len(timings)}回)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='app_modules.app の起動時間を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='各項目の計測回数')
+    args = parser.parse_args()
+
+    timings, loaded = _run_import(IMPORT_APP.format(heavy=HEAVY_MODULES), args.runs)
+    _report('import app_modules.app', timings)
+    print(f"  起動時に読み込まれた重いモジュール: {loaded or 'なし'}")
+
+    try:
+        timings, _ = _run_import(IMPORT_EAGER, args.runs)
+        _report('全クライアントのモジュールを起動時にインポート', timings)
+    except subprocess.CalledProcessError as e:
+        print(f"全クライアントのモジュールをインポートできませんでした: {e.stderr.strip().splitlines()[-1]}")
+
+    from googleapiclient.discovery import build
+    from app_modules.discovery import build_service
+
+    _report("build('youtube', 'v3')", _time(lambda: build('youtube', 'v3', developerKey='benchmark'), args.runs))
+    _report("build_service('youtube', 'v3')", _time(lambda: build_service('youtube', 'v3', developerKey='benchmark'), args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# video_memory.py
+#
+# 検索結果の動画データのメモリ使用量を計測するベンチマーク。
+# fake_server.py と同じ合成の videos().list の item を作り、次の3つの保持方法を比べる。
+#   items   : API レスポンスの item (dict) をそのまま保持する（説明文やサムネイルの全サイズを含む）
+#   records : VideoRecord (__slots__) に変換して保持する（説明文は持たない）
+#   batch   : VideoRecord を VideoBatch の列ごとの配列にまとめ、DataFrame に変換する
+#
+# 使い方: python benchmarks/video_memory.py [--videos 10000] [--json result.json]
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def traced(func):
+    """func() を実行し、(戻り値, 実行後も保持されている割り当て (MB), 実行中の割り当ての最大値 (MB), 秒) を返す"""
+    gc.collect()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    return result, (current - before) / 2 ** 20, (peak - before) / 2 ** 20, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='検索結果の動画データのメモリ使用量のベンチマーク')
+    parser.add_argument('--videos', type=int, default=10000, help='動画の件数')
+    parser.add_argument('--json', help='結果を JSON で書き出すファイル')
+    args = parser.parse_args()
+
+    import numpy as np
+    from fake_server import make_video
+    from app_modules.video_records import VideoBatch, records_from_items
+
+    video_ids = [f"v{i:010d}" for i in range(args.videos)]
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    items, items_mb, _, _ = traced(lambda: [make_video(video_id) for video_id in video_ids])
+    records, _, _, records_seconds = traced(lambda: records_from_items(items))
+    # records は items の文字列の一部を共有するため、items を解放した後に残っている量で比べる
+    del items
+    gc.collect()
+    records_mb = (tracemalloc.get_traced_memory()[0] - baseline) / 2 ** 20
+
+    batch, batch_mb, batch_peak_mb, batch_seconds = traced(lambda: VideoBatch(records))
+    frame, frame_mb, frame_peak_mb, frame_seconds = traced(batch.search_frame)
+    tracemalloc.stop()
+
+    shared = {
+        'タイトル': bool(np.shares_memory(frame['タイトル'].to_numpy(), batch.titles)),
+        '再生回数': bool(np.shares_memory(frame['再生回数'].array._data, batch.view_counts._data)),
+        'サムネイルURL': bool(np.shares_memory(frame['サムネイルURL'].to_numpy(), batch.thumbnail_urls)),
+    }
+    report = {
+        'videos': args.videos,
+        'items_mb': items_mb,
+        'records_mb': records_mb,
+        'records_seconds': records_seconds,
+        'batch_mb': batch_mb,
+        'batch_seconds': batch_seconds,
+        'batch_peak_mb': batch_peak_mb,
+        'frame_mb': frame_mb,
+        'frame_seconds': frame_seconds,
+        'frame_peak_mb': frame_peak_mb,
+        'frame_deep_mb': frame.memory_usage(deep=True).sum() / 2 ** 20,
+        'zero_copy_columns': shared,
+    }
+
+    print(f"動画 {args.videos} 件")
+    print(f"API レスポンスの item をそのまま保持: {items_mb:.1f} MB")
+    print(f"VideoRecord に変換して保持: {records_mb:.1f} MB（変換 {records_seconds * 1000:.0f} ms）")
+    print(f"VideoBatch（列ごとの配列）: +{batch_mb:.1f} MB（{batch_seconds * 1000:.0f} ms）")
+    print(f"DataFrame への変換: +{frame_mb:.1f} MB（{frame_seconds * 1000:.0f} ms, 最大 +{frame_peak_mb:.1f} MB）, "
+          f"DataFrame の大きさ (deep): {report['frame_deep_mb']:.1f} MB")
+    print("配列を共有している列:", ', '.join(f"{name} {'○' if value else '×'}" for name, value in shared.items()))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,33 @@ const app = Vue.createApp({
     data() {
         return {
             useSheetsIntegration: false, // チェックボックスの初期状態
+            asyncMode: false, // バックグラウンド実行の有無
+            job: null, // 実行中のジョブの状態
         };
     },
+    methods: {
+        // バックグラウンド実行の場合はフォームを非同期で送信し、進捗を購読する
+        async onSearchSubmit(event) {
+            if (!this.asyncMode) {
+                return;
+            }
+            event.preventDefault();
+            const response = await fetch(event.target.action, {
+                method: 'POST',
+                body: new FormData(event.target),
+            });
+            const data = await response.json();
+            this.job = { status: 'queued', stages: {}, keywords: {} };
+
+            const source = new EventSource(data.events_url);
+            source.onmessage = async () => {
+                this.job = await (await fetch(data.status_url)).json();
+                if (this.job.status === 'done' || this.job.status === 'error') {
+                    source.close();
+                }
+            };
+        }
+    },
     computed: {
         submitButtonText() {
             return this.useSheetsIntegration ? '動画を検索しスプレッドシートに出力' : '動画を検索しCSVをダウンロード';